@@ -1,16 +1,23 @@
 import os
 from flask import Flask
-from datetime import datetime
-from werkzeug.security import generate_password_hash
-from routes import routes
+from routes import main
+from api import api
+from commands import commands
 # from app import db
-from models import db, User, ParkingLot, ParkingSpot, Reservation
-from zoneinfo import ZoneInfo
-from flask_migrate import Migrate
+from models import db
+from database import configure_database, apply_pragmas
+from metrics import init_metrics
+from cache import init_cache
+from sessions import init_sessions
+from users import init_users
+from ratelimit import init_ratelimit
+from jobs import init_jobs
+from events import init_events
+from sweeper import start_sweeper
 
 
-migrate = Migrate()
-def create_app():
+# schema and the admin account are set up by `flask bootstrap`, not here, so starting a worker stays cheap
+def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
     app.config['SECRET_KEY'] = 'app_vehicle_parking'
     basedir = os.path.abspath(os.path.dirname(__file__))
@@ -18,30 +25,25 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'instance', 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  #16mb limits for file uploads
+    app.config['METRICS_ENABLED'] = os.environ.get('PARKING_METRICS') == '1'  #opt in, adds a little work to every request
+    app.config['SWEEPER_INTERVAL'] = int(os.environ.get('PARKING_SWEEPER_INTERVAL', 0))  #seconds, 0 leaves it to `flask sweep-expired` (cron)
+    if test_config:
+        app.config.update(test_config)  #benchmarks/tests point this at their own database
+    configure_database(app)
     db.init_app(app)
+    init_cache(app)
+    init_sessions(app)  #server side, the cookie only carries a session id
+    init_users(app)
+    init_ratelimit(app)  #in memory per process unless RATE_LIMIT_STORE is 'database'
     with app.app_context():
-        init_db()
-        create_admin()
-        routes(app)
+        apply_pragmas(db.engine)
+        app.register_blueprint(main)
+        app.register_blueprint(api)
+        commands(app)
+        init_jobs(app)  #its exit hook lets queued jobs finish before the process goes
+        init_events(app)
+        if app.config['SWEEPER_INTERVAL']:
+            start_sweeper(app, app.config['SWEEPER_INTERVAL'])
+        if app.config['METRICS_ENABLED']:
+            init_metrics(app)
     return app
-
-def init_db():
-    db.create_all()
-    print('database finally working yay!')
-
-# admin creation
-def create_admin():
-    if not User.query.filter_by(Email='admin@admin.com').first():
-        admin = User(
-            Name='admin',
-            Email='admin@admin.com',
-            Password=generate_password_hash('123'),
-            Pincode='111111',
-            Address='admin address',
-            Phone='1234567890',
-            Vehicle_Number='DL01AB1234',
-            created_at=datetime.now(tz=ZoneInfo('Asia/Kolkata'))
-        )
-        db.session.add(admin)
-        db.session.commit()
-        print('admin added too!')
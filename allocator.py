@@ -0,0 +1,70 @@
+from models import db, ParkingLot, ParkingSpot, SlotBooking
+from billing import utcnow
+from occupancy import spot_map
+
+MAX_CLAIM_RETRIES = 5
+
+
+def claim_spot(lot_id, retries=MAX_CLAIM_RETRIES, free_until=None):
+    """Mark one free spot in the lot as occupied and return its id, or None if the lot is full.
+
+    Spots with a booked slot starting before `free_until` (when the walk-in has to
+    be gone by, None for no limit) are passed over.
+
+    The first try takes spot_map's first free spot, with no SELECT; if that one
+    is gone (or held by a slot) the rest ask the database. The status flip is a
+    conditional UPDATE (... WHERE status = 'A'), so when two bookings pick the same
+    spot only one of them gets the row and the other retries with the next free
+    spot. The caller owns the transaction and commits it, then calls spot_map.set.
+    """
+    now = utcnow()
+    held = db.select(SlotBooking.id).where(
+        SlotBooking.spot_id == ParkingSpot.id, SlotBooking.status == 'booked', SlotBooking.end_time > now
+    )
+    if free_until is not None:
+        held = held.where(SlotBooking.start_time < free_until)
+    spot_id = spot_map.first_free(lot_id)
+    for _ in range(retries):
+        if spot_id is None:
+            spot_id = (
+                db.session.query(ParkingSpot.id)
+                .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A', ~held.exists())
+                .order_by(ParkingSpot.id)
+                .limit(1)
+                .scalar()
+            )
+            if spot_id is None:
+                return None
+        claimed = (
+            ParkingSpot.query
+            .filter(ParkingSpot.id == spot_id, ParkingSpot.status == 'A', ~held.exists())
+            .update({ParkingSpot.status: 'O'}, synchronize_session=False)
+        )
+        if claimed:
+            _adjust_lot_counts(lot_id, available=-1, occupied=1)
+            return spot_id
+        spot_id = None
+    return None
+
+
+def release_spot(spot_id):
+    """Mark an occupied spot as free again. Returns False if it was not occupied."""
+    spot = db.session.query(ParkingSpot.id, ParkingSpot.lot_id).filter(ParkingSpot.id == spot_id).first()
+    if spot is None:
+        return False
+    released = (
+        ParkingSpot.query
+        .filter(ParkingSpot.id == spot_id, ParkingSpot.status == 'O')
+        .update({ParkingSpot.status: 'A'}, synchronize_session=False)
+    )
+    if released:
+        _adjust_lot_counts(spot.lot_id, available=1, occupied=-1)
+    return bool(released)
+
+
+def _adjust_lot_counts(lot_id, available=0, occupied=0):
+    ParkingLot.query.filter(ParkingLot.id == lot_id).update({
+        ParkingLot.Available_Count: ParkingLot.Available_Count + available,
+        ParkingLot.Occupied_Count: ParkingLot.Occupied_Count + occupied,
+        ParkingLot.Version: ParkingLot.Version + 1
+    }, synchronize_session=False)
@@ -0,0 +1,395 @@
+import json
+from datetime import date, datetime, timedelta
+from functools import wraps
+from flask import Blueprint, Response, request, session
+from werkzeug.security import check_password_hash
+from models import db, User, ParkingLot, ParkingSpot, Reservation, SlotBooking
+from booking import book, release
+from nearby import lot_index
+from occupancy import spot_map
+from schedule import book_slot, cancel_slot, check_window, search_slots, MAX_HOURS
+from stats import daily_rows
+from ratelimit import rate_limited, too_many_requests, session_user
+from billing import to_utc, utcnow
+
+try:
+    import orjson
+except ImportError:  # plain json below gives the same output, just slower
+    orjson = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+# every query here selects columns, never ORM objects, and rows go straight to json
+LOT_COLUMNS = (
+    ParkingLot.id, ParkingLot.Location.label('location'), ParkingLot.Address.label('address'),
+    ParkingLot.Pincode.label('pincode'), ParkingLot.Price.label('price'),
+    ParkingLot.Max_Spots.label('max_spots'), ParkingLot.Max_Time.label('max_time'),
+    ParkingLot.Available_Count.label('available'), ParkingLot.Occupied_Count.label('occupied'),
+)
+AVAILABILITY_COLUMNS = (
+    ParkingLot.id, ParkingLot.Available_Count.label('available'),
+    ParkingLot.Occupied_Count.label('occupied'), ParkingLot.Max_Spots.label('max_spots'),
+)
+SLOT_COLUMNS = (
+    SlotBooking.id, SlotBooking.lot_id, ParkingLot.Location.label('location'), SlotBooking.spot_id,
+    SlotBooking.status, SlotBooking.start_time, SlotBooking.end_time, SlotBooking.total_cost,
+)
+RESERVATION_COLUMNS = (
+    Reservation.id, ParkingSpot.lot_id, ParkingLot.Location.label('location'), Reservation.spot_id,
+    Reservation.status, Reservation.in_time, Reservation.out_time, Reservation.total_cost,
+)
+
+
+def _default(value):
+    # times are stored as naive utc
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'cannot serialize {type(value).__name__}')
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+    return json.dumps(data, separators=(',', ':'), default=_default)
+
+
+def respond(data, status=200, etag=None):
+    response = Response(dumps(data), status=status, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def respond_not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def error(message, status):
+    return respond({'error': message}, status)
+
+
+def rows(result):
+    return [row._asdict() for row in result]
+
+
+def page_limit():
+    return min(max(request.args.get('limit', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+
+
+def user_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('user_id'):
+            return error('login required', 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('admin_logged_in'):
+            return error('admin login required', 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def throttled(wait):
+    _, status, headers = too_many_requests(wait)
+    response = error('too many attempts', status)
+    response.headers.update(headers)
+    return response
+
+
+def login_email():
+    return (request.get_json(silent=True) or request.form).get('email')
+
+
+def not_modified(etag):
+    return request.if_none_match.contains(etag)
+
+
+# Session
+@api.route('/login', methods=['POST'])
+@rate_limited('login', account=login_email, respond=throttled)
+def login():
+    data = request.get_json(silent=True) or request.form
+    user = User.query.filter_by(Email=data.get('email', '')).first()
+    if not user or not check_password_hash(user.Password, data.get('password', '')):
+        return error('invalid credentials', 401)
+    session['user_id'] = user.id
+    if user.Email == 'admin@admin.com':
+        session['admin_logged_in'] = True
+    return respond({'id': user.id, 'name': user.Name, 'email': user.Email})
+
+
+@api.route('/logout', methods=['POST'])
+def logout():
+    for key in ('user_id', 'admin_logged_in'):
+        session.pop(key, None)
+    return respond({'ok': True})
+
+
+# Lots
+@api.route('/lots')
+def lots():
+    """All lots by id (?cursor=<last id>), or the nearest ones with free spots (?near=<pincode>)."""
+    limit = page_limit()
+    if request.args.get('near'):
+        lot_ids = lot_index.nearby(request.args['near'], limit=limit)
+        found = {row['id']: row for row in rows(db.session.execute(
+            db.select(*LOT_COLUMNS).where(ParkingLot.id.in_(lot_ids))
+        ))} if lot_ids else {}
+        return respond({'lots': [found[lot_id] for lot_id in lot_ids if lot_id in found], 'next_cursor': None})
+
+    query = db.select(*LOT_COLUMNS).order_by(ParkingLot.id).limit(limit + 1)
+    if request.args.get('cursor'):
+        cursor = request.args.get('cursor', type=int)
+        if cursor is None:
+            return error('bad cursor', 400)
+        query = query.where(ParkingLot.id > cursor)
+    page = rows(db.session.execute(query))
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = str(page[-1]['id'])
+    return respond({'lots': page, 'next_cursor': next_cursor})
+
+
+@api.route('/lots/<int:lot_id>')
+def lot(lot_id):
+    row = db.session.execute(db.select(*LOT_COLUMNS).where(ParkingLot.id == lot_id)).first()
+    if row is None:
+        return error('lot not found', 404)
+    return respond(row._asdict())
+
+
+# Availability
+@api.route('/availability')
+def availability():
+    # every change to a lot or its spots bumps its Version, so the sum moves whenever anything does;
+    # sum() rather than total(), which is a float and stops seeing +1s once versions (ms timestamps) add past 2^53
+    count, versions = db.session.execute(
+        db.select(db.func.count(ParkingLot.id), db.func.coalesce(db.func.sum(ParkingLot.Version), 0))
+    ).one()
+    etag = f'lots-{count}-{versions}'
+    if not_modified(etag):
+        return respond_not_modified(etag)
+    return respond({'lots': rows(db.session.execute(db.select(*AVAILABILITY_COLUMNS).order_by(ParkingLot.id)))},
+                   etag=etag)
+
+
+@api.route('/lots/<int:lot_id>/availability')
+def lot_availability(lot_id):
+    version = db.session.execute(db.select(ParkingLot.Version).where(ParkingLot.id == lot_id)).scalar()
+    if version is None:
+        return error('lot not found', 404)
+    etag = f'lot-{lot_id}-{version}'
+    if not_modified(etag):
+        return respond_not_modified(etag)
+    row = db.session.execute(db.select(*AVAILABILITY_COLUMNS).where(ParkingLot.id == lot_id)).one()
+    return respond(row._asdict(), etag=etag)
+
+
+@api.route('/lots/<int:lot_id>/spots')
+def lot_spots(lot_id):
+    """Every spot's status as one string, 'A'/'O' per spot in id order; `spot_ids` gives the ids as
+    [first, count] runs. Served from spot_map, so it can trail other workers' changes by a few seconds."""
+    bitmap = spot_map.lot(lot_id)
+    if bitmap is None:
+        return error('lot not found', 404)
+    etag = f'spots-{lot_id}-{bitmap.version}'
+    if not_modified(etag):
+        return respond_not_modified(etag)
+    return respond({'id': lot_id, 'available': bitmap.free, 'occupied': bitmap.occupied,
+                    'spot_ids': bitmap.runs(), 'spots': bitmap.statuses()}, etag=etag)
+
+
+# Booking
+@api.route('/lots/<int:lot_id>/book', methods=['POST'])
+@user_required
+@rate_limited('book', account=session_user, respond=throttled)
+def book_lot(lot_id):
+    available = db.session.execute(db.select(ParkingLot.Available_Count).where(ParkingLot.id == lot_id)).scalar()
+    if available is None:
+        return error('lot not found', 404)
+    if available <= 0:
+        return error('lot is full', 409)
+    try:
+        reservation = book(session['user_id'], lot_id)
+    except Exception as e:
+        db.session.rollback()
+        print(f'Error booking spot: {e}')
+        return error('booking failed', 500)
+    if reservation is None:
+        return error('lot is full', 409)
+    return respond(reservation_row(reservation.id), 201)
+
+
+@api.route('/reservations/<int:reservation_id>/release', methods=['POST'])
+@user_required
+def release_reservation(reservation_id):
+    reservation = db.session.get(Reservation, reservation_id)
+    if reservation is None or reservation.user_id != session['user_id']:
+        return error('reservation not found', 404)
+    if reservation.status != 'active':
+        return error(f'reservation is {reservation.status}', 409)
+    try:
+        released = release(reservation)
+    except Exception as e:
+        db.session.rollback()
+        print(f'Error releasing spot: {e}')
+        return error('release failed', 500)
+    if released is None:
+        return error(f'reservation is {reservation.status}', 409)
+    return respond(reservation_row(reservation_id))
+
+
+# Slots
+def slot_window(source):
+    """(start, end) as naive utc from ISO times in `source`; ones without an offset are taken as utc."""
+    try:
+        start, end = (to_utc(datetime.fromisoformat(source[key])) for key in ('start', 'end'))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return start, end
+
+
+@api.route('/slots')
+def slots():
+    """Lots under ?pincode= (a prefix) with a spot free for ?start=&end=, in pincode order."""
+    window = slot_window(request.args)
+    if window is None:
+        return error('start and end must be ISO times', 400)
+    problem = check_window(*window)
+    if problem:
+        return error(problem, 400)
+    return respond({'lots': search_slots(request.args.get('pincode', '').strip(), *window, limit=page_limit())})
+
+
+@api.route('/lots/<int:lot_id>/slots', methods=['POST'])
+@user_required
+@rate_limited('book', account=session_user, respond=throttled)
+def book_lot_slot(lot_id):
+    lot = db.session.get(ParkingLot, lot_id)
+    if lot is None:
+        return error('lot not found', 404)
+    window = slot_window(request.get_json(silent=True) or request.form)
+    if window is None:
+        return error('start and end must be ISO times', 400)
+    problem = check_window(*window, lot=lot)
+    if problem:
+        return error(problem, 400)
+    try:
+        booking = book_slot(session['user_id'], lot, *window)
+    except Exception as e:
+        db.session.rollback()
+        print(f'Error booking slot: {e}')
+        return error('booking failed', 500)
+    if booking is None:
+        return error('no spot free for that time', 409)
+    return respond(slot_row(booking.id), 201)
+
+
+def slot_row(booking_id):
+    return db.session.execute(
+        db.select(*SLOT_COLUMNS).join(ParkingLot, SlotBooking.lot_id == ParkingLot.id).where(SlotBooking.id == booking_id)
+    ).one()._asdict()
+
+
+@api.route('/slots/bookings')
+@user_required
+def slot_bookings():
+    """The user's booked slots that haven't ended yet, soonest first."""
+    now = utcnow()
+    return respond({'bookings': rows(db.session.execute(
+        db.select(*SLOT_COLUMNS)
+        .join(ParkingLot, SlotBooking.lot_id == ParkingLot.id)
+        # no slot is longer than MAX_HOURS, so the start bound is implied and lets (user_id, start_time) be used
+        .where(SlotBooking.user_id == session['user_id'], SlotBooking.start_time > now - timedelta(hours=MAX_HOURS),
+               SlotBooking.status == 'booked', SlotBooking.end_time > now)
+        .order_by(SlotBooking.start_time)
+        .limit(MAX_PER_PAGE)
+    ))})
+
+
+@api.route('/slots/bookings/<int:booking_id>/cancel', methods=['POST'])
+@user_required
+def cancel_slot_booking(booking_id):
+    booking = db.session.get(SlotBooking, booking_id)
+    if booking is None or booking.user_id != session['user_id']:
+        return error('booking not found', 404)
+    if booking.status != 'booked':
+        return error(f'booking is {booking.status}', 409)
+    if booking.end_time <= utcnow():
+        return error('booking is over', 409)
+    cancel_slot(booking)
+    return respond(slot_row(booking_id))
+
+
+# Reservations
+def reservation_query():
+    return (
+        db.select(*RESERVATION_COLUMNS)
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+    )
+
+
+def reservation_row(reservation_id):
+    return db.session.execute(reservation_query().where(Reservation.id == reservation_id)).one()._asdict()
+
+
+@api.route('/reservations')
+@user_required
+def reservations():
+    """The user's reservations, newest first. ?cursor= is the next_cursor of the previous page."""
+    limit = page_limit()
+    query = (
+        reservation_query()
+        .where(Reservation.user_id == session['user_id'])
+        .order_by(Reservation.in_time.desc(), Reservation.id.desc())
+        .limit(limit + 1)
+    )
+    if request.args.get('cursor'):
+        try:
+            in_time, _, res_id = request.args['cursor'].rpartition('_')
+            in_time, res_id = datetime.fromisoformat(in_time), int(res_id)
+        except ValueError:
+            return error('bad cursor', 400)
+        query = query.where(
+            (Reservation.in_time < in_time) |
+            ((Reservation.in_time == in_time) & (Reservation.id < res_id))
+        )
+    page = rows(db.session.execute(query))
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = f'{page[-1]["in_time"].isoformat()}_{page[-1]["id"]}'
+    return respond({'reservations': page, 'next_cursor': next_cursor})
+
+
+# Admin
+@api.route('/admin/stats')
+@admin_required
+def admin_stats():
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        return error('dates must be YYYY-MM-DD', 400)
+    days = rows(daily_rows(start, end, request.args.get('lot_id', type=int)))
+    totals = {
+        key: round(sum(day[key] for day in days), 2)
+        for key in ('reservations', 'completed', 'cancelled', 'revenue', 'parked_hours')
+    }
+    return respond({'days': days, 'totals': totals})
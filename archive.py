@@ -0,0 +1,94 @@
+import time
+from datetime import timedelta
+from sqlalchemy.dialects.sqlite import insert
+from models import db, Reservation, ReservationArchive, ParkingSpot, UserArchiveTotals
+from billing import utcnow, duration_hours
+
+ARCHIVED_STATUSES = ('completed', 'cancelled')
+
+
+def archive_reservations(older_than_days=180, batch_size=1000, max_seconds=30):
+    """Move finished reservations that started more than `older_than_days` ago to reservation_archive.
+
+    Works in batches of `batch_size`, each its own transaction, so other writers
+    get a turn in between; stops after `max_seconds` and the next run picks up
+    where this one left off. Returns how many reservations moved.
+    """
+    cutoff = utcnow() - timedelta(days=older_than_days)
+    # sqlite hands out max(id) + 1, so the newest row always stays or archived ids could be reused
+    newest = db.session.query(db.func.max(Reservation.id)).scalar()
+    if newest is None:
+        return 0
+    deadline = time.monotonic() + max_seconds
+    moved = 0
+    while time.monotonic() < deadline:
+        rows = db.session.execute(
+            db.select(
+                Reservation.id, Reservation.spot_id, ParkingSpot.lot_id, Reservation.user_id,
+                Reservation.in_time, Reservation.out_time, Reservation.created_at,
+                Reservation.updated_at, Reservation.total_cost, Reservation.status
+            )
+            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+            .where(Reservation.status.in_(ARCHIVED_STATUSES), Reservation.in_time < cutoff, Reservation.id < newest)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        archived_at = utcnow()
+        db.session.execute(ReservationArchive.__table__.insert(),
+                           [dict(row._mapping, archived_at=archived_at) for row in rows])
+        _add_user_totals(rows)
+        db.session.execute(Reservation.__table__.delete().where(Reservation.id.in_([row.id for row in rows])))
+        db.session.commit()
+        moved += len(rows)
+    return moved
+
+
+def _add_user_totals(rows):
+    # same sums as the user summary makes over the live table
+    totals = {}
+    for row in rows:
+        reservations, completed, spent, hours = totals.get(row.user_id, (0, 0, 0, 0))
+        if row.status == 'completed':
+            completed += 1
+            spent += row.total_cost or 0
+            hours += duration_hours(row.in_time, row.out_time) if row.out_time else 0
+        totals[row.user_id] = (reservations + 1, completed, spent, hours)
+    table = UserArchiveTotals.__table__
+    for user_id, (reservations, completed, spent, hours) in totals.items():
+        stmt = insert(table).values(user_id=user_id, reservations=reservations, completed=completed,
+                                    spent=spent, parked_hours=hours)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={name: table.c[name] + stmt.excluded[name]
+                  for name in ('reservations', 'completed', 'spent', 'parked_hours')}
+        ))
+
+
+def newest_archived():
+    """in_time of the most recent archived reservation (one index lookup), None while the archive is empty."""
+    return db.session.query(db.func.max(ReservationArchive.in_time)).scalar()
+
+
+def user_totals(user_id):
+    """(reservations, spent, parked hours) the archive holds for the user."""
+    row = db.session.get(UserArchiveTotals, user_id)
+    if row is None:
+        return 0, 0, 0
+    return row.reservations, row.spent, row.parked_hours
+
+
+def has_archived(user_id):
+    return db.session.query(db.select(ReservationArchive.id).where(ReservationArchive.user_id == user_id).exists()).scalar()
+
+
+def compact(analyze=False, vacuum=False):
+    """After a big archive run: refresh the planner statistics and/or give the freed pages back to the filesystem."""
+    db.session.commit()
+    with db.engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        if analyze:
+            conn.exec_driver_sql('PRAGMA analysis_limit=1000')  # sampled, so it stays quick on big tables
+            conn.exec_driver_sql('ANALYZE')
+        if vacuum:
+            conn.exec_driver_sql('VACUUM')  # rewrites the whole file, needs as much free disk again
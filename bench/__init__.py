@@ -0,0 +1,9 @@
+"""Load-test harness for the booking flow and admin pages.
+
+    python -m bench --lots 50 --spots 200 --users 500 --reservations 20000
+
+seeds a throwaway sqlite database, drives the app with concurrent test
+clients and prints latency percentiles, throughput and queries per request
+as json. The dataset is generated from a fixed seed so runs on different
+commits are comparable.
+"""
@@ -0,0 +1,84 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from __init__ import create_app
+from models import db
+from bench.seed import seed
+from bench.load import run, SCENARIOS
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Seed a synthetic dataset and load-test the app.')
+    parser.add_argument('--lots', type=int, default=50)
+    parser.add_argument('--spots', type=int, default=200, help='spots per lot')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--reservations', type=int, default=20000, help='historical reservations')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--iterations', type=int, default=50, help='rounds per worker')
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='also write the json report here')
+    parser.add_argument('--keep-db', action='store_true', help='leave the seeded database behind for inspection')
+    args = parser.parse_args(argv)
+
+    # the app prints as it goes (logins, bookings, jobs); keep stdout for the report so it can be piped
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_bench(args)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+def run_bench(args):
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    # the scenarios log the same users in over and over, which the rate limits are there to stop
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+                      'RATE_LIMIT_ENABLED': False})
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        seed(args.lots, args.spots, args.users, args.reservations, seed=args.seed)
+    seed_seconds = time.perf_counter() - started
+
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'dataset': {'lots': args.lots, 'spots_per_lot': args.spots, 'users': args.users,
+                    'reservations': args.reservations, 'seed': args.seed},
+        'workers': args.workers,
+        'iterations': args.iterations,
+        'seed_seconds': round(seed_seconds, 3),
+        'scenarios': {name: run(app, name, args.workers, args.iterations, seed=args.seed) for name in scenarios},
+    }
+    if args.keep_db:
+        report['database'] = os.path.join(workdir, 'bench.sqlite3')
+    else:
+        app.extensions['jobs'].shutdown()
+        with app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Billing microbenchmark: per-reservation properties vs billing.bill_batch.
+
+    python -m bench.billing --rows 1000000
+
+Builds unsaved Reservation objects with random stays and times the old
+one-object-at-a-time path (duration_hours + tariff per row) against one
+bill_batch call over the same data, and against bill_batch on ready-made
+datetime64 columns. Prints json like python -m bench.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import billing
+from models import Reservation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.billing', description='Compare per-row and batch billing.')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    start = datetime(2025, 1, 1)
+    reservations, rates = [], []
+    for _ in range(args.rows):
+        res = Reservation(spot_id=1, user_id=1)
+        res.in_time = start + timedelta(minutes=rng.randrange(0, 525600))
+        res.out_time = res.in_time + timedelta(minutes=rng.randrange(5, 1440))
+        reservations.append(res)
+        rates.append(rng.choice((10.0, 20.0, 35.0, 50.0)))
+
+    started = time.perf_counter()
+    per_row = [billing.tariff(res.duration_hours, rate) for res, rate in zip(reservations, rates)]
+    per_row_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    in_times = [res.in_time for res in reservations]
+    out_times = [res.out_time for res in reservations]
+    _, costs = billing.bill_batch(in_times, out_times, rates)
+    batch_seconds = time.perf_counter() - started
+
+    # what a report gets when it selects the columns instead of loading objects
+    columns_seconds = None
+    np = billing.load_numpy()
+    if np is not None:
+        in_column = np.array(in_times, dtype='datetime64[us]')
+        out_column = np.array(out_times, dtype='datetime64[us]')
+        rate_column = np.array(rates)
+        started = time.perf_counter()
+        billing.bill_batch(in_column, out_column, rate_column)
+        columns_seconds = round(time.perf_counter() - started, 3)
+
+    # duration_hours rounds to 2 places, so allow a cent or so of drift per row
+    worst = max(abs(a - float(b)) for a, b in zip(per_row, costs))
+
+    print(json.dumps({
+        'rows': args.rows,
+        'numpy': np is not None,
+        'per_row_seconds': round(per_row_seconds, 3),
+        'batch_seconds': round(batch_seconds, 3),
+        'speedup': round(per_row_seconds / batch_seconds, 1) if batch_seconds else None,
+        'batch_columns_seconds': columns_seconds,
+        'max_cost_difference': round(worst, 4),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
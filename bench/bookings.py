@@ -0,0 +1,126 @@
+"""Concurrent booking stress test for the spot allocator.
+
+    python -m bench.bookings --spots 1000 --attempts 5000 --threads 32
+
+Fires `--attempts` bookings at a single `--spots` lot from `--threads`
+threads through booking.book, each thread releasing about `--release` of
+the reservations it gets so spots are fought over again. Asserts that no
+spot was ever handed to two active reservations (as seen by the threads
+and in the database afterwards) and that the lot's counters match its
+spots, and reports bookings per second and latency. Prints json like
+python -m bench and exits non-zero if anything was double assigned.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from __init__ import create_app
+from models import db, ParkingLot, ParkingSpot, Reservation
+from booking import book, release
+from bench.seed import seed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.bookings', description='Stress the spot allocator.')
+    parser.add_argument('--spots', type=int, default=1000)
+    parser.add_argument('--attempts', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--release', type=float, default=0.3, help='share of bookings released straight away')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+                      'RATE_LIMIT_ENABLED': False})
+    with app.app_context():
+        db.create_all()
+        seed(1, args.spots, args.users, 0, seed=args.seed)
+        lot_id = db.session.query(ParkingLot.id).scalar()
+
+    lock = threading.Lock()
+    held = {}  # spot_id -> reservation id, for the reservations the threads currently hold
+    counts = dict(booked=0, full=0, released=0, errors=0, double_assigned=0)
+    latencies = []
+    per_thread = [args.attempts // args.threads + (i < args.attempts % args.threads) for i in range(args.threads)]
+
+    def worker(attempts, rng):
+        with app.app_context():
+            for _ in range(attempts):
+                started = time.perf_counter()
+                try:
+                    reservation = book(rng.randint(1, args.users), lot_id)
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        counts['errors'] += 1
+                    print(f'Error booking: {e}')
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if reservation is None:
+                        counts['full'] += 1
+                        continue
+                    counts['booked'] += 1
+                    if reservation.spot_id in held:
+                        counts['double_assigned'] += 1
+                    held[reservation.spot_id] = reservation.id
+                if rng.random() < args.release:
+                    with lock:
+                        held.pop(reservation.spot_id, None)
+                    release(reservation)
+                    with lock:
+                        counts['released'] += 1
+
+    threads = [threading.Thread(target=worker, args=(n, random.Random(args.seed + i)))
+               for i, n in enumerate(per_thread)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    with app.app_context():
+        shared = db.session.query(Reservation.spot_id).filter(Reservation.status == 'active') \
+            .group_by(Reservation.spot_id).having(db.func.count(Reservation.id) > 1).count()
+        active = db.session.query(db.func.count(Reservation.id)).filter(Reservation.status == 'active').scalar()
+        occupied = db.session.query(db.func.count(ParkingSpot.id)) \
+            .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'O').scalar()
+        lot = db.session.get(ParkingLot, lot_id)
+        counters_match = (lot.Occupied_Count, lot.Available_Count) == (occupied, args.spots - occupied)
+
+    latencies.sort()
+    report = {
+        'dataset': {'spots': args.spots, 'attempts': args.attempts, 'threads': args.threads, 'release': args.release},
+        'seconds': round(seconds, 3),
+        'attempts_per_second': round(args.attempts / seconds),
+        'bookings_per_second': round(counts['booked'] / seconds),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3) if latencies else None,
+        **counts,
+        'spots_shared_in_db': shared,
+        'active_reservations': active,
+        'occupied_spots': occupied,
+        'counters_match': counters_match,
+    }
+
+    app.extensions['jobs'].shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+    if counts['double_assigned'] or shared or active != occupied or not counters_match:
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Benchmark for the bulk csv import.
+
+    python -m bench.csvimport --lots 100000 --hashed-users 1000000
+    python -m bench.csvimport --lots 1000 --users 500 --hashed-users 10000
+
+Writes csv files of `--lots` lots (`--spots` spots each), `--users` users with
+plain passwords and `--hashed-users` users with werkzeug hashes already in a
+password_hash column, imports each with importer.run_import and reports rows
+per second and how far the process's peak memory grew. The plain-password users
+go in twice, hashed on one process and on `--workers`, which is where the
+time goes on a real migration. Prints json like python -m bench.
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from werkzeug.security import generate_password_hash
+
+from __init__ import create_app
+from models import db, User
+from importer import run_import
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return os.path.getsize(path)
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed_import(kind, path, workers=None):
+    before = peak_mb()
+    started = time.perf_counter()
+    report = run_import(kind, path, workers=workers)
+    seconds = time.perf_counter() - started
+    return {
+        'rows': report.rows,
+        'imported': report.imported,
+        'rejected': report.error_count,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(report.rows / seconds) if seconds else None,
+        'peak_growth_mb': round(peak_mb() - before, 1),
+        'peak_mb': round(peak_mb(), 1),
+        'failed': report.failed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.csvimport', description='Measure the csv import.')
+    parser.add_argument('--lots', type=int, default=100000)
+    parser.add_argument('--spots', type=int, default=10, help='spots per lot')
+    parser.add_argument('--users', type=int, default=2000, help='users with plain passwords, hashed on import')
+    parser.add_argument('--hashed-users', type=int, default=1000000, help='users with their password hash given')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+                      'RATE_LIMIT_ENABLED': False})
+    report = {'dataset': vars(args)}
+    lots_csv = os.path.join(workdir, 'lots.csv')
+    users_csv = os.path.join(workdir, 'users.csv')
+    hashed_csv = os.path.join(workdir, 'hashed.csv')
+    report['file_mb'] = {
+        'lots': round(write_csv(lots_csv, ['Location', 'Address', 'Pincode', 'Price', 'Max_Spots', 'Max_Time'], (
+            (f'Import Lot {i}', f'{i} Import Road', f'56{i % 10000:04d}', 20, args.spots, 240)
+            for i in range(args.lots)
+        )) / 2 ** 20, 1),
+        'users': round(write_csv(users_csv, ['Name', 'Email', 'Password', 'Pincode'], (
+            (f'plain{i}', f'plain{i}@example.com', f'secret-{i}', '560001') for i in range(args.users)
+        )) / 2 ** 20, 1),
+    }
+    password_hash = generate_password_hash('bench-password')
+    report['file_mb']['hashed_users'] = round(write_csv(hashed_csv, ['Name', 'Email', 'Password_Hash', 'Pincode'], (
+        (f'hashed{i}', f'hashed{i}@example.com', password_hash, '560001') for i in range(args.hashed_users)
+    )) / 2 ** 20, 1)
+
+    with app.app_context():
+        db.create_all()
+        report['lots'] = timed_import('lots', lots_csv)
+        report['hashed_users'] = timed_import('users', hashed_csv)
+        report['users_1_process'] = timed_import('users', users_csv, workers=1)
+        User.query.filter(User.Email.like('plain%')).delete(synchronize_session=False)
+        db.session.commit()
+        report['users_pool'] = timed_import('users', users_csv, workers=args.workers)
+
+    app.extensions['jobs'].shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
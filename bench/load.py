@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import event
+from models import db, User, ParkingLot, Reservation
+from bench.seed import PASSWORD
+
+SCENARIOS = ('login', 'user', 'api', 'admin')
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """Collects latency and query count per labelled request across worker threads."""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'active', False):
+            self._local.queries += 1
+
+    def call(self, label, send, ok=(200, 302, 304)):
+        self._local.active, self._local.queries = True, 0
+        started = time.perf_counter()
+        try:
+            response = send()
+        finally:
+            elapsed = time.perf_counter() - started
+            self._local.active = False
+        with self._lock:
+            self.latencies[label].append(elapsed)
+            self.queries[label].append(self._local.queries)
+            if response.status_code not in ok:
+                self.errors[label] += 1
+        return response
+
+    def report(self, wall_seconds):
+        results = {}
+        for label, latencies in sorted(self.latencies.items()):
+            results[label] = {
+                'requests': len(latencies),
+                'errors': self.errors[label],
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+                'queries_per_request': round(sum(self.queries[label]) / len(latencies), 2),
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            'requests': total,
+            'wall_seconds': round(wall_seconds, 3),
+            'requests_per_second': round(total / wall_seconds, 1) if wall_seconds else None,
+            'endpoints': results,
+        }
+
+
+def run(app, scenario, workers, iterations, seed=42):
+    """Drive `scenario` with `workers` threads, each doing `iterations` rounds."""
+    with app.app_context():
+        recorder = Recorder(db.engine)
+        users = db.session.query(User.id, User.Name, User.Email).filter(User.Email.like('bench%')).limit(workers).all()
+        lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id)]
+    if len(users) < workers:
+        raise SystemExit(f'need at least {workers} seeded users, found {len(users)}')
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        user = users[index]
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['admin_logged_in'] = True
+        etag = {}
+        for _ in range(iterations):
+            if scenario == 'login':
+                recorder.call('POST /login', lambda: client.post('/login', data={'email': user.Email, 'password': PASSWORD}))
+            elif scenario == 'admin':
+                recorder.call('GET /admin/dashboard', lambda: client.get('/admin/dashboard'))
+                recorder.call('GET /admin/summary', lambda: client.get('/admin/summary'))
+                recorder.call('GET /admin/users', lambda: client.get('/admin/users'))
+                recorder.call('GET /admin/stats', lambda: client.get('/admin/stats'))
+            elif scenario == 'api':
+                # same flow as 'user' through /api/v1, for comparing json and html throughput
+                lot_id = rng.choice(lot_ids)
+                recorder.call('GET /api/v1/lots', lambda: client.get('/api/v1/lots'))
+                response = recorder.call('GET /api/v1/availability', lambda: client.get('/api/v1/availability', headers=etag))
+                etag = {'If-None-Match': response.headers['ETag']} if response.headers.get('ETag') else {}
+                booked = recorder.call('POST /api/v1/lots/<lot_id>/book', lambda: client.post(f'/api/v1/lots/{lot_id}/book'),
+                                       ok=(201, 409))
+                if booked.status_code == 201:
+                    res_id = booked.get_json()['id']
+                    recorder.call('POST /api/v1/reservations/<id>/release',
+                                  lambda: client.post(f'/api/v1/reservations/{res_id}/release'))
+                recorder.call('GET /api/v1/reservations', lambda: client.get('/api/v1/reservations'))
+            else:
+                lot_id = rng.choice(lot_ids)
+                recorder.call('GET /dashboard', lambda: client.get('/dashboard'))
+                recorder.call('GET /book/<lot_id>', lambda: client.get(f'/book/{lot_id}'))
+                with app.app_context():
+                    active = (
+                        db.session.query(Reservation.id)
+                        .filter(Reservation.user_id == user.id, Reservation.status == 'active')
+                        .order_by(Reservation.id.desc())
+                        .first()
+                    )
+                if active:
+                    recorder.call('POST /release/<id>', lambda: client.post(f'/release/{active.id}'))
+                recorder.call('GET /summary', lambda: client.get('/summary'))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - started)
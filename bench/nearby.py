@@ -0,0 +1,116 @@
+"""Benchmark for the nearby-lots pincode index.
+
+    python -m bench.nearby --lots 10000 --spots 100
+
+Seeds `--lots` x `--spots` spots with every third lot full, then answers the
+user dashboard's "lots near my pincode with a free spot" three ways: the
+join/DISTINCT over every spot in the region the dashboard used to run, the
+lot_index lookup alone, and the lookup plus loading those lots by primary key
+(what the dashboard runs now). Also reports the index's reload time and
+memory. Prints json like python -m bench.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from __init__ import create_app
+from models import db, ParkingLot, ParkingSpot
+from nearby import LotIndex
+from bench.seed import seed
+
+
+def old_sql(pincode):
+    # the dashboard's query before the index: every lot in the region with at least one free spot
+    return (
+        db.session.query(ParkingLot)
+        .join(ParkingSpot)
+        .filter(ParkingLot.Pincode.startswith(pincode[:2]))
+        .filter(ParkingSpot.status == 'A')
+        .distinct()
+        .all()
+    )
+
+
+def timed(fn, calls):
+    times = []
+    for args in calls:
+        started = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return {
+        'calls': len(times),
+        'p50_ms': round(statistics.median(times) * 1000, 4),
+        'p99_ms': round(times[int(len(times) * 0.99) - 1] * 1000, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.nearby', description='Measure the nearby-lots index.')
+    parser.add_argument('--lots', type=int, default=10000)
+    parser.add_argument('--spots', type=int, default=100, help='spots per lot')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+                      'RATE_LIMIT_ENABLED': False})
+    report = {'dataset': {'lots': args.lots, 'spots_per_lot': args.spots}}
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(args.lots, args.spots, 1, 0, seed=args.seed)
+        # every third lot full, so lookups have lots to skip
+        full = db.select(ParkingLot.id).where(ParkingLot.id % 3 == 0)
+        db.session.execute(ParkingSpot.__table__.update().where(ParkingSpot.lot_id.in_(full)).values(status='O'))
+        db.session.execute(ParkingLot.__table__.update().where(ParkingLot.id % 3 == 0)
+                           .values(Available_Count=0, Occupied_Count=ParkingLot.Max_Spots))
+        db.session.commit()
+        report['seed_seconds'] = round(time.perf_counter() - started, 3)
+
+        index = LotIndex()
+        started = time.perf_counter()
+        index.reload()
+        report['index_reload_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        tracemalloc.start()
+        measured = LotIndex()
+        measured.reload()
+        report['index_memory_mb'] = round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 2)
+        tracemalloc.stop()
+
+        def index_and_load(pincode):
+            lot_ids = index.nearby(pincode)
+            lots = {lot.id: lot for lot in ParkingLot.query.filter(ParkingLot.id.in_(lot_ids)).all()} if lot_ids else {}
+            return [lots[lot_id] for lot_id in lot_ids if lot_id in lots]
+
+        pincodes = [pincode for (pincode,) in db.session.query(ParkingLot.Pincode)]
+        calls = [(rng.choice(pincodes),) for _ in range(args.queries)]
+        # every lot the index returns must be one the old query finds (it returns the closest 20 of them)
+        wrong = 0
+        for (pincode,) in calls[:20]:
+            old = {lot.id for lot in old_sql(pincode)}
+            wrong += len(set(index.nearby(pincode)) - old)
+        report['old_sql'] = timed(old_sql, calls[:max(len(calls) // 10, 1)])
+        report['index'] = timed(index.nearby, calls)
+        report['index_and_load'] = timed(index_and_load, calls)
+        report['not_in_old_result'] = wrong
+        db.session.rollback()
+
+    app.extensions['jobs'].shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Credential stuffing benchmark for the login rate limits.
+
+    python -m bench.ratelimit --attempts 500 --ips 1
+    python -m bench.ratelimit --attempts 500 --ips 200 --store database
+
+Fires wrong-password logins at /login from `--ips` addresses, spread over the
+seeded accounts, once with the limits off and once with them on. For each run it
+reports the process cpu time the burst cost, and how long a real user's logins
+took while it was going on. Prints json like python -m bench.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from __init__ import create_app
+from models import db, User
+from ratelimit import init_ratelimit
+from bench.seed import seed, PASSWORD
+
+
+def attack(app, emails, victim, attempts, ips, workers, seed):
+    done = threading.Event()
+    statuses = []
+    lock = threading.Lock()
+
+    def attacker(index):
+        rng = random.Random(seed + index)
+        client = app.test_client()
+        counts = {}
+        for i in range(index, attempts, workers):
+            address = f'10.0.{(i % ips) // 256}.{(i % ips) % 256}'
+            response = client.post('/login', data={'email': rng.choice(emails), 'password': 'wrong'},
+                                   environ_base={'REMOTE_ADDR': address})
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        with lock:
+            statuses.append(counts)
+
+    latencies = []
+    def real_user():
+        # stays under the account limit, so with the limits on these should all get through
+        client = app.test_client()
+        while not done.is_set() and len(latencies) < 4:
+            started = time.perf_counter()
+            response = client.post('/login', data={'email': victim, 'password': PASSWORD},
+                                   environ_base={'REMOTE_ADDR': '192.168.1.10'})
+            latencies.append((time.perf_counter() - started, response.status_code == 302))
+            client.get('/logout')
+            done.wait(0.25)
+
+    threads = [threading.Thread(target=attacker, args=(i,)) for i in range(workers)]
+    user = threading.Thread(target=real_user)
+    cpu, wall = time.process_time(), time.perf_counter()
+    user.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    done.set()
+    user.join()
+
+    totals = {}
+    for counts in statuses:
+        for status, count in counts.items():
+            totals[status] = totals.get(status, 0) + count
+    return {
+        'attempts': attempts,
+        'rejected': totals.get(429, 0),
+        'password_checks': attempts - totals.get(429, 0),
+        'cpu_seconds': round(cpu, 3),
+        'cpu_ms_per_attempt': round(cpu / attempts * 1000, 3),
+        'wall_seconds': round(wall, 3),
+        'real_user_logins': sum(1 for _, ok in latencies if ok),
+        'real_user_p50_ms': round(statistics.median(t for t, _ in latencies) * 1000, 3) if latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.ratelimit', description='Measure login cost under a credential stuffing burst.')
+    parser.add_argument('--attempts', type=int, default=500)
+    parser.add_argument('--ips', type=int, default=1, help='addresses the attempts come from')
+    parser.add_argument('--accounts', type=int, default=50, help='accounts the attempts are spread over')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent attackers')
+    parser.add_argument('--store', choices=('memory', 'database'), default='memory')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+                      'RATE_LIMIT_STORE': args.store})
+    with app.app_context():
+        db.create_all()
+        seed(1, 1, args.accounts + 1, 0, seed=args.seed)
+        emails = [email for (email,) in db.session.query(User.Email).order_by(User.id)]
+    victim, emails = emails[-1], emails[:-1]
+
+    report = {'attempts': args.attempts, 'ips': args.ips, 'accounts': args.accounts,
+              'workers': args.workers, 'store': args.store}
+    app.extensions.pop('ratelimit')
+    report['limits_off'] = attack(app, emails, victim, args.attempts, args.ips, args.workers, args.seed)
+    init_ratelimit(app)
+    report['limits_on'] = attack(app, emails, victim, args.attempts, args.ips, args.workers, args.seed)
+
+    app.extensions['jobs'].shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import random
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from models import db, User, ParkingLot, Reservation
+from provisioning import create_spots
+from stats import rebuild_daily_stats
+from billing import tariff
+
+PASSWORD = 'bench-password'
+CHUNK = 5000
+
+
+def seed(lots, spots, users, reservations, seed=42):
+    """Fill the (empty) app database with a synthetic dataset. Needs an app context."""
+    rng = random.Random(seed)
+    now = datetime(2026, 1, 1)
+
+    # one hash shared by every user, hashing per row would dominate seeding time
+    password = generate_password_hash(PASSWORD)
+    _insert(User.__table__, (
+        {
+            'Name': f'bench{i}',
+            'Email': f'bench{i}@example.com',
+            'Password': password,
+            'Pincode': f'{rng.randint(56, 57)}{rng.randint(0, 9999):04d}',
+            'Phone': f'9{i:09d}',
+            'Vehicle_Number': f'KA01BN{i:04d}',
+            'created_at': now,
+        }
+        for i in range(users)
+    ))
+
+    _insert(ParkingLot.__table__, (
+        {
+            'Location': f'Bench Lot {i}',
+            'Address': f'{i} Bench Road',
+            'Pincode': f'{rng.randint(56, 57)}{rng.randint(0, 9999):04d}',
+            'Price': rng.choice([10.0, 20.0, 30.0, 50.0]),
+            'Max_Spots': spots,
+            'Max_Time': 240,
+            'Created_at': now,
+            'Available_Count': spots,
+            'Occupied_Count': 0,
+        }
+        for i in range(lots)
+    ))
+    lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id).order_by(ParkingLot.id)]
+    for lot_id in lot_ids:
+        create_spots(lot_id, spots)
+    db.session.commit()
+
+    # spot ids are handed out in lot order by create_spots, so they can be derived
+    first_spot = db.session.execute(db.text('SELECT min(id) FROM parking_spot')).scalar() or 1
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.Email.like('bench%')).all()]
+    if user_ids and lot_ids:
+        _insert(Reservation.__table__, (
+            _history_row(rng, now, first_spot + rng.randrange(len(lot_ids) * spots), rng.choice(user_ids))
+            for _ in range(reservations)
+        ))
+    db.session.commit()
+    rebuild_daily_stats()
+
+
+def _history_row(rng, now, spot_id, user_id):
+    in_time = now - timedelta(minutes=rng.randint(60, 365 * 24 * 60))
+    hours = rng.uniform(0.25, 6)
+    cancelled = rng.random() < 0.05
+    return {
+        'spot_id': spot_id,
+        'user_id': user_id,
+        'in_time': in_time,
+        'out_time': None if cancelled else in_time + timedelta(hours=hours),
+        'created_at': in_time,
+        'updated_at': in_time,
+        'total_cost': None if cancelled else round(tariff(hours, 20), 2),
+        'status': 'cancelled' if cancelled else 'completed',
+    }
+
+
+def _insert(table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
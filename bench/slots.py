@@ -0,0 +1,147 @@
+"""Benchmark for advance slot bookings and the in-memory slot index.
+
+    python -m bench.slots --bookings 1000000
+    python -m bench.slots --lots 20 --spots 50 --bookings 100000 --queries 500
+
+Seeds `--lots` x `--spots` spots and `--bookings` upcoming slots spread over
+the next MAX_DAYS_AHEAD days, then reports how long slot_index takes to load
+and how much memory it holds, "first free spot in a lot" through the index
+against the same question asked in SQL, the pincode region search, and
+booking latency. Prints json like python -m bench.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from __init__ import create_app
+from models import db, ParkingLot, ParkingSpot, SlotBooking
+from schedule import slot_index, book_slot, search_slots, MAX_DAYS_AHEAD
+from billing import utcnow
+from bench.seed import seed, _insert
+
+
+def future_bookings(rng, spot_ids, lot_of, user_ids, per_spot, start):
+    # back to back with random gaps, so each spot's slots never overlap
+    span = MAX_DAYS_AHEAD * 24 * 3600
+    step = span // max(per_spot, 1)
+    for spot_id in spot_ids:
+        at = start
+        for _ in range(per_spot):
+            at += timedelta(seconds=rng.randint(0, step // 3))
+            length = timedelta(seconds=rng.randint(step // 3, step // 2))
+            yield {'spot_id': spot_id, 'lot_id': lot_of[spot_id], 'user_id': rng.choice(user_ids),
+                   'start_time': at, 'end_time': at + length, 'status': 'booked',
+                   'total_cost': 20.0, 'created_at': start}
+            at += length
+
+
+def sql_first_free(lot_id, start, end):
+    clash = db.select(SlotBooking.id).where(
+        SlotBooking.spot_id == ParkingSpot.id, SlotBooking.status == 'booked',
+        SlotBooking.end_time > start, SlotBooking.start_time < end
+    )
+    return db.session.execute(
+        db.select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id, ~clash.exists())
+        .order_by(ParkingSpot.id).limit(1)
+    ).scalar()
+
+
+def timed(fn, calls):
+    times = []
+    for args in calls:
+        started = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return {
+        'calls': len(times),
+        'p50_ms': round(statistics.median(times) * 1000, 4),
+        'p99_ms': round(times[int(len(times) * 0.99) - 1] * 1000, 4),
+        'max_ms': round(times[-1] * 1000, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.slots', description='Measure slot availability lookups.')
+    parser.add_argument('--lots', type=int, default=100)
+    parser.add_argument('--spots', type=int, default=100, help='spots per lot')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--bookings', type=int, default=1000000, help='upcoming slot bookings')
+    parser.add_argument('--queries', type=int, default=2000, help='availability lookups per measurement')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+                      'RATE_LIMIT_ENABLED': False})
+    report = {'dataset': {'lots': args.lots, 'spots_per_lot': args.spots, 'bookings': args.bookings,
+                          'seed': args.seed}}
+    with app.app_context():
+        db.create_all()
+        seed(args.lots, args.spots, args.users, 0, seed=args.seed)
+        spots = db.session.execute(db.select(ParkingSpot.id, ParkingSpot.lot_id)).all()
+        lot_of = dict(spots)
+        user_ids = list(range(1, args.users + 1))
+        now = utcnow().replace(microsecond=0)
+        started = time.perf_counter()
+        _insert(SlotBooking.__table__, future_bookings(rng, sorted(lot_of), lot_of, user_ids,
+                                                        args.bookings // len(lot_of), now + timedelta(minutes=5)))
+        db.session.commit()
+        report['seed_seconds'] = round(time.perf_counter() - started, 3)
+        report['dataset']['bookings'] = db.session.query(db.func.count(SlotBooking.id)).scalar()
+
+        started = time.perf_counter()
+        slot_index.reload()
+        report['index_load_seconds'] = round(time.perf_counter() - started, 3)
+        # again under tracemalloc, which slows allocation too much to time the first one with it
+        tracemalloc.start()
+        slot_index.reload()
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report['index_memory_mb'] = round(size / 2 ** 20, 1)
+        report['index_load_peak_mb'] = round(peak / 2 ** 20, 1)
+
+        lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id)]
+        windows = []
+        for _ in range(args.queries):
+            start = now + timedelta(minutes=rng.randint(10, (MAX_DAYS_AHEAD - 1) * 24 * 60))
+            windows.append((rng.choice(lot_ids), start, start + timedelta(minutes=rng.choice((30, 60, 120, 240)))))
+        answers = [slot_index.first_free(*window) for window in windows[:200]]
+        mismatches = sum(1 for window, answer in zip(windows, answers) if sql_first_free(*window) != answer)
+        report['first_free'] = {
+            'index': timed(slot_index.first_free, windows),
+            'sql': timed(sql_first_free, windows[:max(len(windows) // 10, 1)]),
+            'found': sum(1 for answer in answers if answer is not None),
+            'mismatches': mismatches,
+        }
+
+        prefixes = sorted({pincode[:2] for (pincode,) in db.session.query(ParkingLot.Pincode)})
+        report['region_search'] = timed(
+            lambda prefix, start, end: search_slots(prefix, start, end, limit=20),
+            [(rng.choice(prefixes), start, end) for _, start, end in windows[:200]]
+        )
+
+        lots = {lot.id: lot for lot in ParkingLot.query.all()}
+        report['book_slot'] = timed(
+            lambda lot_id, start, end: book_slot(rng.choice(user_ids), lots[lot_id], start, end),
+            windows[:200]
+        )
+
+    app.extensions['jobs'].shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
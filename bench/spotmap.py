@@ -0,0 +1,114 @@
+"""Benchmark for the per-lot spot bitmaps.
+
+    python -m bench.spotmap --lots 500 --spots 1000
+
+Seeds `--lots` x `--spots` spots with about half of them occupied, then reports
+spot_map's cold load (from ParkingSpot) against a warm one (from lot_spot_map),
+the memory it holds, and first free spot, counts and the full grid of a lot
+through the bitmap against the same questions asked in SQL. Prints json like
+python -m bench.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from __init__ import create_app
+from models import db, ParkingLot, ParkingSpot
+from occupancy import SpotMap
+from bench.seed import seed
+
+
+def timed(fn, calls):
+    times = []
+    for args in calls:
+        started = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return {
+        'calls': len(times),
+        'p50_ms': round(statistics.median(times) * 1000, 4),
+        'p99_ms': round(times[int(len(times) * 0.99) - 1] * 1000, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.spotmap', description='Measure the spot bitmaps.')
+    parser.add_argument('--lots', type=int, default=500)
+    parser.add_argument('--spots', type=int, default=1000, help='spots per lot')
+    parser.add_argument('--occupied', type=float, default=0.5, help='share of spots occupied')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+                      'RATE_LIMIT_ENABLED': False})
+    report = {'dataset': {'lots': args.lots, 'spots_per_lot': args.spots, 'occupied': args.occupied}}
+    with app.app_context():
+        db.create_all()
+        seed(args.lots, args.spots, 1, 0, seed=args.seed)
+        # fill each lot from the front, with some free spots scattered through the occupied part
+        table = ParkingSpot.__table__
+        db.session.execute(
+            table.update().where(table.c.id % args.spots < args.spots * args.occupied, table.c.id % 7 != 0)
+            .values(status='O')
+        )
+        db.session.commit()
+        lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id)]
+
+        cold = SpotMap()
+        started = time.perf_counter()
+        cold.reload()
+        report['cold_load_seconds'] = round(time.perf_counter() - started, 3)
+        cold.save()
+        warm = SpotMap()
+        started = time.perf_counter()
+        warm.reload()
+        report['warm_load_seconds'] = round(time.perf_counter() - started, 3)
+        tracemalloc.start()
+        measured = SpotMap()
+        measured.reload()
+        report['memory_mb'] = round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 2)
+        tracemalloc.stop()
+
+        def sql_first_free(lot_id):
+            return db.session.query(ParkingSpot.id).filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A') \
+                .order_by(ParkingSpot.id).limit(1).scalar()
+
+        def sql_counts(lot_id):
+            return db.session.query(ParkingSpot.status, db.func.count(ParkingSpot.id)) \
+                .filter(ParkingSpot.lot_id == lot_id).group_by(ParkingSpot.status).all()
+
+        def sql_grid(lot_id):
+            return ''.join(status for (status,) in db.session.query(ParkingSpot.status)
+                           .filter(ParkingSpot.lot_id == lot_id).order_by(ParkingSpot.id))
+
+        calls = [(rng.choice(lot_ids),) for _ in range(args.queries)]
+        mismatches = sum(1 for (lot_id,) in calls[:100]
+                         if warm.first_free(lot_id) != sql_first_free(lot_id)
+                         or warm.lot(lot_id).statuses() != sql_grid(lot_id))
+        report['first_free'] = {'bitmap': timed(warm.first_free, calls), 'sql': timed(sql_first_free, calls)}
+        report['counts'] = {'bitmap': timed(lambda lot_id: (warm.lot(lot_id).free, warm.lot(lot_id).occupied), calls),
+                            'sql': timed(sql_counts, calls)}
+        report['grid'] = {'bitmap': timed(lambda lot_id: warm.lot(lot_id).statuses(), calls),
+                          'sql': timed(sql_grid, calls)}
+        report['mismatches'] = mismatches
+
+    app.extensions['jobs'].shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Idle subscriber benchmark for /events/availability.
+
+    python -m bench.sse --subscribers 5000
+
+Opens that many event streams against a throwaway database, and measures:
+- the memory each idle connection holds in the app, not counting the
+  server thread and socket
+- how long one flush takes to fan an update out to every subscriber
+
+Prints json like python -m bench.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from __init__ import create_app
+from models import db, ParkingLot
+from bench.seed import seed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.sse', description='Measure idle SSE subscribers.')
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--lots', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+                      'EVENTS_INTERVAL': 3600})  # flushed by hand below
+    with app.app_context():
+        db.create_all()
+        seed(args.lots, 20, 10, 0, seed=args.seed)
+        prefixes = sorted({pincode[:2] for (pincode,) in db.session.query(ParkingLot.Pincode)})
+        lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id)]
+    hub = app.extensions['events']
+    client = app.test_client()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    streams = []
+    for i in range(args.subscribers):
+        response = client.get(f'/events/availability?pincode={prefixes[i % len(prefixes)]}', buffered=False)
+        chunks = iter(response.response)
+        next(chunks)  # retry + snapshot, the stream is now parked waiting for updates
+        streams.append((response, chunks))
+    open_seconds = time.perf_counter() - started
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    held = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+    for lot_id in lot_ids:
+        hub.publish(lot_id)
+    started = time.perf_counter()
+    delivered = hub.flush()
+    flush_seconds = time.perf_counter() - started
+    received = sum(1 for _, chunks in streams if next(chunks).startswith(b'event: availability'))
+
+    for response, _ in streams:
+        response.close()
+    report = {
+        'subscribers': args.subscribers,
+        'prefixes': len(prefixes),
+        'open_seconds': round(open_seconds, 3),
+        'bytes_per_subscriber': round(held / args.subscribers),
+        'flush_ms': round(flush_seconds * 1000, 3),
+        'delivered': delivered,
+        'received': received,
+        'subscribers_left': hub.subscriber_count(),
+    }
+    app.extensions['jobs'].shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""Startup benchmark: how long a fresh process takes to build the app.
+
+    python -m bench.startup --runs 5
+
+Each run starts a new interpreter and times the app package import and
+create_app(), and counts the modules loaded by then. This is roughly what
+every gunicorn worker pays before it can serve. Prints json like python -m bench.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from __init__ import create_app
+imported = time.perf_counter()
+create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+built = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (built - imported) * 1000,
+                  'total_ms': (built - started) * 1000, 'modules': len(sys.modules)}))
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.startup', description='Time app startup in fresh processes.')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    uri = 'sqlite:///' + os.path.join(workdir, 'startup.sqlite3')
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', PROBE, uri], cwd=root, capture_output=True, text=True, check=True).stdout
+        # the app may print on its way up (job worker, sweeper), only the probe's line is json
+        runs.append(json.loads(next(line for line in output.splitlines() if line.startswith('{"import_ms"'))))
+
+    report = {'runs': args.runs}
+    for key in ('import_ms', 'create_app_ms', 'total_ms'):
+        values = [run[key] for run in runs]
+        report[key] = {'median': round(statistics.median(values), 1), 'min': round(min(values), 1)}
+    report['modules'] = runs[-1]['modules']
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
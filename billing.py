@@ -0,0 +1,84 @@
+"""Time and money for reservations.
+
+Reservation times are stored as naive UTC. Anything shown to people goes
+through to_local(), anything charged goes through tariff().
+"""
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+LOCAL_TZ = ZoneInfo("Asia/Kolkata")
+MINIMUM_HOURS = 1  # every booking pays for at least this long
+EPOCH = datetime(1970, 1, 1)
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_utc(value):
+    """Naive UTC for storage; aware values are converted, naive ones assumed UTC."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_local(value):
+    """Stored (naive UTC) time as an aware local time for display."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(LOCAL_TZ)
+
+
+def local_date(value):
+    return to_local(value).date()
+
+
+def local_day_start(day):
+    """Naive UTC time at which the local calendar `day` begins, for range filters."""
+    return to_utc(datetime(day.year, day.month, day.day, tzinfo=LOCAL_TZ))
+
+
+def duration_hours(in_time, out_time):
+    return (to_utc(out_time) - to_utc(in_time)).total_seconds() / 3600
+
+
+def tariff(hours, rate):
+    """Price of a stay of `hours` at `rate` per hour. The one place charging rules live."""
+    return max(MINIMUM_HOURS, hours) * rate
+
+
+def charge(in_time, out_time, rate):
+    return tariff(duration_hours(in_time, out_time), rate)
+
+
+def load_numpy():
+    # imported on first use rather than at startup, only batch pricing needs it
+    try:
+        import numpy
+    except ImportError:  # optional, bill_batch falls back to plain python
+        return None
+    return numpy
+
+
+def _epoch_seconds(np, values):
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+        return values.astype('datetime64[us]').astype(np.float64) / 1e6
+    return np.fromiter(((to_utc(value) - EPOCH).total_seconds() for value in values), np.float64, len(values))
+
+
+def bill_batch(in_times, out_times, rates):
+    """Durations (hours) and costs for many stays at once.
+
+    Takes equal-length sequences of naive UTC datetimes (or datetime64 arrays)
+    and hourly rates; returns two numpy arrays, or two lists without numpy.
+    Applies the same rules as tariff().
+    """
+    np = load_numpy()
+    if np is None:
+        hours = [duration_hours(start, end) for start, end in zip(in_times, out_times)]
+        return hours, [tariff(h, rate) for h, rate in zip(hours, rates)]
+    hours = (_epoch_seconds(np, out_times) - _epoch_seconds(np, in_times)) / 3600
+    costs = np.maximum(hours, MINIMUM_HOURS) * np.asarray(rates, dtype=np.float64)
+    return hours, costs
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from models import db, ParkingLot, Reservation
+from allocator import claim_spot, release_spot
+from stats import record_booking, record_completion
+from nearby import lot_index
+from schedule import slot_index
+from occupancy import spot_map
+from jobs import enqueue
+from events import publish
+from billing import utcnow, charge
+
+
+def book(user_id, lot_id):
+    """Claim a free spot in the lot for the user. Returns the new Reservation, or None if the lot is full."""
+    max_time = db.session.execute(db.select(ParkingLot.Max_Time).where(ParkingLot.id == lot_id)).scalar()
+    until = utcnow() + timedelta(minutes=max_time) if max_time else None
+    spot_id = claim_spot(lot_id, free_until=until)
+    if spot_id is None:
+        db.session.rollback()
+        return None
+    reservation = Reservation(spot_id=spot_id, user_id=user_id)
+    db.session.add(reservation)
+    record_booking(reservation, lot_id)
+    db.session.commit()
+    lot_index.adjust(lot_id, -1)
+    spot_map.set(lot_id, [spot_id], occupied=True)
+    slot_index.add(spot_id, reservation.in_time, reservation.in_time + timedelta(minutes=max_time) if max_time else None)
+    publish(lot_id)
+    enqueue('booking_confirmation', {
+        'reservation_id': reservation.id, 'user_id': reservation.user_id,
+        'spot_id': spot_id, 'lot_id': lot_id
+    })
+    return reservation
+
+
+def release(reservation):
+    """Check an active reservation out now, bill it and free its spot.
+
+    Returns None, having changed nothing, if the reservation is no longer active.
+    """
+    out_time = utcnow()
+    total_cost = charge(reservation.in_time, out_time, reservation.spot.lot.Price)
+    # claim it first, a second release or the sweeper may have completed it since the caller checked
+    claimed = (
+        Reservation.query
+        .filter(Reservation.id == reservation.id, Reservation.status == 'active')
+        .update({Reservation.status: 'completed', Reservation.out_time: out_time, Reservation.total_cost: total_cost},
+                synchronize_session='evaluate')
+    )
+    if not claimed:
+        db.session.rollback()
+        return None
+    released = release_spot(reservation.spot_id)
+    lot_id = reservation.spot.lot_id
+    record_completion(reservation, lot_id)
+    db.session.commit()
+    if released:
+        lot_index.adjust(lot_id, 1)
+        spot_map.set(lot_id, [reservation.spot_id], occupied=False)
+    slot_index.remove(reservation.spot_id, reservation.in_time)
+    publish(lot_id)
+    enqueue('release_receipt', {
+        'reservation_id': reservation.id, 'user_id': reservation.user_id,
+        'lot_id': lot_id, 'total_cost': reservation.total_cost
+    })
+    return reservation
@@ -0,0 +1,125 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, request, session, make_response
+
+
+class LRUCache:
+    """In-process cache with per-entry ttl and a cap on entries and total bytes.
+
+    Any object with the same get/set/delete/clear methods (a redis wrapper, say)
+    can be dropped in through the CACHE_BACKEND setting instead.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl=None):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+
+def _size(value):
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_size(item) for item in value)
+    return 64
+
+
+def init_cache(app):
+    app.extensions['cache'] = app.config.get('CACHE_BACKEND') or LRUCache(
+        max_entries=app.config.get('CACHE_MAX_ENTRIES', 2048),
+        max_bytes=app.config.get('CACHE_MAX_BYTES', 32 * 1024 * 1024),
+        ttl=app.config.get('CACHE_TTL', 300)
+    )
+
+
+def get_cache():
+    return current_app.extensions['cache']
+
+
+def viewer():
+    # base.html only changes its nav for these three cases
+    if session.get('admin_logged_in'):
+        return 'admin'
+    if session.get('user_id'):
+        return 'user'
+    return 'anon'
+
+
+def cached_page(view):
+    """Cache the full GET response of a page that only depends on who is looking
+    (see viewer()), and answer If-None-Match / If-Modified-Since with a 304."""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if request.method != 'GET' or session.get('_flashes'):
+            return view(*args, **kwargs)
+        key = f'page:{request.path}:{viewer()}'
+        entry = get_cache().get(key)
+        if entry is None:
+            body = view(*args, **kwargs)
+            if not isinstance(body, str):
+                return body
+            entry = (body, hashlib.md5(body.encode()).hexdigest(), int(time.time()))
+            get_cache().set(key, entry)
+        body, etag, modified = entry
+        response = make_response(body)
+        response.set_etag(etag)
+        response.last_modified = datetime.fromtimestamp(modified, tz=timezone.utc)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True  # browsers revalidate and get a 304 while it's unchanged
+        return response.make_conditional(request)
+    return decorated_function
+
+
+def cached_fragment(key, render):
+    """Return the cached html for `key`, rendering and storing it on a miss."""
+    html = get_cache().get(key)
+    if html is None:
+        html = render()
+        get_cache().set(key, html)
+    return html
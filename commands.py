@@ -0,0 +1,241 @@
+import os
+import click
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+from models import db, User, ParkingLot, ParkingSpot, LotSpotMap
+from database import init_migrate
+from nearby import lot_index
+from occupancy import spot_map
+from sweeper import sweep_expired
+from stats import rebuild_daily_stats
+from sessions import prune_sessions
+from ratelimit import prune_rate_limits
+from archive import archive_reservations, compact
+from importer import run_import, KINDS
+
+
+class MigrateGroup(click.Group):
+    """Stands in for Flask-Migrate's `flask db` group so alembic is only imported when it is used."""
+
+    def __init__(self, app):
+        super().__init__('db', help='Perform database migrations.')
+        self.app = app
+
+    def _group(self):
+        init_migrate(self.app)
+        from flask_migrate.cli import db as group
+        return group
+
+    def parse_args(self, ctx, args):
+        # take over the real group's options and callback, which puts --directory/-x on g for the subcommands
+        group = self._group()
+        self.params = group.params
+        self.callback = group.callback
+        return super().parse_args(ctx, args)
+
+    def list_commands(self, ctx):
+        return self._group().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._group().get_command(ctx, name)
+
+
+def bootstrap_schema(app):
+    """Create the tables on an empty database, or bring an existing one up to the latest migration."""
+    init_migrate(app)
+    from flask_migrate import stamp, upgrade
+    tables = set(db.inspect(db.engine).get_table_names())
+    if 'alembic_version' in tables:
+        upgrade()
+        return 'upgraded'
+    if tables:
+        raise click.ClickException('database has tables but no migration history, '
+                                   'stamp the revision it matches first (see README)')
+    db.create_all()
+    stamp()
+    return 'created'
+
+
+# admin creation
+def create_admin():
+    if not User.query.filter_by(Email='admin@admin.com').first():
+        admin = User(
+            Name='admin',
+            Email='admin@admin.com',
+            Password=generate_password_hash('123'),
+            Pincode='111111',
+            Address='admin address',
+            Phone='1234567890',
+            Vehicle_Number='DL01AB1234',
+            created_at=datetime.now(tz=ZoneInfo('Asia/Kolkata'))
+        )
+        db.session.add(admin)
+        db.session.commit()
+        print('admin added too!')
+
+
+def commands(app):
+
+    app.cli.add_command(MigrateGroup(app))
+
+    # One-off setup for a new deployment or after pulling new code: schema, then the admin account
+    @app.cli.command('bootstrap')
+    def bootstrap():
+        click.echo(f'database {bootstrap_schema(app)}')
+        create_admin()
+        click.echo('bootstrap done')
+
+    # Rebuild the per-lot spot counters from ParkingSpot
+    @app.cli.command('reconcile-counts')
+    def reconcile_counts():
+        rows = (
+            db.session.query(ParkingSpot.lot_id, ParkingSpot.status, db.func.count(ParkingSpot.id))
+            .group_by(ParkingSpot.lot_id, ParkingSpot.status)
+            .all()
+        )
+        counts = {}
+        for lot_id, status, count in rows:
+            counts.setdefault(lot_id, {})[status] = count
+
+        fixed = 0
+        for lot in ParkingLot.query.all():
+            available = counts.get(lot.id, {}).get('A', 0)
+            occupied = counts.get(lot.id, {}).get('O', 0)
+            if lot.Available_Count != available or lot.Occupied_Count != occupied:
+                lot.Available_Count = available
+                lot.Occupied_Count = occupied
+                lot.bump_version()
+                fixed += 1
+        db.session.commit()
+        click.echo(f'reconciled spot counts, {fixed} lot(s) corrected')
+
+    # Check the spot bitmaps, as saved and as loaded, against ParkingSpot and the lot counters
+    @app.cli.command('check-spot-map')
+    @click.option('--repair', is_flag=True, help='drop the saved bitmaps and rebuild them from the spots')
+    def check_spot_map(repair):
+        spot_map.reload()
+        problems = spot_map.check()
+        for problem in problems:
+            click.echo(problem)
+        if problems and repair:
+            LotSpotMap.query.delete()
+            db.session.commit()
+            spot_map.reload()
+            spot_map.save()
+            click.echo('rebuilt the bitmaps from the spots, counter mismatches need reconcile-counts')
+        elif problems:
+            raise SystemExit(f'{len(problems)} problem(s) found')
+        else:
+            click.echo('spot bitmaps match the spots')
+
+    # Bulk-load lots (with their spots) or users from a csv file, a chunk per transaction
+    @app.cli.command('import-csv')
+    @click.argument('kind', type=click.Choice(KINDS))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--workers', type=int, default=None, help='password hashing processes, defaults to the cpu count')
+    @click.option('--quiet', is_flag=True, help='print the totals only, not each chunk and rejected row')
+    def import_csv(kind, path, workers, quiet):
+        def progress(report, line):
+            if quiet:
+                return
+            for error_line, message in report.chunk_errors:
+                click.echo(f'  line {error_line or "?"}: {message}', err=True)
+            click.echo(f'up to line {line}: {report.summary()}')
+
+        report = run_import(kind, path, workers=workers or os.cpu_count(), progress=progress)
+        if report.ignored_columns:
+            click.echo(f'ignored column(s): {", ".join(report.ignored_columns)}')
+        click.echo(report.summary())
+        if report.failed:
+            raise SystemExit(f'import stopped: {report.failed}')
+
+    # Rebuild the daily reservation rollup from the full reservation history
+    @app.cli.command('backfill-stats')
+    def backfill_stats():
+        rows = rebuild_daily_stats()
+        click.echo(f'rebuilt reservation rollup, {rows} day/lot row(s)')
+
+    # Complete reservations that have overstayed their lot's Max_Time
+    @app.cli.command('sweep-expired')
+    @click.option('--batch-size', default=1000, show_default=True)
+    @click.option('--max-seconds', default=30, show_default=True, help='stop after this long, the rest waits for the next run')
+    def sweep_expired_command(batch_size, max_seconds):
+        completed = sweep_expired(batch_size=batch_size, max_seconds=max_seconds)
+        click.echo(f'expired {completed} reservation(s)')
+
+    # Move old completed/cancelled reservations to reservation_archive (cron), so the live table stays small
+    @app.cli.command('archive-reservations')
+    @click.option('--older-than-days', type=int, default=None, help='defaults to ARCHIVE_AFTER_DAYS (180)')
+    @click.option('--batch-size', default=1000, show_default=True)
+    @click.option('--max-seconds', default=60, show_default=True, help='stop after this long, the rest waits for the next run')
+    @click.option('--analyze', is_flag=True, help='refresh the query planner statistics afterwards')
+    @click.option('--vacuum', is_flag=True, help='give freed space back to the filesystem afterwards (rewrites the file)')
+    def archive_reservations_command(older_than_days, batch_size, max_seconds, analyze, vacuum):
+        if older_than_days is None:
+            older_than_days = app.config.get('ARCHIVE_AFTER_DAYS', 180)
+        moved = archive_reservations(older_than_days=older_than_days, batch_size=batch_size, max_seconds=max_seconds)
+        click.echo(f'archived {moved} reservation(s) older than {older_than_days} day(s)')
+        if analyze or vacuum:
+            compact(analyze=analyze, vacuum=vacuum)
+            click.echo('compacted')
+
+    # Drop expired rows from the server side session table
+    @app.cli.command('prune-sessions')
+    def prune_sessions_command():
+        click.echo(f'pruned {prune_sessions()} expired session(s)')
+
+    # Drop finished windows from the shared rate limit table (RATE_LIMIT_STORE=database)
+    @app.cli.command('prune-rate-limits')
+    def prune_rate_limits_command():
+        click.echo(f'pruned {prune_rate_limits()} rate limit counter(s)')
+
+    # Run the read-only pages once and EXPLAIN QUERY PLAN every statement they issue
+    @app.cli.command('explain-routes')
+    def explain_routes():
+        big_tables = {'parking_spot', 'reservation', 'user'}
+        user = User.query.filter(User.Email != 'admin@admin.com').first()
+        lot = ParkingLot.query.first()
+        paths = ['/admin/dashboard', '/admin/dashboard?search=a', '/admin/summary',
+                 '/admin/users', '/admin/users?search=b', '/admin/stats']
+        if lot:
+            paths.append(f'/admin/parking_edit/{lot.id}')
+        if user:
+            paths += ['/dashboard', '/summary', '/profile']
+
+        statements = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                statements.append((statement, parameters))
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+            if user:
+                sess['user_id'] = user.id
+        lot_index.reload()  # keep the indexes' own full-table loads out of the report
+        spot_map.reload()
+
+        failures = 0
+        for path in paths:
+            statements.clear()
+            db.session.remove()  # start each page with an empty identity map, like a real request
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                status = client.get(path).status_code
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+            click.echo(f'{path} -> {status}, {len(statements)} select(s)')
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                    for row in plan:
+                        detail = row[-1]
+                        words = detail.split()
+                        if words[0] == 'SCAN' and words[1] in big_tables and 'INDEX' not in detail:
+                            failures += 1
+                            click.echo(f'  full scan: {detail}\n    {" ".join(statement.split())[:200]}')
+        if failures:
+            raise SystemExit(f'{failures} unindexed scan(s) found')
+        click.echo('every query uses an index')
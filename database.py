@@ -0,0 +1,53 @@
+import os
+from sqlalchemy import event
+
+# applied to every new sqlite connection
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),        # readers don't block the writer and vice versa
+    ('synchronous', 'NORMAL'),      # safe with WAL, far fewer fsyncs than FULL
+    ('busy_timeout', 15000),        # wait up to 15s for a write lock instead of 'database is locked'
+    ('cache_size', -64000),         # 64mb page cache per connection
+    ('mmap_size', 268435456),       # 256mb memory-mapped reads
+    ('temp_store', 'MEMORY'),
+)
+
+ENGINE_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'pool_recycle': 3600,
+    'connect_args': {'timeout': 15},
+}
+
+
+def configure_database(app):
+    # call before db.init_app so the engine is built with these options
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in ENGINE_OPTIONS.items():
+        options.setdefault(key, value)
+
+
+def apply_pragmas(engine):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def init_migrate(app):
+    """Set up Flask-Migrate for `flask db` / `flask bootstrap`.
+
+    Called by those commands, not by create_app: alembic is slow to import and
+    serving requests never needs it.
+    """
+    if 'migrate' not in app.extensions:
+        from flask_migrate import Migrate
+        from models import db
+        migrations = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+        Migrate(app, db, directory=migrations, render_as_batch=True)  # batch mode so alembic can alter sqlite tables
+    return app.extensions['migrate']
@@ -0,0 +1,129 @@
+import json
+import time
+import threading
+from flask import current_app
+from models import db, ParkingLot
+
+KEEPALIVE_SECONDS = 15
+BACKLOG = 16  # messages kept for a subscriber that is not reading, older ones are dropped
+
+
+class Subscriber:
+    # kept small on purpose, an idle connection holds nothing else in the hub
+    __slots__ = ('prefix', 'messages')
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.messages = []
+
+
+class AvailabilityHub:
+    """In-process pub/sub for lot availability.
+
+    Writers call publish(lot_id) after committing, which only marks the lot dirty.
+    Once per interval a flusher thread reads the current counts of every dirty lot
+    in one query and hands each subscriber a single message with the lots under its
+    pincode prefix, so a burst of bookings becomes at most one update per lot per
+    interval. The flusher only runs while someone is subscribed. Changes made by
+    other processes are not seen.
+    """
+
+    def __init__(self, app, interval=1.0):
+        self.app = app
+        self.interval = interval
+        self._dirty = set()
+        self._subscribers = {}  # prefix -> set of Subscriber
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)  # one for everyone, not one per subscriber
+        self._thread = None
+
+    def publish(self, lot_id):
+        if self._subscribers:
+            with self._lock:
+                self._dirty.add(lot_id)
+
+    def subscribe(self, prefix=''):
+        subscriber = Subscriber(prefix)
+        with self._lock:
+            self._subscribers.setdefault(prefix, set()).add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='events', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            group = self._subscribers.get(subscriber.prefix)
+            if group is not None:
+                group.discard(subscriber)
+                if not group:
+                    del self._subscribers[subscriber.prefix]
+
+    def next_message(self, subscriber, timeout):
+        """Next message for the subscriber, or None if nothing arrived within `timeout` seconds."""
+        with self._changed:
+            if not subscriber.messages:
+                self._changed.wait(timeout)
+            return subscriber.messages.pop(0) if subscriber.messages else None
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(group) for group in self._subscribers.values())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._dirty.clear()
+                    self._thread = None
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f'Error pushing availability: {e}')
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+        with self.app.app_context():
+            rows = db.session.execute(
+                db.select(ParkingLot.id, ParkingLot.Pincode, ParkingLot.Available_Count, ParkingLot.Occupied_Count)
+                .where(ParkingLot.id.in_(dirty))
+            ).all()
+            db.session.remove()
+        deltas = [(pincode, {'lot_id': lot_id, 'available': available, 'occupied': occupied})
+                  for lot_id, pincode, available, occupied in rows]
+        # deleted lots have no pincode left to filter on, everyone hears about them
+        gone = [{'lot_id': lot_id, 'available': 0, 'occupied': 0, 'removed': True}
+                for lot_id in dirty - {row.id for row in rows}]
+        sent = 0
+        with self._changed:
+            for prefix, group in self._subscribers.items():
+                matching = [delta for pincode, delta in deltas if pincode.startswith(prefix)] + gone
+                if not matching:
+                    continue
+                message = format_event(matching)  # encoded once per prefix, not per subscriber
+                for subscriber in group:
+                    subscriber.messages.append(message)
+                    if len(subscriber.messages) > BACKLOG:
+                        del subscriber.messages[0]
+                sent += len(group)
+            self._changed.notify_all()
+        return sent
+
+
+def format_event(deltas, event='availability'):
+    return f'event: {event}\ndata: {json.dumps(deltas, separators=(",", ":"))}\n\n'
+
+
+def publish(lot_id):
+    current_app.extensions['events'].publish(lot_id)
+
+
+def init_events(app):
+    hub = AvailabilityHub(app, interval=app.config.get('EVENTS_INTERVAL', 1.0))
+    app.extensions['events'] = hub
+    return hub
@@ -0,0 +1,149 @@
+import io
+import csv
+from datetime import timedelta
+from models import db, Reservation, ReservationArchive, ParkingSpot, ParkingLot, User
+from billing import to_local, local_day_start
+
+CHUNK_ROWS = 1000
+FORMATS = ('csv', 'parquet', 'arrow')
+
+# (name, type): 'utc' columns are stored as naive utc and written out in local time
+RESERVATION_COLUMNS = (
+    ('id', 'int64'), ('lot_id', 'int64'), ('location', 'string'), ('spot_id', 'int64'),
+    ('user_id', 'int64'), ('email', 'string'), ('status', 'string'), ('in_time', 'utc'),
+    ('out_time', 'utc'), ('hours', 'float64'), ('total_cost', 'float64'),
+)
+LOT_COLUMNS = (
+    ('id', 'int64'), ('location', 'string'), ('address', 'string'), ('pincode', 'string'),
+    ('price', 'float64'), ('max_spots', 'int64'), ('max_time', 'int64'),
+    ('available', 'int64'), ('occupied', 'int64'), ('created_at', 'timestamp'),
+)
+
+
+def load_pyarrow():
+    # imported on first use rather than at startup
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:  # csv works without it, parquet/arrow answer 400
+        return None
+    return pyarrow
+
+
+def reservation_rows(start=None, end=None, lot_id=None):
+    """Reservations with their lot and user, oldest first, archived ones included.
+
+    start/end are local dates (both inclusive) matched against in_time.
+    """
+    def rows_from(model, lot_column, *joins):
+        hours = db.func.round((db.func.julianday(model.out_time) - db.func.julianday(model.in_time)) * 24, 4)
+        query = db.select(
+            model.id, lot_column.label('lot_id'), ParkingLot.Location, model.spot_id,
+            model.user_id, User.Email, model.status, model.in_time,
+            model.out_time, hours.label('hours'), model.total_cost
+        ).select_from(model)
+        for target, on in joins:
+            query = query.join(target, on)
+        query = query.join(ParkingLot, lot_column == ParkingLot.id).outerjoin(User, model.user_id == User.id)
+        if start:
+            query = query.where(model.in_time >= local_day_start(start))
+        if end:
+            query = query.where(model.in_time < local_day_start(end + timedelta(days=1)))
+        if lot_id:
+            query = query.where(lot_column == lot_id)
+        return query
+
+    rows = db.union_all(
+        rows_from(Reservation, ParkingSpot.lot_id, (ParkingSpot, Reservation.spot_id == ParkingSpot.id)),
+        rows_from(ReservationArchive, ReservationArchive.lot_id)
+    ).subquery()
+    return _stream(db.select(rows).order_by(rows.c.in_time, rows.c.id))
+
+
+def lot_rows(lot_id=None):
+    query = db.select(
+        ParkingLot.id, ParkingLot.Location, ParkingLot.Address, ParkingLot.Pincode,
+        ParkingLot.Price, ParkingLot.Max_Spots, ParkingLot.Max_Time,
+        ParkingLot.Available_Count, ParkingLot.Occupied_Count, ParkingLot.Created_at
+    ).order_by(ParkingLot.id)
+    if lot_id:
+        query = query.where(ParkingLot.id == lot_id)
+    return _stream(query)
+
+
+def _stream(query):
+    # server side cursor, only CHUNK_ROWS rows are held at a time
+    result = db.session.execute(query.execution_options(yield_per=CHUNK_ROWS))
+    for partition in result.partitions():
+        yield partition
+
+
+def to_csv(columns, chunks):
+    """Yield the csv text one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    utc = [i for i, (_, kind) in enumerate(columns) if kind == 'utc']
+    for chunk in chunks:
+        for row in chunk:
+            row = list(row)
+            for i in utc:
+                row[i] = to_local(row[i]).isoformat(sep=' ', timespec='seconds') if row[i] else ''
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def to_columnar(columns, chunks, fmt):
+    """Yield a parquet file (a row group per chunk) or an arrow ipc stream (a record batch per chunk)."""
+    pa = load_pyarrow()
+    schema = pa.schema([(name, _arrow_type(pa, kind)) for name, kind in columns])
+    sink = _Sink()
+    writer = pa.parquet.ParquetWriter(sink, schema) if fmt == 'parquet' else pa.ipc.new_stream(sink, schema)
+    for chunk in chunks:
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)],
+            schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _arrow_type(pa, kind):
+    if kind == 'utc':
+        return pa.timestamp('us', tz='UTC')
+    if kind == 'timestamp':
+        return pa.timestamp('us')
+    return pa.type_for_alias(kind)
+
+
+class _Sink:
+    # write-only file for pyarrow, drain() hands back what was written since the last call
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
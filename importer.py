@@ -0,0 +1,319 @@
+"""Bulk import of lots (with their spots) and users from csv.
+
+The file is read a chunk of CHUNK_ROWS rows at a time and each chunk is
+validated, inserted and committed on its own, so memory stays flat however
+long the file is and a bad row only costs that row. Imported users get their
+passwords hashed outside the write transaction: on a process pool from the
+cli, on the importing thread for uploads.
+
+    flask --app app import-csv lots lots.csv
+    flask --app app import-csv users users.csv --workers 8
+
+or upload the file at /admin/import, which runs it on a background thread.
+"""
+import os
+import csv
+import math
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.security import generate_password_hash
+from models import db, ParkingLot, ParkingSpot, User
+from provisioning import BATCH_SIZE
+from nearby import lot_index
+from schedule import slot_index
+from occupancy import spot_map
+from events import publish
+
+CHUNK_ROWS = 5000
+MAX_ERRORS = 100  # kept per import for the admin page, the cli prints every one
+MAX_SPOTS = 10000  # per lot, anything above is taken for a typo
+KEEP_IMPORTS = 20
+KINDS = ('lots', 'users')
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')  # werkzeug hashes, taken as they are from a password_hash column
+
+# csv header (lower case, spaces as underscores) -> (column, required)
+LOT_COLUMNS = {
+    'location': ('Location', True), 'address': ('Address', True), 'pincode': ('Pincode', True),
+    'price': ('Price', True), 'max_spots': ('Max_Spots', True), 'max_time': ('Max_Time', False),
+}
+USER_COLUMNS = {
+    'name': ('Name', True), 'email': ('Email', True), 'password': ('Password', False),
+    'password_hash': ('Password_Hash', False), 'pincode': ('Pincode', True), 'address': ('Address', False),
+    'phone': ('Phone', False), 'vehicle_number': ('Vehicle_Number', False),
+}
+
+
+class ImportReport:
+    """Counters and the first MAX_ERRORS errors of one import, updated after every chunk."""
+
+    def __init__(self, kind, filename=''):
+        self.kind = kind
+        self.filename = filename
+        self.rows = 0
+        self.imported = 0
+        self.spots = 0
+        self.chunks = 0
+        self.error_count = 0
+        self.errors = []  # (line, message), the first MAX_ERRORS
+        self.chunk_errors = []  # all of the current chunk's
+        self.ignored_columns = []
+        self.started_at = time.time()
+        self.finished_at = None
+        self.failed = None
+
+    def error(self, line, message):
+        self.error_count += 1
+        self.chunk_errors.append((line, message))
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def running(self):
+        return self.finished_at is None
+
+    def summary(self):
+        line = f'{self.kind}: {self.rows} row(s) read, {self.imported} imported'
+        if self.kind == 'lots':
+            line += f' with {self.spots} spot(s)'
+        return line + f', {self.error_count} rejected'
+
+
+def read_chunks(stream, columns, report):
+    """Yield lists of (line number, row) with the headers mapped to model column names."""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError('the file is empty')
+    names = [name.strip().lower().replace(' ', '_') for name in header]
+    missing = [column for key, (column, required) in columns.items() if required and key not in names]
+    if missing:
+        raise ValueError(f'missing column(s): {", ".join(missing)}')
+    report.ignored_columns = [name for name in header if name.strip().lower().replace(' ', '_') not in columns]
+    fields = [(i, columns[name][0]) for i, name in enumerate(names) if name in columns]
+    chunk = []
+    for row in reader:
+        if not any(row):
+            continue
+        chunk.append((reader.line_num, {column: row[i].strip() if i < len(row) else '' for i, column in fields}))
+        if len(chunk) == CHUNK_ROWS:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _text(row, column, max_length, required=True):
+    value = row.get(column, '')
+    if required and not value:
+        raise ValueError(f'{column} is required')
+    if len(value) > max_length:
+        raise ValueError(f'{column} is longer than {max_length} characters')
+    return value
+
+
+def _number(row, column, kind, minimum, maximum=None, default=None):
+    value = row.get(column, '')
+    if not value and default is not None:
+        return default
+    try:
+        number = kind(value)
+    except ValueError:
+        raise ValueError(f'{column} {value!r} is not a number') from None
+    if not math.isfinite(number) or number < minimum or (maximum is not None and number > maximum):
+        raise ValueError(f'{column} {value!r} is out of range')
+    return number
+
+
+def validate_lot(row):
+    max_spots = _number(row, 'Max_Spots', int, 1, MAX_SPOTS)
+    return {
+        'Location': _text(row, 'Location', 200),
+        'Address': _text(row, 'Address', 10000),
+        'Pincode': _text(row, 'Pincode', 10),
+        'Price': _number(row, 'Price', float, 0),
+        'Max_Spots': max_spots,
+        'Max_Time': _number(row, 'Max_Time', int, 1, default=60),  # add_lot's default
+        'Available_Count': max_spots,
+        'Occupied_Count': 0,
+    }
+
+
+def validate_user(row):
+    email = _text(row, 'Email', 120)
+    if '@' not in email:
+        raise ValueError(f'Email {email!r} is not an email address')
+    password_hash = row.get('Password_Hash', '')
+    if password_hash and not password_hash.startswith(HASH_PREFIXES):
+        raise ValueError('Password_Hash is not a werkzeug password hash')
+    if not password_hash and not row.get('Password'):
+        raise ValueError('Password (or Password_Hash) is required')
+    return {
+        'Name': _text(row, 'Name', 100),
+        'Email': email,
+        'Password': password_hash or None,  # hashed later, in the pool
+        'Pincode': _text(row, 'Pincode', 10),
+        'Address': row.get('Address', ''),
+        'Phone': _text(row, 'Phone', 15, required=False),
+        'Vehicle_Number': _text(row, 'Vehicle_Number', 20, required=False),
+    }, row.get('Password', '')
+
+
+def _validate(chunk, validate, report):
+    valid = []
+    for line, row in chunk:
+        try:
+            valid.append((line, validate(row)))
+        except ValueError as e:
+            report.error(line, str(e))
+    return valid
+
+
+def import_lots(stream, created_by=None, progress=None, report=None):
+    """Insert the lots in the csv, each with Max_Spots free spots."""
+    report = report or ImportReport('lots')
+    lots, spots = ParkingLot.__table__, ParkingSpot.__table__
+    for chunk in read_chunks(stream, LOT_COLUMNS, report):
+        valid = _validate(chunk, validate_lot, report)
+        if valid:
+            version = time.time_ns() // 1000000  # as add_lot: sqlite can reuse a deleted lot's id
+            rows = [dict(row, Created_by=created_by, Version=version) for _, row in valid]
+            lot_ids = db.session.execute(
+                lots.insert().returning(lots.c.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+            spot_rows = ({'lot_id': lot_id, 'status': 'A'}
+                         for lot_id, row in zip(lot_ids, rows) for _ in range(row['Max_Spots']))
+            while batch := list(islice(spot_rows, BATCH_SIZE)):
+                db.session.execute(spots.insert(), batch)
+            db.session.commit()
+            report.spots += sum(row['Max_Spots'] for row in rows)
+            report.imported += len(lot_ids)
+            lot_index.invalidate()
+            spot_map.invalidate()
+            slot_index.reload_lots(lot_ids)
+            for lot_id in lot_ids:
+                publish(lot_id)
+        _chunk_done(report, chunk, progress)
+    return report
+
+
+def import_users(stream, workers=None, progress=None, report=None):
+    """Insert the users in the csv, skipping emails that are already registered.
+
+    With `workers` > 1 the passwords are hashed on that many processes. Those
+    are spawned, and spawn re-imports the entry script, so only do that from
+    one that doesn't build the app on import (the flask cli); a web worker
+    hashes on its own thread (workers=None).
+    """
+    report = report or ImportReport('users')
+    table = User.__table__
+    pool = None
+    if workers and workers > 1:
+        # not fork: the parent has threads running (jobs, events, sweeper) whose locks a child could inherit held
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for chunk in read_chunks(stream, USER_COLUMNS, report):
+            valid = _validate(chunk, validate_user, report)
+            seen = set(db.session.execute(
+                db.select(User.Email).where(User.Email.in_([row['Email'] for _, (row, _) in valid]))
+            ).scalars()) if valid else set()
+            rows, passwords = [], []
+            for line, (row, password) in valid:
+                if row['Email'] in seen:
+                    report.error(line, f'{row["Email"]} is already registered')
+                    continue
+                seen.add(row['Email'])
+                rows.append(row)
+                if row['Password'] is None:
+                    passwords.append(password)
+            # hashing is the slow part, done before the insert so the write lock is held only for the insert
+            if pool:
+                hashes = iter(pool.map(generate_password_hash, passwords, chunksize=max(len(passwords) // 64, 1)))
+            else:
+                hashes = map(generate_password_hash, passwords)
+            for row in rows:
+                if row['Password'] is None:
+                    row['Password'] = next(hashes)
+            if rows:
+                # an email registered since the check above is skipped rather than failing the chunk
+                inserted = db.session.execute(insert(table).on_conflict_do_nothing(), rows).rowcount
+                db.session.commit()
+                report.imported += inserted
+                for _ in range(len(rows) - inserted):
+                    report.error(None, 'skipped, the email registered while this chunk was being imported')
+            _chunk_done(report, chunk, progress)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    return report
+
+
+def _chunk_done(report, chunk, progress):
+    report.rows += len(chunk)
+    report.chunks += 1
+    if progress:
+        progress(report, chunk[-1][0])
+    report.chunk_errors = []
+
+
+def run_import(kind, path, created_by=None, workers=None, progress=None, report=None):
+    """Import the csv at `path` (kind 'lots' or 'users'). Needs an app context."""
+    if kind not in KINDS:
+        raise ValueError(f'kind must be one of {", ".join(KINDS)}')
+    report = report or ImportReport(kind, os.path.basename(path))
+    # utf-8-sig: spreadsheets tend to save a BOM in front of the header
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        try:
+            if kind == 'lots':
+                import_lots(stream, created_by=created_by, progress=progress, report=report)
+            else:
+                import_users(stream, workers=workers, progress=progress, report=report)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            db.session.rollback()
+            report.failed = str(e)  # chunks before this one stay imported
+        finally:
+            report.finished_at = time.time()
+    return report
+
+
+# uploads from /admin/import run on a thread of their own, newest first here for the page
+imports = OrderedDict()
+_imports_lock = threading.Lock()
+
+
+def start_import(app, kind, path, filename, created_by=None):
+    """Run an uploaded file's import in the background; the file is removed afterwards."""
+    report = ImportReport(kind, filename)
+    with _imports_lock:
+        imports[id(report)] = report
+        imports.move_to_end(id(report), last=False)
+        while len(imports) > KEEP_IMPORTS:
+            imports.popitem()
+    threading.Thread(target=_import_in, args=(app, kind, path, created_by, report),
+                     name='csv-import', daemon=True).start()
+    return report
+
+
+def _import_in(app, kind, path, created_by, report):
+    def progress(report, line):
+        print(f'Import {report.filename}: up to line {line}, {report.summary()}')
+
+    try:
+        with app.app_context():
+            run_import(kind, path, created_by=created_by, progress=progress, report=report)
+    except Exception as e:
+        report.failed = str(e)
+        report.finished_at = time.time()
+        print(f'Error importing {report.filename}: {e}')
+    finally:
+        # it holds passwords in the clear
+        os.remove(path)
+
+
+def recent_imports():
+    with _imports_lock:
+        return list(imports.values())
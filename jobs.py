@@ -0,0 +1,229 @@
+import json
+import queue
+import atexit
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from zoneinfo import ZoneInfo
+from models import db, Contact, User, OutboxMessage
+
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=5)  # 'processing' rows older than this were lost by a dead worker
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(f):
+        HANDLERS[kind] = f
+        return f
+    return register
+
+
+class JobQueue:
+    """Bounded in-process queue in front of the outbox table.
+
+    Requests call enqueue() and return straight away. Worker threads take jobs off
+    the queue in batches, insert them into the outbox in one go and run their
+    handlers. When the queue is full the job is written to the outbox from the
+    request thread instead (slower, but nothing is dropped) and the workers pick
+    it up from there, as they do with anything left over from a crash.
+    """
+
+    def __init__(self, app, workers=1, capacity=1000, batch_size=100, poll_seconds=1.0):
+        self.app = app
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._queue = queue.Queue(maxsize=capacity)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = dict(enqueued=0, overflowed=0, processed=0, failed=0, max_depth=0)
+        self._outbox_ready = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f'jobs-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def enqueue(self, kind, payload):
+        if kind not in HANDLERS:
+            raise ValueError(f'no handler for job kind {kind!r}')
+        if not self._threads:
+            # no workers configured, run inline
+            self._store_and_process([(kind, payload)])
+            return
+        try:
+            self._queue.put_nowait((kind, payload))
+            self._count('enqueued', depth=self._queue.qsize())
+        except queue.Full:
+            db.session.add(OutboxMessage(kind=kind, payload=json.dumps(payload)))
+            db.session.commit()
+            self._count('overflowed')
+
+    def enqueue_many(self, kind, payloads):
+        """enqueue() for a batch; whatever doesn't fit goes to the outbox in one insert."""
+        if kind not in HANDLERS:
+            raise ValueError(f'no handler for job kind {kind!r}')
+        payloads = list(payloads)
+        if not self._threads:
+            self._store_and_process([(kind, payload) for payload in payloads])
+            return
+        overflow = []
+        for payload in payloads:
+            try:
+                self._queue.put_nowait((kind, payload))
+                self._count('enqueued', depth=self._queue.qsize())
+            except queue.Full:
+                overflow.append({'kind': kind, 'payload': json.dumps(payload), 'status': 'pending', 'attempts': 0})
+        if overflow:
+            db.session.execute(OutboxMessage.__table__.insert(), overflow)
+            db.session.commit()
+            self._count('overflowed', len(overflow))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, depth=self._queue.qsize(), capacity=self.capacity)
+
+    def shutdown(self, timeout=10):
+        """Stop taking work and let the workers finish what is queued."""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _count(self, name, amount=1, depth=None):
+        with self._lock:
+            self._counters[name] += amount
+            if depth is not None and depth > self._counters['max_depth']:
+                self._counters['max_depth'] = depth
+
+    def _take_batch(self):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.poll_seconds))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        stale_released = False
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._take_batch()
+            with self.app.app_context():
+                try:
+                    if batch:
+                        self._store_and_process(batch)
+                    elif self._outbox_exists():
+                        if not stale_released:
+                            self._release_stale()
+                            stale_released = True
+                        self._process(self._claim_pending())
+                except Exception as e:
+                    db.session.rollback()
+                    print(f'Job worker error: {e}')
+
+    def _outbox_exists(self):
+        # the app also starts for `flask db upgrade` and tests, before there are any tables to poll
+        if not self._outbox_ready:
+            self._outbox_ready = db.inspect(db.engine).has_table(OutboxMessage.__tablename__)
+        return self._outbox_ready
+
+    def _store_and_process(self, batch):
+        messages = [OutboxMessage(kind=kind, payload=json.dumps(payload), status='processing') for kind, payload in batch]
+        db.session.add_all(messages)
+        db.session.commit()
+        self._process(messages)
+
+    def _claim_pending(self):
+        ids = [
+            message_id for (message_id,) in
+            db.session.query(OutboxMessage.id)
+            .filter(OutboxMessage.status == 'pending')
+            .order_by(OutboxMessage.id)
+            .limit(self.batch_size)
+            .all()
+        ]
+        claimed = []
+        for message_id in ids:
+            # another worker may have claimed it since the select
+            if OutboxMessage.query.filter_by(id=message_id, status='pending').update(
+                    {OutboxMessage.status: 'processing'}, synchronize_session=False):
+                claimed.append(message_id)
+        db.session.commit()
+        return OutboxMessage.query.filter(OutboxMessage.id.in_(claimed)).all() if claimed else []
+
+    def _process(self, messages):
+        for message in messages:
+            try:
+                HANDLERS[message.kind](json.loads(message.payload))
+                message.status = 'done'
+                message.attempts += 1
+                db.session.commit()
+                self._count('processed')
+            except Exception as e:
+                db.session.rollback()
+                message.attempts += 1
+                message.error = str(e)
+                message.status = 'failed' if message.attempts >= MAX_ATTEMPTS else 'pending'
+                db.session.commit()
+                self._count('failed')
+                print(f'Job {message.id} ({message.kind}) failed: {e}')
+
+    def _release_stale(self):
+        cutoff = datetime.now(ZoneInfo("Asia/Kolkata")) - STALE_AFTER
+        OutboxMessage.query.filter(
+            OutboxMessage.status == 'processing', OutboxMessage.updated_at < cutoff
+        ).update({OutboxMessage.status: 'pending'}, synchronize_session=False)
+        db.session.commit()
+
+
+def enqueue(kind, payload):
+    current_app.extensions['jobs'].enqueue(kind, payload)
+
+
+def enqueue_many(kind, payloads):
+    current_app.extensions['jobs'].enqueue_many(kind, payloads)
+
+
+def init_jobs(app):
+    jobs = JobQueue(
+        app,
+        workers=app.config.get('JOBS_WORKERS', 1),
+        capacity=app.config.get('JOBS_QUEUE_SIZE', 1000),
+        batch_size=app.config.get('JOBS_BATCH_SIZE', 100)
+    )
+    app.extensions['jobs'] = jobs
+    atexit.register(jobs.shutdown)
+    return jobs
+
+
+########################################## Handlers ##########################################
+
+
+@handler('contact')
+def save_contact(payload):
+    db.session.add(Contact(
+        First_Name=payload['name'],
+        Email=payload['email'],
+        Phone=payload['phone'],
+        Subject=payload['subject'],
+        Message=payload['message']
+    ))
+    user = User.query.filter_by(Email=payload['email']).first()
+    if user:
+        print(f'Message from {user.Name}: {payload["subject"]}')
+    else:
+        print(f'Message from unregistered user: {payload["name"]}')
+
+
+@handler('booking_confirmation')
+def send_booking_confirmation(payload):
+    print(f'Booking confirmation for user {payload["user_id"]}: spot {payload["spot_id"]} in lot {payload["lot_id"]}')
+
+
+@handler('release_receipt')
+def send_release_receipt(payload):
+    print(f'Release receipt for user {payload["user_id"]}: reservation {payload["reservation_id"]}, cost {payload["total_cost"]}')
@@ -0,0 +1,108 @@
+import time
+import threading
+from collections import defaultdict
+from flask import g, request, session, redirect, url_for, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from models import db
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+QUERY_BUDGET = 25  # more than this per request is almost always an n+1
+JOB_COUNTERS = ('enqueued', 'overflowed', 'processed', 'failed')  # JobQueue.stats() keys that only ever go up
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = defaultdict(lambda: [[0] * len(buckets), 0.0, 0])  # endpoint -> [bucket counts, sum, count]
+
+    def observe(self, endpoint, value):
+        with self._lock:
+            series = self._series[endpoint]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for endpoint, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{endpoint="{endpoint}"}} {total}')
+                lines.append(f'{self.name}_count{{endpoint="{endpoint}"}} {count}')
+        return lines
+
+
+request_seconds = Histogram('parking_request_duration_seconds', 'Total request latency.', SECONDS_BUCKETS)
+sql_seconds = Histogram('parking_sql_duration_seconds', 'Time spent in SQL per request.', SECONDS_BUCKETS)
+template_seconds = Histogram('parking_template_duration_seconds', 'Time spent rendering templates per request.', SECONDS_BUCKETS)
+request_queries = Histogram('parking_request_queries', 'SQL statements executed per request.', QUERY_BUCKETS)
+HISTOGRAMS = (request_seconds, sql_seconds, template_seconds, request_queries)
+
+
+def init_metrics(app):
+    """Record per-endpoint latency, sql and template cost and serve it at /admin/metrics.
+    Needs an app context (for db.engine); create_app only calls it when METRICS_ENABLED is set."""
+
+    @event.listens_for(db.engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.metrics_sql_started = time.perf_counter()
+
+    @event.listens_for(db.engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics_sql_started' in g:
+            g.metrics_sql_seconds = g.get('metrics_sql_seconds', 0) + time.perf_counter() - g.pop('metrics_sql_started')
+            g.metrics_queries = g.get('metrics_queries', 0) + 1
+
+    def before_render(sender, template, context, **extra):
+        g.metrics_template_started = time.perf_counter()
+
+    def after_render(sender, template, context, **extra):
+        if 'metrics_template_started' in g:
+            g.metrics_template_seconds = g.get('metrics_template_seconds', 0) + time.perf_counter() - g.pop('metrics_template_started')
+
+    before_render_template.connect(before_render, app, weak=False)
+    template_rendered.connect(after_render, app, weak=False)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if 'metrics_started' not in g:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        queries = g.get('metrics_queries', 0)
+        request_seconds.observe(endpoint, time.perf_counter() - g.metrics_started)
+        sql_seconds.observe(endpoint, g.get('metrics_sql_seconds', 0))
+        template_seconds.observe(endpoint, g.get('metrics_template_seconds', 0))
+        request_queries.observe(endpoint, queries)
+        if queries > app.config.get('METRICS_QUERY_BUDGET', QUERY_BUDGET):
+            app.logger.warning('possible n+1: %s ran %d queries (%s %s)', endpoint, queries, request.method, request.path)
+        return response
+
+    @app.route('/admin/metrics')
+    def admin_metrics():
+        if not session.get('admin_logged_in'):
+            return redirect(url_for('main.admin_login'))
+        lines = []
+        for histogram in HISTOGRAMS:
+            lines += histogram.render()
+        if 'jobs' in app.extensions:
+            for name, value in sorted(app.extensions['jobs'].stats().items()):
+                if name in JOB_COUNTERS:
+                    lines.append(f'# TYPE parking_jobs_{name}_total counter')
+                    lines.append(f'parking_jobs_{name}_total {value}')
+                else:
+                    lines.append(f'# TYPE parking_jobs_{name} gauge')
+                    lines.append(f'parking_jobs_{name} {value}')
+        return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -0,0 +1,87 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('Name', sa.String(length=100), nullable=False),
+    sa.Column('Email', sa.String(length=120), nullable=False),
+    sa.Column('Password', sa.String(length=200), nullable=False),
+    sa.Column('Pincode', sa.String(length=10), nullable=False),
+    sa.Column('Address', sa.Text(), nullable=True),
+    sa.Column('Phone', sa.String(length=15), nullable=True),
+    sa.Column('Vehicle_Number', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('Email')
+    )
+    op.create_table('contact',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('First_Name', sa.String(length=100), nullable=False),
+    sa.Column('Last_Name', sa.String(length=100), nullable=True),
+    sa.Column('Email', sa.String(length=120), nullable=False),
+    sa.Column('Phone', sa.String(length=15), nullable=True),
+    sa.Column('Subject', sa.String(length=200), nullable=False),
+    sa.Column('Message', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('parking_lot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('Location', sa.String(length=200), nullable=False),
+    sa.Column('Address', sa.Text(), nullable=False),
+    sa.Column('Pincode', sa.String(length=10), nullable=False),
+    sa.Column('Price', sa.Float(), nullable=False),
+    sa.Column('Max_Spots', sa.Integer(), nullable=False),
+    sa.Column('Created_by', sa.Integer(), nullable=True),
+    sa.Column('Created_at', sa.DateTime(), nullable=True),
+    sa.Column('Max_Time', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['Created_by'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('parking_spot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=1), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['lot_id'], ['parking_lot.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('reservation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('in_time', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('out_time', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('total_cost', sa.Float(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.ForeignKeyConstraint(['spot_id'], ['parking_spot.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('reservation')
+    op.drop_table('parking_spot')
+    op.drop_table('parking_lot')
+    op.drop_table('contact')
+    op.drop_table('user')
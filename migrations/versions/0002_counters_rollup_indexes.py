@@ -0,0 +1,65 @@
+"""lot counters, daily rollup table and query indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases made by an older create_app() may already have the rollup table
+    inspector = sa.inspect(op.get_bind())
+
+    with op.batch_alter_table('parking_lot', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('Available_Count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('Occupied_Count', sa.Integer(), server_default='0', nullable=False))
+
+    if not inspector.has_table('reservation_daily_stats'):
+        op.create_table('reservation_daily_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('lot_id', sa.Integer(), nullable=False),
+        sa.Column('reservations', sa.Integer(), nullable=False),
+        sa.Column('completed', sa.Integer(), nullable=False),
+        sa.Column('cancelled', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.Column('parked_hours', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'lot_id')
+        )
+
+    op.create_index('ix_parking_lot_location', 'parking_lot', [sa.text('"Location" COLLATE NOCASE')], unique=False)
+    op.create_index('ix_parking_lot_pincode', 'parking_lot', [sa.text('"Pincode" COLLATE NOCASE')], unique=False)
+    op.create_index('ix_parking_spot_lot_status', 'parking_spot', ['lot_id', 'status'], unique=False)
+    op.create_index('ix_reservation_in_time', 'reservation', ['in_time'], unique=False)
+    op.create_index('ix_reservation_user_in_time', 'reservation', ['user_id', 'in_time'], unique=False)
+    op.create_index('ix_reservation_status_in_time', 'reservation', ['status', 'in_time'], unique=False)
+
+    # fill the new counters from the spots that already exist
+    op.execute(
+        "UPDATE parking_lot SET "
+        "\"Available_Count\" = (SELECT count(*) FROM parking_spot WHERE lot_id = parking_lot.id AND status = 'A'), "
+        "\"Occupied_Count\" = (SELECT count(*) FROM parking_spot WHERE lot_id = parking_lot.id AND status = 'O')"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_reservation_status_in_time', table_name='reservation')
+    op.drop_index('ix_reservation_user_in_time', table_name='reservation')
+    op.drop_index('ix_reservation_in_time', table_name='reservation')
+    op.drop_index('ix_parking_spot_lot_status', table_name='parking_spot')
+    op.drop_index('ix_parking_lot_pincode', table_name='parking_lot')
+    op.drop_index('ix_parking_lot_location', table_name='parking_lot')
+    op.drop_table('reservation_daily_stats')
+
+    with op.batch_alter_table('parking_lot', schema=None) as batch_op:
+        batch_op.drop_column('Occupied_Count')
+        batch_op.drop_column('Available_Count')
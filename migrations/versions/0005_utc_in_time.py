@@ -0,0 +1,34 @@
+"""store reservation.in_time in utc like out_time
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def shift(offset):
+    # only the 'YYYY-MM-DD HH:MM:SS' part moves; the '.ffffff' sqlalchemy writes (and compares against) is kept,
+    # datetime() would drop it and keyset cursors would then repeat rows at page boundaries
+    return (
+        f"UPDATE reservation SET in_time = strftime('%Y-%m-%d %H:%M:%S', in_time, {offset}) || "
+        "CASE WHEN length(in_time) > 19 THEN substr(in_time, 20) ELSE '.000000' END "
+        "WHERE in_time IS NOT NULL"
+    )
+
+
+def upgrade():
+    # in_time used to be written as naive ist, everything is utc now (see billing.py)
+    op.execute(shift("'-5 hours', '-30 minutes'"))
+
+
+def downgrade():
+    op.execute(shift("'+5 hours', '+30 minutes'"))
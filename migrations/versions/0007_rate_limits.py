@@ -0,0 +1,34 @@
+"""rate limit counters, index on user name
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_limit_counter',
+    sa.Column('key', sa.String(length=200), nullable=False),
+    sa.Column('window', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key', 'window')
+    )
+    op.create_index('ix_rate_limit_counter_expires_at', 'rate_limit_counter', ['expires_at'], unique=False)
+    op.create_index('ix_user_name', 'user', ['Name'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_name', table_name='user')
+    op.drop_index('ix_rate_limit_counter_expires_at', table_name='rate_limit_counter')
+    op.drop_table('rate_limit_counter')
@@ -0,0 +1,28 @@
+"""NOCASE indexes for the admin user search
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_user_search_name', 'user', [sa.text('"Name" COLLATE NOCASE')], unique=False)
+    op.create_index('ix_user_search_email', 'user', [sa.text('"Email" COLLATE NOCASE')], unique=False)
+    op.create_index('ix_user_search_phone', 'user', [sa.text('"Phone" COLLATE NOCASE')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_search_phone', table_name='user')
+    op.drop_index('ix_user_search_email', table_name='user')
+    op.drop_index('ix_user_search_name', table_name='user')
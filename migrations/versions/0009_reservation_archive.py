@@ -0,0 +1,52 @@
+"""reservation archive and per user archived totals
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reservation_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('in_time', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('out_time', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('total_cost', sa.Float(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_reservation_archive_in_time', 'reservation_archive', ['in_time'], unique=False)
+    op.create_index('ix_reservation_archive_user_in_time', 'reservation_archive', ['user_id', 'in_time'], unique=False)
+    op.create_index('ix_reservation_archive_lot_id', 'reservation_archive', ['lot_id'], unique=False)
+    op.create_table('user_archive_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('reservations', sa.Integer(), nullable=False),
+    sa.Column('completed', sa.Integer(), nullable=False),
+    sa.Column('spent', sa.Float(), nullable=False),
+    sa.Column('parked_hours', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_archive_totals')
+    op.drop_index('ix_reservation_archive_lot_id', table_name='reservation_archive')
+    op.drop_index('ix_reservation_archive_user_in_time', table_name='reservation_archive')
+    op.drop_index('ix_reservation_archive_in_time', table_name='reservation_archive')
+    op.drop_table('reservation_archive')
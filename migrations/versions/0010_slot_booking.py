@@ -0,0 +1,46 @@
+"""advance slot bookings
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('slot_booking',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('total_cost', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('cancelled_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['spot_id'], ['parking_spot.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_slot_booking_spot_status_end', 'slot_booking', ['spot_id', 'status', 'end_time', 'start_time'], unique=False)
+    op.create_index('ix_slot_booking_user_start', 'slot_booking', ['user_id', 'start_time'], unique=False)
+    op.create_index('ix_slot_booking_status_end', 'slot_booking', ['status', 'end_time', 'spot_id', 'start_time'], unique=False)
+    op.create_index('ix_slot_booking_cancelled_at', 'slot_booking', ['cancelled_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_slot_booking_cancelled_at', table_name='slot_booking')
+    op.drop_index('ix_slot_booking_status_end', table_name='slot_booking')
+    op.drop_index('ix_slot_booking_user_start', table_name='slot_booking')
+    op.drop_index('ix_slot_booking_spot_status_end', table_name='slot_booking')
+    op.drop_table('slot_booking')
@@ -0,0 +1,31 @@
+"""saved spot occupancy bitmaps
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lot_spot_map',
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('spot_ids', sa.LargeBinary(), nullable=False),
+    sa.Column('bits', sa.LargeBinary(), nullable=False),
+    sa.Column('saved_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('lot_id')
+    )
+
+
+def downgrade():
+    op.drop_table('lot_spot_map')
@@ -0,0 +1,26 @@
+"""index reservation_archive by (lot_id, in_time, id) for per-lot exports
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # replaces the lot_id one, which it covers as a prefix
+    op.create_index('ix_reservation_archive_lot_in_time', 'reservation_archive', ['lot_id', 'in_time', 'id'], unique=False)
+    op.drop_index('ix_reservation_archive_lot_id', table_name='reservation_archive')
+
+
+def downgrade():
+    op.create_index('ix_reservation_archive_lot_id', 'reservation_archive', ['lot_id'], unique=False)
+    op.drop_index('ix_reservation_archive_lot_in_time', table_name='reservation_archive')
@@ -1,11 +1,16 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from zoneinfo import ZoneInfo
 from flask_sqlalchemy import SQLAlchemy
+from billing import utcnow, duration_hours
 
 db = SQLAlchemy()
 
 
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_name', 'Name'),  # the login forms accept a name as well as an email
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     Name = db.Column(db.String(100), nullable=False)
     Email = db.Column(db.String(120), unique=True, nullable=False)
@@ -25,6 +30,11 @@ class User(db.Model):
     def vehicle_number(self):
         return self.Vehicle_Number if self.Vehicle_Number else "No Vehicle"
 
+# NOCASE so the admin users page's prefix search (LIKE 'x%') can use them
+db.Index('ix_user_search_name', db.collate(User.Name, 'NOCASE'))
+db.Index('ix_user_search_email', db.collate(User.Email, 'NOCASE'))
+db.Index('ix_user_search_phone', db.collate(User.Phone, 'NOCASE'))
+
 
 class Contact(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,6 +60,11 @@ class ParkingLot(db.Model):
     Created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     Created_at = db.Column(db.DateTime, default=datetime.now(ZoneInfo("Asia/Kolkata")))
     Max_Time = db.Column(db.Integer, nullable=True)  # in minutes
+    # kept in step with ParkingSpot.status by the routes, rebuilt by `flask reconcile-counts`
+    Available_Count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    Occupied_Count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped on every change to the lot or its spots, cached lot cards are keyed on it
+    Version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     spots = db.relationship('ParkingSpot', backref='lot', lazy=True, cascade='all, delete-orphan')
 
@@ -58,11 +73,15 @@ class ParkingLot(db.Model):
 
     @property
     def available_spots(self):
-        return len([spot for spot in self.spots if spot.status == 'A'])
+        return self.Available_Count or 0
 
     @property
     def occupied_spots(self):
-        return len([spot for spot in self.spots if spot.status == 'O'])
+        return self.Occupied_Count or 0
+
+    @property
+    def total_spots(self):
+        return self.available_spots + self.occupied_spots
 
     @property
     def occupancy_percentage(self):
@@ -70,24 +89,53 @@ class ParkingLot(db.Model):
             return 0
         return (self.occupied_spots / self.Max_Spots) * 100
 
+    def refresh_counts(self):
+        counts = dict(
+            db.session.query(ParkingSpot.status, db.func.count(ParkingSpot.id))
+            .filter(ParkingSpot.lot_id == self.id)
+            .group_by(ParkingSpot.status)
+            .all()
+        )
+        self.Available_Count = counts.get('A', 0)
+        self.Occupied_Count = counts.get('O', 0)
+
+    def bump_version(self):
+        self.Version = ParkingLot.Version + 1
+
+# NOCASE so the dashboard's case-insensitive prefix search (LIKE 'x%') can use them
+db.Index('ix_parking_lot_location', db.collate(ParkingLot.Location, 'NOCASE'))
+db.Index('ix_parking_lot_pincode', db.collate(ParkingLot.Pincode, 'NOCASE'))
+
 class ParkingSpot(db.Model):
+    __table_args__ = (
+        db.Index('ix_parking_spot_lot_status', 'lot_id', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
     status = db.Column(db.String(1), nullable=False, default='A')
     created_at = db.Column(db.DateTime, default=datetime.now(ZoneInfo("Asia/Kolkata")))
     updated_at = db.Column(db.DateTime, default=datetime.now(ZoneInfo("Asia/Kolkata")), onupdate=datetime.now(ZoneInfo("Asia/Kolkata")))
     reservations = db.relationship('Reservation', backref='spot', lazy=True, cascade='all, delete-orphan')
+    slot_bookings = db.relationship('SlotBooking', backref='spot', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<ParkingSpot {self.id} - {self.status}>'
 
 
 class Reservation(db.Model):
+    __table_args__ = (
+        db.Index('ix_reservation_in_time', 'in_time'),
+        db.Index('ix_reservation_user_in_time', 'user_id', 'in_time'),
+        db.Index('ix_reservation_status_in_time', 'status', 'in_time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
-    in_time = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(ZoneInfo("Asia/Kolkata")))
+    # naive utc, see billing.py
+    in_time = db.Column(db.DateTime(timezone=True), default=utcnow)
     out_time = db.Column(db.DateTime(timezone=True), nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(ZoneInfo("Asia/Kolkata")))
     updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(ZoneInfo("Asia/Kolkata")), onupdate=lambda: datetime.now(ZoneInfo("Asia/Kolkata")))
@@ -97,11 +145,11 @@ class Reservation(db.Model):
     def __init__(self, spot_id, user_id):
         self.spot_id = spot_id
         self.user_id = user_id
-        self.in_time = datetime.now(ZoneInfo("Asia/Kolkata"))
+        self.in_time = utcnow()
         self.status = 'active'
     def complete_reservation(self, out_time=None, total_cost=None):
         if out_time is None:
-            out_time = datetime.now(ZoneInfo("Asia/Kolkata"))
+            out_time = utcnow()
         self.out_time = out_time
         self.total_cost = total_cost
         self.status = 'completed'
@@ -123,7 +171,154 @@ class Reservation(db.Model):
     @property
     def duration_hours(self):
         if self.out_time:
-            adjusted_out_time = self.out_time + timedelta(hours=5, minutes=30)
-            duration = adjusted_out_time - self.in_time
-            return round(duration.total_seconds() / 3600, 2)
+            return round(duration_hours(self.in_time, self.out_time), 2)
+        return
+
+
+class SlotBooking(db.Model):
+    # a spot held for a future [start_time, end_time), see schedule.py; walk-ins stay in Reservation
+    __table_args__ = (
+        # the overlap checks; status is in it too, so the planner doesn't go for the index below instead
+        db.Index('ix_slot_booking_spot_status_end', 'spot_id', 'status', 'end_time', 'start_time'),
+        db.Index('ix_slot_booking_user_start', 'user_id', 'start_time'),
+        # covers loading the upcoming ones, so slot_index reads no table rows
+        db.Index('ix_slot_booking_status_end', 'status', 'end_time', 'spot_id', 'start_time'),
+        db.Index('ix_slot_booking_cancelled_at', 'cancelled_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
+    lot_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # naive utc, like Reservation
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='booked')  # booked, cancelled
+    total_cost = db.Column(db.Float, nullable=True)  # quoted when booked
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    cancelled_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<SlotBooking {self.id} - Spot {self.spot_id} {self.start_time}>'
+
+
+class ReservationArchive(db.Model):
+    # completed and cancelled reservations moved out of Reservation by archive.py, ids kept.
+    # No foreign keys, admin_delete_lot clears a lot's rows by lot_id
+    __table_args__ = (
+        db.Index('ix_reservation_archive_in_time', 'in_time'),
+        db.Index('ix_reservation_archive_user_in_time', 'user_id', 'in_time'),
+        # per-lot exports read a lot's history in (in_time, id) order straight off it; admin_delete_lot uses the prefix
+        db.Index('ix_reservation_archive_lot_in_time', 'lot_id', 'in_time', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    spot_id = db.Column(db.Integer, nullable=False)
+    lot_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    in_time = db.Column(db.DateTime(timezone=True), nullable=True)  # naive utc like Reservation
+    out_time = db.Column(db.DateTime(timezone=True), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    total_cost = db.Column(db.Float, nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    # read only, so the summary templates can treat these like Reservation rows
+    spot = db.relationship('ParkingSpot', primaryjoin='foreign(ReservationArchive.spot_id) == ParkingSpot.id', viewonly=True)
+    user = db.relationship('User', primaryjoin='foreign(ReservationArchive.user_id) == User.id', viewonly=True)
+
+    def __repr__(self):
+        return f'<ReservationArchive {self.id} - User {self.user_id}>'
+
+    @property
+    def duration_hours(self):
+        if self.out_time:
+            return round(duration_hours(self.in_time, self.out_time), 2)
         return
+
+
+class UserArchiveTotals(db.Model):
+    # per user totals of what has been archived, so summaries don't have to add up the archive
+    user_id = db.Column(db.Integer, primary_key=True)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    spent = db.Column(db.Float, nullable=False, default=0)
+    parked_hours = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserArchiveTotals User {self.user_id}>'
+
+
+class ReservationDailyStats(db.Model):
+    # one row per lot per local day (by in_time), kept up to date by stats.py
+    day = db.Column(db.Date, primary_key=True)
+    lot_id = db.Column(db.Integer, primary_key=True)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    cancelled = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    parked_hours = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ReservationDailyStats {self.day} - Lot {self.lot_id}>'
+
+
+class OutboxMessage(db.Model):
+    # durable record of background jobs, written and worked off by jobs.py
+    __table_args__ = (
+        db.Index('ix_outbox_message_status_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # json
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(ZoneInfo("Asia/Kolkata")))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(ZoneInfo("Asia/Kolkata")), onupdate=lambda: datetime.now(ZoneInfo("Asia/Kolkata")))
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} - {self.kind} {self.status}>'
+
+
+class WebSession(db.Model):
+    # server side flask sessions (see sessions.py), the cookie only carries the id
+    __table_args__ = (
+        db.Index('ix_web_session_expires_at', 'expires_at'),
+    )
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)  # json
+    expires_at = db.Column(db.DateTime, nullable=False)  # utc
+
+    def __repr__(self):
+        return f'<WebSession {self.id[:8]}>'
+
+
+class RateLimitCounter(db.Model):
+    # hits per key per fixed window, for ratelimit.DatabaseStore when RATE_LIMIT_STORE is 'database'
+    __table_args__ = (
+        db.Index('ix_rate_limit_counter_expires_at', 'expires_at'),
+    )
+
+    key = db.Column(db.String(200), primary_key=True)
+    window = db.Column(db.Integer, primary_key=True)  # epoch seconds // window length
+    count = db.Column(db.Integer, nullable=False, default=0)
+    expires_at = db.Column(db.Integer, nullable=False)  # epoch seconds, after which the row is no use
+
+    def __repr__(self):
+        return f'<RateLimitCounter {self.key} - {self.window}>'
+
+
+class LotSpotMap(db.Model):
+    # occupancy.spot_map's bitmap of a lot as last saved, only trusted while `version` matches the lot's Version
+    lot_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    spot_ids = db.Column(db.LargeBinary, nullable=False)  # runs of consecutive ids, (first, count) int64 pairs
+    bits = db.Column(db.LargeBinary, nullable=False)  # one bit per spot in id order, set when occupied
+    saved_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f'<LotSpotMap {self.lot_id} - v{self.version}>'
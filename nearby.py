@@ -0,0 +1,91 @@
+import time
+import threading
+from bisect import bisect_left, insort
+from models import db, ParkingLot
+
+REFRESH_SECONDS = 5  # other workers' bookings show up within this long
+
+
+class LotIndex:
+    """Lots sorted by pincode with their free-spot counts, for the user dashboard.
+
+    Lookups start at the user's pincode and walk outwards in both directions, so
+    the closest lots come first and full lots are skipped without touching the db.
+    This process keeps it current through the update hooks below; changes made by
+    other workers are picked up by a full reload every REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []         # sorted (pincode, lot_id)
+        self._pincodes = {}     # lot_id -> pincode
+        self._available = {}    # lot_id -> free spots
+        self._loaded_at = None
+
+    def reload(self):
+        rows = db.session.query(ParkingLot.id, ParkingLot.Pincode, ParkingLot.Available_Count).all()
+        with self._lock:
+            self._keys = sorted((pincode, lot_id) for lot_id, pincode, _ in rows)
+            self._pincodes = {lot_id: pincode for lot_id, pincode, _ in rows}
+            self._available = {lot_id: available or 0 for lot_id, _, available in rows}
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def nearby(self, pincode, limit=20, prefix_len=2):
+        """Ids of up to `limit` lots with free spots sharing the first `prefix_len`
+        digits of `pincode`, closest pincode first."""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > REFRESH_SECONDS:
+            self.reload()
+        prefix = pincode[:prefix_len]
+        with self._lock:
+            keys, available = self._keys, self._available
+            right = bisect_left(keys, (pincode, -1))
+            left = right - 1
+            found = []
+            while len(found) < limit:
+                left_ok = left >= 0 and keys[left][0].startswith(prefix)
+                right_ok = right < len(keys) and keys[right][0].startswith(prefix)
+                if not left_ok and not right_ok:
+                    break
+                if left_ok and (not right_ok or _distance(pincode, keys[left][0]) <= _distance(pincode, keys[right][0])):
+                    lot_id, left = keys[left][1], left - 1
+                else:
+                    lot_id, right = keys[right][1], right + 1
+                if available.get(lot_id, 0) > 0:
+                    found.append(lot_id)
+            return found
+
+    # update hooks, called by the routes after their commit
+
+    def upsert(self, lot_id, pincode, available):
+        with self._lock:
+            old = self._pincodes.get(lot_id)
+            if old is not None and old != pincode:
+                self._keys.remove((old, lot_id))
+            if old != pincode:
+                insort(self._keys, (pincode, lot_id))
+            self._pincodes[lot_id] = pincode
+            self._available[lot_id] = available
+
+    def adjust(self, lot_id, delta):
+        with self._lock:
+            if lot_id in self._available:
+                self._available[lot_id] += delta
+
+    def remove(self, lot_id):
+        with self._lock:
+            pincode = self._pincodes.pop(lot_id, None)
+            if pincode is not None:
+                self._keys.remove((pincode, lot_id))
+            self._available.pop(lot_id, None)
+
+
+def _distance(a, b):
+    if a.isdigit() and b.isdigit():
+        return abs(int(a) - int(b))
+    return float('inf')
+
+
+lot_index = LotIndex()
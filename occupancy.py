@@ -0,0 +1,316 @@
+"""Spot status per lot as a bitmap, one bit per spot in id order, set while the spot is occupied.
+
+ParkingSpot stays the record. spot_map mirrors it so counting a lot's spots,
+finding its first free one and drawing its grid don't read a row per spot.
+Every write to a spot's status also bumps its lot's Version (allocator,
+sweeper, the admin routes), which is what keeps the two in step.
+"""
+import sys
+import time
+import threading
+from array import array
+from bisect import bisect_left
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert
+from models import db, ParkingLot, ParkingSpot, LotSpotMap
+from billing import utcnow
+
+REFRESH_SECONDS = 5  # other workers' changes show up within this long
+SAVE_SECONDS = 60  # how often changed bitmaps are written back to lot_spot_map
+CHUNK = 500
+
+# the 8 statuses a byte stands for, lowest bit first
+_BYTE_STATUSES = [''.join('O' if value >> bit & 1 else 'A' for bit in range(8)) for value in range(256)]
+
+
+class LotBitmap:
+    """Occupancy of one lot. Bit i (lowest bit of byte i // 8 first) is spot_ids[i]."""
+    __slots__ = ('spot_ids', 'bits', 'occupied', 'version')
+
+    def __init__(self, spot_ids, bits, version):
+        self.spot_ids = spot_ids  # array('q'), ascending
+        self.bits = bits  # bytearray
+        self.occupied = int.from_bytes(bits, 'little').bit_count()
+        self.version = version  # the lot's Version this matches
+
+    @classmethod
+    def from_rows(cls, rows, version):
+        """From (spot_id, status) rows in id order."""
+        spot_ids = array('q')
+        bits = bytearray((len(rows) + 7) // 8)
+        for i, (spot_id, status) in enumerate(rows):
+            spot_ids.append(spot_id)
+            if status == 'O':
+                bits[i >> 3] |= 1 << (i & 7)
+        return cls(spot_ids, bits, version)
+
+    @classmethod
+    def loads(cls, spot_ids, bits, version):
+        runs = array('q')
+        runs.frombytes(spot_ids)
+        if sys.byteorder == 'big':
+            runs.byteswap()
+        ids = array('q')
+        for first, count in zip(runs[::2], runs[1::2]):
+            ids.extend(range(first, first + count))
+        return cls(ids, bytearray(bits), version)
+
+    def runs(self):
+        """The spot ids as [first, count] runs; create_spots hands out consecutive ids, so there are few."""
+        runs = []
+        for spot_id in self.spot_ids:
+            if runs and runs[-1][0] + runs[-1][1] == spot_id:
+                runs[-1][1] += 1
+            else:
+                runs.append([spot_id, 1])
+        return runs
+
+    def dumps(self):
+        """(spot_ids, bits) for lot_spot_map."""
+        runs = array('q', [value for run in self.runs() for value in run])
+        if sys.byteorder == 'big':
+            runs.byteswap()
+        return runs.tobytes(), bytes(self.bits)
+
+    @property
+    def free(self):
+        return len(self.spot_ids) - self.occupied
+
+    def set(self, spot_id, occupied):
+        i = bisect_left(self.spot_ids, spot_id)
+        if i == len(self.spot_ids) or self.spot_ids[i] != spot_id:
+            return
+        byte, mask = i >> 3, 1 << (i & 7)
+        if bool(self.bits[byte] & mask) != occupied:
+            self.bits[byte] ^= mask
+            self.occupied += 1 if occupied else -1
+
+    def first_free(self, skip=()):
+        """Lowest free spot id not in `skip`, or None."""
+        bits, count = self.bits, len(self.spot_ids)
+        position = 0
+        while position < count:
+            byte = position >> 3
+            value = bits[byte] | ((1 << (position & 7)) - 1)  # spots before `position` count as taken
+            if value == 0xFF:
+                # step over the following full bytes in one go
+                rest = bits[byte + 1:]
+                position = (len(bits) - len(rest.lstrip(b'\xff'))) * 8
+                continue
+            i = (byte << 3) + (~value & (value + 1)).bit_length() - 1
+            if i >= count:
+                return None
+            if self.spot_ids[i] not in skip:
+                return self.spot_ids[i]
+            position = i + 1
+        return None
+
+    def statuses(self, limit=None):
+        """'A'/'O' per spot in id order, the first `limit` of them."""
+        count = len(self.spot_ids) if limit is None else min(limit, len(self.spot_ids))
+        return ''.join(map(_BYTE_STATUSES.__getitem__, self.bits[:(count + 7) // 8]))[:count]
+
+
+class SpotMap:
+    """Every lot's LotBitmap, held by this process.
+
+    Loaded on first use, from lot_spot_map for lots whose saved bitmap is still at
+    their current Version and from ParkingSpot for the rest, so a restart only reads
+    the spots of lots that changed since the last save. This process's own writes
+    come in through the update hooks, which move the version along the way the SQL
+    does; every REFRESH_SECONDS the versions are compared with the database and any
+    lot that changed some other way (another worker, an admin edit) is reloaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lots = {}  # lot_id -> LotBitmap
+        self._saved = {}  # lot_id -> version in lot_spot_map
+        self._synced_at = None
+        self._saved_at = 0
+        self._saving = False
+
+    def reload(self):
+        with self._lock:
+            self._lots = {}
+        self._refresh()
+
+    def invalidate(self):
+        self._synced_at = None
+
+    def _sync(self):
+        if self._synced_at is None or time.monotonic() - self._synced_at > REFRESH_SECONDS:
+            self._refresh()
+
+    def _refresh(self):
+        versions = dict(db.session.execute(db.select(ParkingLot.id, ParkingLot.Version)).all())
+        with self._lock:
+            stale = [lot_id for lot_id, version in versions.items()
+                     if lot_id not in self._lots or self._lots[lot_id].version != version]
+            gone = [lot_id for lot_id in self._lots if lot_id not in versions]
+        loaded, built = self._load(stale, versions)
+        with self._lock:
+            for lot_id in gone:
+                self._lots.pop(lot_id, None)
+            self._lots.update(loaded)
+            self._synced_at = time.monotonic()
+        if built or time.monotonic() - self._saved_at > SAVE_SECONDS:
+            self._save_later()
+
+    def _load(self, lot_ids, versions):
+        """Bitmaps for the lots, and how many had to be built from ParkingSpot."""
+        loaded, built = {}, 0
+        for start in range(0, len(lot_ids), CHUNK):
+            chunk = lot_ids[start:start + CHUNK]
+            saved = db.session.execute(
+                db.select(LotSpotMap.lot_id, LotSpotMap.version, LotSpotMap.spot_ids, LotSpotMap.bits)
+                .join(ParkingLot, ParkingLot.id == LotSpotMap.lot_id)
+                .where(LotSpotMap.lot_id.in_(chunk), LotSpotMap.version == ParkingLot.Version)
+            )
+            for lot_id, version, spot_ids, bits in saved:
+                loaded[lot_id] = LotBitmap.loads(spot_ids, bits, version)
+                self._saved[lot_id] = version
+            missing = [lot_id for lot_id in chunk if lot_id not in loaded]
+            if not missing:
+                continue
+            # the version comes from the same statement as the statuses, so the two always agree
+            rows = db.session.execute(
+                db.select(ParkingSpot.lot_id, ParkingLot.Version, ParkingSpot.id, ParkingSpot.status)
+                .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+                .where(ParkingSpot.lot_id.in_(missing))
+                .order_by(ParkingSpot.lot_id, ParkingSpot.id)
+            ).all()
+            by_lot = {}
+            for lot_id, version, spot_id, status in rows:
+                by_lot.setdefault(lot_id, (version, []))[1].append((spot_id, status))
+            for lot_id in missing:
+                version, spots = by_lot.get(lot_id, (versions.get(lot_id), []))
+                loaded[lot_id] = LotBitmap.from_rows(spots, version)
+            built += len(missing)
+        return loaded, built
+
+    def _save_later(self):
+        # on a thread of its own: the caller may be partway through a write transaction
+        if self._saving:
+            return
+        self._saving = True
+        app = current_app._get_current_object()
+        threading.Thread(target=self._save_in, args=(app,), name='spot-map-save', daemon=True).start()
+
+    def _save_in(self, app):
+        try:
+            with app.app_context():
+                self.save()
+        except Exception as e:
+            print(f'Error saving spot map: {e}')
+        finally:
+            self._saving = False
+
+    def save(self):
+        """Write the bitmaps that changed since they were last saved to lot_spot_map."""
+        with self._lock:
+            changed = []
+            for lot_id, bitmap in self._lots.items():
+                if bitmap.version is not None and self._saved.get(lot_id) != bitmap.version:
+                    spot_ids, bits = bitmap.dumps()
+                    changed.append({'lot_id': lot_id, 'version': bitmap.version, 'spot_ids': spot_ids, 'bits': bits})
+        if changed:
+            table = LotSpotMap.__table__
+            stmt = insert(table)
+            now = utcnow()
+            for start in range(0, len(changed), CHUNK):
+                db.session.execute(stmt.on_conflict_do_update(
+                    index_elements=[table.c.lot_id],
+                    set_={name: stmt.excluded[name] for name in ('version', 'spot_ids', 'bits', 'saved_at')},
+                    where=stmt.excluded.version > table.c.version  # never put an older one back
+                ), [dict(row, saved_at=now) for row in changed[start:start + CHUNK]])
+            db.session.commit()
+            for row in changed:
+                self._saved[row['lot_id']] = row['version']
+        self._saved_at = time.monotonic()
+        return len(changed)
+
+    def lot(self, lot_id):
+        self._sync()
+        return self._lots.get(lot_id)
+
+    def first_free(self, lot_id, skip=()):
+        self._sync()
+        with self._lock:
+            bitmap = self._lots.get(lot_id)
+            return None if bitmap is None else bitmap.first_free(skip)
+
+    def spots(self, lot_id, limit=None):
+        """(spot_id, status) for the lot's first `limit` spots in id order."""
+        self._sync()
+        with self._lock:
+            bitmap = self._lots.get(lot_id)
+            if bitmap is None:
+                return []
+            return list(zip(bitmap.spot_ids, bitmap.statuses(limit)))
+
+    # update hooks, called after the commit
+
+    def set(self, lot_id, spot_ids, occupied):
+        """`spot_ids` of the lot were flipped by a commit that bumped its Version once."""
+        with self._lock:
+            bitmap = self._lots.get(lot_id)
+            if bitmap is None:
+                return
+            for spot_id in spot_ids:
+                bitmap.set(spot_id, occupied)
+            if bitmap.version is not None:
+                bitmap.version += 1
+
+    def reload_lot(self, lot_id):
+        if self._synced_at is None:
+            return
+        version = db.session.execute(db.select(ParkingLot.Version).where(ParkingLot.id == lot_id)).scalar()
+        if version is None:
+            self.remove_lot(lot_id)
+            return
+        self._saved.pop(lot_id, None)
+        loaded, _ = self._load([lot_id], {lot_id: version})
+        with self._lock:
+            self._lots.update(loaded)
+
+    def remove_lot(self, lot_id):
+        with self._lock:
+            self._lots.pop(lot_id, None)
+            self._saved.pop(lot_id, None)
+
+    def check(self):
+        """Problems with the bitmaps this process holds, against ParkingSpot and the lot counters."""
+        self._sync()
+        problems = []
+        rows = db.session.execute(
+            db.select(ParkingLot.id, ParkingLot.Version, ParkingLot.Available_Count, ParkingLot.Occupied_Count,
+                      ParkingSpot.id, ParkingSpot.status)
+            .outerjoin(ParkingSpot, ParkingSpot.lot_id == ParkingLot.id)
+            .order_by(ParkingLot.id, ParkingSpot.id)
+        ).all()
+        lots = {}
+        for lot_id, version, available, occupied, spot_id, status in rows:
+            lot = lots.setdefault(lot_id, (version, available, occupied, []))
+            if spot_id is not None:
+                lot[3].append((spot_id, status))
+        with self._lock:
+            held = dict(self._lots)
+        for lot_id, (version, available, occupied, spots) in lots.items():
+            truth = LotBitmap.from_rows(spots, version)
+            if (truth.free, truth.occupied) != (available or 0, occupied or 0):
+                problems.append(f'lot {lot_id}: counters say {available} free/{occupied} occupied, '
+                                f'spots say {truth.free}/{truth.occupied}')
+            bitmap = held.get(lot_id)
+            if bitmap is None:
+                problems.append(f'lot {lot_id}: no bitmap')
+            elif bitmap.version == version and (bitmap.spot_ids, bitmap.bits) != (truth.spot_ids, truth.bits):
+                problems.append(f'lot {lot_id}: bitmap at version {version} does not match its spots')
+            elif bitmap.occupied != int.from_bytes(bitmap.bits, 'little').bit_count():
+                problems.append(f'lot {lot_id}: bitmap count {bitmap.occupied} does not match its bits')
+        for lot_id in held.keys() - lots.keys():
+            problems.append(f'lot {lot_id}: bitmap for a lot that no longer exists')
+        return problems
+
+
+spot_map = SpotMap()
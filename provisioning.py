@@ -0,0 +1,50 @@
+from models import db, ParkingLot, ParkingSpot, SlotBooking
+from billing import utcnow
+
+BATCH_SIZE = 1000
+
+
+def create_spots(lot_id, count, status='A'):
+    """Insert `count` spots for the lot with batched executemany inserts."""
+    table = ParkingSpot.__table__
+    for start in range(0, count, BATCH_SIZE):
+        batch = min(BATCH_SIZE, count - start)
+        db.session.execute(table.insert(), [{'lot_id': lot_id, 'status': status}] * batch)
+
+
+def resize_lot(lot, new_max_spots):
+    """Bring the lot's spot rows to `new_max_spots` by adding the missing spots or
+    retiring surplus free ones; existing spots keep their ids. Raises ValueError
+    if that would mean removing occupied spots or ones with upcoming slot bookings,
+    including ones claimed while it runs; the caller rolls back then."""
+    current = db.session.query(db.func.count(ParkingSpot.id)).filter(ParkingSpot.lot_id == lot.id).scalar()
+    if new_max_spots > current:
+        create_spots(lot.id, new_max_spots - current)
+    elif new_max_spots < current:
+        surplus = current - new_max_spots
+        upcoming = db.select(SlotBooking.id).where(
+            SlotBooking.spot_id == ParkingSpot.id, SlotBooking.status == 'booked', SlotBooking.end_time > utcnow()
+        )
+        free = (ParkingSpot.lot_id == lot.id, ParkingSpot.status == 'A', ~upcoming.exists())
+        free_ids = [
+            spot_id for (spot_id,) in
+            db.session.query(ParkingSpot.id)
+            .filter(*free)
+            .order_by(ParkingSpot.id.desc())
+            .limit(surplus)
+            .all()
+        ]
+        if len(free_ids) < surplus:
+            raise ValueError(f'lot {lot.id} has only {len(free_ids)} free spots, cannot remove {surplus}')
+        # the delete checks again, a spot booked or slot-booked since the select above must stay
+        deleted = 0
+        for start in range(0, len(free_ids), BATCH_SIZE):
+            deleted += (
+                ParkingSpot.query
+                .filter(ParkingSpot.id.in_(free_ids[start:start + BATCH_SIZE]), *free)
+                .delete(synchronize_session=False)
+            )
+        if deleted < surplus:
+            raise ValueError(f'lot {lot.id} has only {deleted} free spots, cannot remove {surplus}')
+    lot.Max_Spots = new_max_spots
+    lot.refresh_counts()
@@ -0,0 +1,167 @@
+import math
+import time
+import threading
+from array import array
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session
+from sqlalchemy.dialects.sqlite import insert
+from models import db, RateLimitCounter
+
+# name -> rules of (scope, limit, window seconds); RATE_LIMITS in the config overrides any of them.
+# 'ip' is keyed on the client address, 'account' on what the request names (see the routes)
+DEFAULT_LIMITS = {
+    'login': [('ip', 20, 60), ('account', 5, 300)],
+    'admin_login': [('ip', 10, 60), ('account', 5, 300)],
+    'register': [('ip', 10, 3600)],
+    'book': [('ip', 60, 60), ('account', 10, 60)],
+    'contact': [('ip', 5, 600)],
+}
+
+
+class MemoryStore:
+    """Sliding window log per key, kept in this process.
+
+    Each key gets a ring of `limit` timestamps. The slot about to be overwritten
+    holds the oldest hit, so a request is allowed when that one has left the
+    window; one comparison, no list to trim. Rejected hits are not recorded.
+    Only the most recently used `max_keys` keys are kept, a key pushed out
+    starts again from empty.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._rings = OrderedDict()  # key -> [position, array of hit times]
+
+    def hit(self, key, limit, window):
+        """Record a hit, returns 0 if it is allowed or the seconds until it would be."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._rings.get(key)
+            if entry is None or len(entry[1]) != limit:
+                entry = self._rings[key] = [0, array('d', [-math.inf]) * limit]
+                if len(self._rings) > self.max_keys:
+                    self._rings.popitem(last=False)
+            else:
+                self._rings.move_to_end(key)
+            position, ring = entry
+            oldest = ring[position]
+            if now - oldest < window:
+                return window - (now - oldest)
+            ring[position] = now
+            entry[0] = (position + 1) % limit
+            return 0
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+
+
+class DatabaseStore:
+    """Sliding window counter in the rate_limit_counter table, shared by every worker.
+
+    Keeps one count per key per fixed window and weighs the previous window by how
+    much of it still overlaps the sliding one. The increment only happens while the
+    estimate is under the limit, in a single upsert, so two workers can't both take
+    the last slot.
+    """
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        current = int(now // window)
+        table = RateLimitCounter.__table__
+        with db.engine.begin() as conn:
+            previous = conn.execute(
+                db.select(table.c.count).where(table.c.key == key, table.c.window == current - 1)
+            ).scalar() or 0
+            overlap = 1 - (now - current * window) / window
+            allowed = math.floor(limit - previous * overlap)
+            if allowed < 1:
+                return (current + 1) * window - now
+            stmt = insert(table).values(key=key, window=current, count=1, expires_at=(current + 2) * window)
+            counted = conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[table.c.key, table.c.window],
+                    set_={'count': table.c.count + 1},
+                    where=table.c.count < allowed
+                ).returning(table.c.count)
+            ).first()
+        if counted is None:
+            return (current + 1) * window - now
+        return 0
+
+    def clear(self):
+        with db.engine.begin() as conn:
+            conn.execute(RateLimitCounter.__table__.delete())
+
+
+def client_address():
+    # behind a proxy this is the proxy unless werkzeug's ProxyFix is set up
+    return request.remote_addr or 'unknown'
+
+
+def check(name, account=None):
+    """Run `name`'s rules for this request, returns 0 or the seconds to wait."""
+    limiter = current_app.extensions.get('ratelimit')
+    if limiter is None:
+        return 0
+    store, limits = limiter
+    for scope, limit, window in limits.get(name, ()):
+        if scope == 'ip':
+            value = client_address()
+        elif account:
+            value = str(account).strip().lower()
+        else:
+            continue
+        # no print per rejection, under attack that would be the expensive part
+        wait = store.hit(f'{name}:{scope}:{value}', limit, window)
+        if wait:
+            return wait
+    return 0
+
+
+def too_many_requests(wait):
+    seconds = max(math.ceil(wait), 1)
+    return f'Too many attempts, try again in {seconds} seconds.', 429, {'Retry-After': str(seconds)}
+
+
+def rate_limited(name, account=None, methods=('POST',), respond=too_many_requests):
+    """Reject requests over `name`'s limits before the view runs.
+
+    `account` is called to get what the account rules are keyed on (the email in a
+    login form, say), and the rules only look at `methods`, so showing the form is free.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            if request.method in methods:
+                wait = check(name, account() if account else None)
+                if wait:
+                    return respond(wait)
+            return view(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def form_email():
+    return request.form.get('email')
+
+
+def session_user():
+    return session.get('user_id')
+
+
+def prune_rate_limits():
+    """Delete counters whose windows are over, returns how many went."""
+    table = RateLimitCounter.__table__
+    result = db.session.execute(table.delete().where(table.c.expires_at < time.time()))
+    db.session.commit()
+    return result.rowcount
+
+
+def init_ratelimit(app):
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return
+    store = DatabaseStore() if app.config.get('RATE_LIMIT_STORE') == 'database' else MemoryStore()
+    app.extensions['ratelimit'] = (store, {**DEFAULT_LIMITS, **app.config.get('RATE_LIMITS', {})})
@@ -1,475 +1,707 @@
-from streamlit import user
-from flask import render_template, jsonify, request, redirect, url_for, session
+from flask import Blueprint, current_app, render_template, jsonify, request, redirect, url_for, session, Response, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
 from zoneinfo import ZoneInfo
 from datetime import timezone
 from collections import Counter
 from sqlalchemy.orm import joinedload
 from functools import wraps
-from models import db, Contact, Reservation, User, ParkingLot, ParkingSpot
+from models import db, Contact, Reservation, ReservationArchive, UserArchiveTotals, User, ParkingLot, ParkingSpot, ReservationDailyStats, SlotBooking, LotSpotMap
+from booking import book, release
+from stats import daily_rows
+from archive import newest_archived, user_totals, has_archived
+from nearby import lot_index
+from schedule import slot_index
+from occupancy import spot_map
+from provisioning import create_spots, resize_lot
+from cache import cached_page, cached_fragment, get_cache
+from users import current_user, forget_user
+from jobs import enqueue
+from events import publish, format_event, KEEPALIVE_SECONDS
+from billing import to_local
+from ratelimit import rate_limited, too_many_requests, form_email, session_user
+import export
+import importer
 from datetime import datetime, timedelta
+import os
+import time
 
-def routes(app):
+PER_PAGE = 50
+
+main = Blueprint('main', __name__)
+
+# stored times are utc, templates show them with |local_time
+main.add_app_template_filter(to_local, 'local_time')
+
+
+# login pages show the form again with the wait in it, rather than a bare 429
+def throttled_form(template):
+    def respond(wait):
+        message, status, headers = too_many_requests(wait)
+        return render_template(template, error=message), status, headers
+    return respond
+
+
+############################################## Basic Quick Routes ##########################################
 
-    
-    ############################################## Basic Quick Routes ##########################################
-
-
-    @app.route('/')
-    def index():
-        return render_template('index.html')
-    @app.route('/docs')
-    def docs():
-        return render_template('docs.html')
-    @app.route('/about')
-    def about():
-        return render_template('about.html')
-    @app.route('/contact', methods=['GET', 'POST'])
-    def contact():
-        if request.method == 'POST':
-            name = request.form['Name']
-            email = request.form['email']
-            phone = request.form['phone']
-            subject = request.form['subject']
-            message = request.form['message']
-
-            print(f'Contact form submitted by {name} ({email}, {phone}): {subject} - {message}')
-
-            user = User.query.filter_by(Email=email).first()
-            contact_message = Contact(
-                First_Name=name,
-                Email=email,
-                Phone=phone,
-                Subject=subject,
-                Message=message
-            )
-            db.session.add(contact_message)
-            db.session.commit()
 
-            if user:
-                print(f'Message from {user.Name}: {message}')
-            else:
-                print(f'Message from unregistered user: {name}')
+@main.route('/')
+@cached_page
+def index():
+    return render_template('index.html')
+@main.route('/docs')
+@cached_page
+def docs():
+    return render_template('docs.html')
+@main.route('/about')
+@cached_page
+def about():
+    return render_template('about.html')
+@main.route('/contact', methods=['GET', 'POST'])
+@rate_limited('contact')
+@cached_page
+def contact():
+    if request.method == 'POST':
+        # saved and logged by the job workers, the request only queues it
+        enqueue('contact', {
+            'name': request.form['Name'],
+            'email': request.form['email'],
+            'phone': request.form['phone'],
+            'subject': request.form['subject'],
+            'message': request.form['message']
+        })
+        print(f'Contact form queued for {request.form["email"]}')
 
-            return redirect(url_for('contact'))
+        return redirect(url_for('main.contact'))
 
-        return render_template('contact.html')
+    return render_template('contact.html')
 
 
 ########################################## User Routes ##########################################
 
-    # User Register
-    @app.route('/register', methods=['GET', 'POST'])
-    def user_register():
-        if request.method == 'POST':
-            if User.query.filter_by(Email=request.form['email']).first():
-                print(f'User with email {request.form["email"]} already exists!')
-                return redirect(url_for('user_login'))
-            else:
-                try:
-                    user = User(
-                        Name=request.form['name'],
-                        Email=request.form['email'],
-                        Password=generate_password_hash(request.form['password']),
-                        Pincode=request.form['pincode'],
-                        Address=request.form.get('address', ''),
-                        Phone=request.form.get('phone', ''),
-                        Vehicle_Number=request.form.get('vehicle_number', '')
-                    )
-                    db.session.add(user)
-                    db.session.commit()
-                    print(f'User {user.Email} registered successfully!')
-                    return redirect(url_for('user_login'))
-                except Exception as e:
-                    db.session.rollback()
-                    print(f'Error registering user: {e}')
-                    return redirect(url_for('user_register'))        
-        return render_template('user/register.html')
-
-    # User Login
-    @app.route('/login', methods=['GET', 'POST'])
-    def user_login():
-        if request.method == 'POST':
-            email = request.form['email']
-            username = request.form['email']
-            if not email and not username:
-                return redirect(url_for('user_login'))
-            user = User.query.filter((User.Email == email) | (User.Name == username)).first()
-
-            if user and check_password_hash(user.Password, request.form['password']):
-                session['user_id'] = user.id
-                session['user_name'] = user.Name
-                session['user_email'] = user.Email
-                return redirect(url_for('user_dashboard'))
-            else:
-                print(f'Login failed for {request.form["email"]}')
-                return render_template('user/login.html', error='Invalid credentials')        
-        return render_template('user/login.html')
-
-    # User Logout
-    @app.route('/logout')
-    def user_logout():
+# one page of reservations, newest first, keyed on (in_time, id) so deep pages cost the same as the first
+def page_reservations(user_id=None):
+    per_page = min(max(request.args.get('per_page', PER_PAGE, type=int), 1), 200)
+    cursor = request.args.get('cursor', '')
+    after = None
+    if cursor:
+        try:
+            in_time, _, res_id = cursor.rpartition('_')
+            after = datetime.fromisoformat(in_time), int(res_id)
+        except ValueError:
+            print(f'Ignoring bad cursor: {cursor}')
+    reservations = reservation_page(Reservation, user_id, after, per_page + 1)
+    # archived rows are all older than newest_archived(), so only pages reaching back that far look there
+    oldest_needed = reservations[-1].in_time if len(reservations) > per_page else None
+    archived_until = newest_archived()
+    if archived_until is not None and (oldest_needed is None or oldest_needed <= archived_until):
+        reservations += reservation_page(ReservationArchive, user_id, after, per_page + 1)
+        reservations = sorted(reservations, key=lambda r: (r.in_time, r.id), reverse=True)[:per_page + 1]
+    next_cursor = None
+    if len(reservations) > per_page:
+        reservations = reservations[:per_page]
+        last = reservations[-1]
+        next_cursor = f'{last.in_time.replace(tzinfo=None).isoformat()}_{last.id}'
+    return reservations, next_cursor
+
+def reservation_page(model, user_id, after, limit):
+    # model is Reservation or ReservationArchive, both have the columns and relationships the summaries use
+    query = model.query.options(joinedload(model.user), joinedload(model.spot).joinedload(ParkingSpot.lot))
+    if user_id is not None:
+        query = query.filter(model.user_id == user_id)
+    if after:
+        in_time, res_id = after
+        query = query.filter((model.in_time < in_time) | ((model.in_time == in_time) & (model.id < res_id)))
+    return query.order_by(model.in_time.desc(), model.id.desc()).limit(limit).all()
+
+# User Register
+@main.route('/register', methods=['GET', 'POST'])
+@rate_limited('register')
+def user_register():
+    if request.method == 'POST':
+        if User.query.filter_by(Email=request.form['email']).first():
+            print(f'User with email {request.form["email"]} already exists!')
+            return redirect(url_for('main.user_login'))
+        else:
+            try:
+                user = User(
+                    Name=request.form['name'],
+                    Email=request.form['email'],
+                    Password=generate_password_hash(request.form['password']),
+                    Pincode=request.form['pincode'],
+                    Address=request.form.get('address', ''),
+                    Phone=request.form.get('phone', ''),
+                    Vehicle_Number=request.form.get('vehicle_number', '')
+                )
+                db.session.add(user)
+                db.session.commit()
+                print(f'User {user.Email} registered successfully!')
+                return redirect(url_for('main.user_login'))
+            except Exception as e:
+                db.session.rollback()
+                print(f'Error registering user: {e}')
+                return redirect(url_for('main.user_register'))        
+    return render_template('user/register.html')
+
+# User Login
+@main.route('/login', methods=['GET', 'POST'])
+@rate_limited('login', account=form_email, respond=throttled_form('user/login.html'))
+def user_login():
+    if request.method == 'POST':
+        email = request.form['email']
+        username = request.form['email']
+        if not email and not username:
+            return redirect(url_for('main.user_login'))
+        user = User.query.filter((User.Email == email) | (User.Name == username)).first()
+
+        if user and check_password_hash(user.Password, request.form['password']):
+            session['user_id'] = user.id
+            return redirect(url_for('main.user_dashboard'))
+        else:
+            print(f'Login failed for {request.form["email"]}')
+            return render_template('user/login.html', error='Invalid credentials')        
+    return render_template('user/login.html')
+
+# User Logout
+@main.route('/logout')
+def user_logout():
+    session.pop('user_id', None)
+    return redirect(url_for('main.index'))
+
+# User Dashboard
+@main.route('/dashboard')
+def user_dashboard():
+    if not session.get('user_id'):
+        return redirect(url_for('main.user_login'))
+    user = current_user()
+    if user is None:
         session.pop('user_id', None)
-        session.pop('user_name', None)
-        session.pop('user_email', None)
-        return redirect(url_for('index'))
-
-    # User Dashboard
-    @app.route('/dashboard')
-    def user_dashboard():
-        if not session.get('user_id'):
-            return redirect(url_for('user_login'))
-        user = User.query.get(session['user_id'])
-        print('user:', user)
-        active_reservations = Reservation.query.filter_by(
-            user_id=user.id,
-            status='active'
-        ).join(ParkingSpot).join(ParkingLot).all()
-
-        # will show *all* lots in that pincode prefix that have at least one avail spot
-        query = (
-            db.session.query(ParkingLot)
-            .join(ParkingSpot)
-            .filter(ParkingLot.Pincode.startswith(user.Pincode[:2]))
-            .filter(ParkingSpot.status == 'A')
-            .distinct()
-        )
-        nearby_lots = query.all()
-        print('nearby_lots:', nearby_lots)
-        return render_template('user/dashboard.html',
-                            user=user,
-                            active_reservations=active_reservations,
-                            nearby_lots=nearby_lots)
-
-    # User Book Spot
-    @app.route('/book/<int:lot_id>')
-    def user_book_spot(lot_id):
-        if not session.get('user_id'):
-            return redirect(url_for('user_login'))
-        lot = ParkingLot.query.get_or_404(lot_id)
-        available = ParkingSpot.query.filter_by(lot_id=lot.id, status='A').first()
-        if not available:
-            return redirect(url_for('user_dashboard'))
+        return redirect(url_for('main.user_login'))
+    active_reservations = Reservation.query.filter_by(
+        user_id=user.id,
+        status='active'
+    ).join(ParkingSpot).join(ParkingLot).all()
+
+    # closest lots in that pincode prefix that have at least one avail spot
+    lot_ids = lot_index.nearby(user.Pincode)
+    lots = {lot.id: lot for lot in ParkingLot.query.filter(ParkingLot.id.in_(lot_ids)).all()} if lot_ids else {}
+    nearby_lots = [lots[lot_id] for lot_id in lot_ids if lot_id in lots]
+    lot_cards = {
+        lot.id: cached_fragment(f'user-lot-card:{lot.id}:{lot.Version}',
+                                lambda lot=lot: render_template('user/lot_card.html', lot=lot))
+        for lot in nearby_lots
+    }
+    print('nearby_lots:', nearby_lots)
+    return render_template('user/dashboard.html',
+                        user=user,
+                        active_reservations=active_reservations,
+                        nearby_lots=nearby_lots,
+                        lot_cards=lot_cards)
+
+# Live Availability (server-sent events)
+@main.route('/events/availability')
+def availability_events():
+    # ?pincode= is a prefix; logged in users default to the area the dashboard shows them
+    prefix = request.args.get('pincode')
+    if prefix is None:
+        user = current_user()
+        prefix = user.Pincode[:2] if user else ''
+    lots = db.session.execute(
+        db.select(ParkingLot.id, ParkingLot.Available_Count, ParkingLot.Occupied_Count)
+        .where(ParkingLot.Pincode.startswith(prefix, autoescape=True))
+        .order_by(ParkingLot.id)
+    ).all()
+    snapshot = format_event([
+        {'lot_id': lot_id, 'available': available, 'occupied': occupied}
+        for lot_id, available, occupied in lots
+    ])
+    db.session.remove()  # don't hold a connection for as long as the stream is open
+    hub = current_app.extensions['events']
+
+    def stream(first):
+        subscriber = hub.subscribe(prefix)
         try:
-            reservation = Reservation(spot_id=available.id, user_id=session['user_id'])
-            available.status = 'O'
-            db.session.add(reservation)
-            db.session.commit()
-            print(f'Successfully booked spot: {available.id}')
-        except Exception as e:
-
-            db.session.rollback()
-            print(f'Error booking spot: {e}')
-            return redirect(url_for('user_dashboard'))
-        return redirect(url_for('user_dashboard'))
-
-    # User Release Spot
-    @app.route('/release/<int:reservation_id>', methods=['POST'])
-    def user_release_spot(reservation_id):
-        if not session.get('user_id'):
-            return redirect(url_for('user_login'))
-        res = Reservation.query.get_or_404(reservation_id)
-        if res.user_id != session['user_id']:
-            return redirect(url_for('user_dashboard'))
+            yield first
+            while True:
+                yield hub.next_message(subscriber, KEEPALIVE_SECONDS) or ': keepalive\n\n'
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return Response(stream('retry: 5000\n\n' + snapshot), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# User Book Spot
+@main.route('/book/<int:lot_id>')
+@rate_limited('book', account=session_user, methods=('GET',))
+def user_book_spot(lot_id):
+    if not session.get('user_id'):
+        return redirect(url_for('main.user_login'))
+    lot = ParkingLot.query.get_or_404(lot_id)
+    if lot.available_spots <= 0:
+        return redirect(url_for('main.user_dashboard'))
+    try:
+        reservation = book(session['user_id'], lot.id)
+        if reservation is None:
+            return redirect(url_for('main.user_dashboard'))
+        print(f'Successfully booked spot: {reservation.spot_id}')
+    except Exception as e:
+
+        db.session.rollback()
+        print(f'Error booking spot: {e}')
+        return redirect(url_for('main.user_dashboard'))
+    return redirect(url_for('main.user_dashboard'))
+
+# User Release Spot
+@main.route('/release/<int:reservation_id>', methods=['POST'])
+def user_release_spot(reservation_id):
+    if not session.get('user_id'):
+        return redirect(url_for('main.user_login'))
+    res = Reservation.query.get_or_404(reservation_id)
+    if res.user_id != session['user_id'] or res.status != 'active':
+        return redirect(url_for('main.user_dashboard'))
+    try:
+        release(res)
+    except Exception as e:
+        db.session.rollback()
+        print(f'Error releasing spot: {e}')
+    return redirect(url_for('main.user_dashboard'))
+
+# User Summary
+@main.route('/summary')
+def user_summary():
+    if not session.get('user_id'):
+        return redirect(url_for('main.user_login'))
+
+    reservations, next_cursor = page_reservations(session['user_id'])
+
+    completed = Reservation.status == 'completed'
+    hours = (db.func.julianday(Reservation.out_time) - db.func.julianday(Reservation.in_time)) * 24
+    total_bookings, total_spent, total_hours = db.session.query(
+        db.func.count(Reservation.id),
+        db.func.coalesce(db.func.sum(db.case((completed, Reservation.total_cost), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((completed, hours), else_=0)), 0)
+    ).filter(Reservation.user_id == session['user_id']).one()
+    archived_bookings, archived_spent, archived_hours = user_totals(session['user_id'])
+    total_bookings += archived_bookings
+    total_spent += archived_spent
+    total_hours += archived_hours
+
+    return render_template(
+        'user/summary.html',
+        reservations=reservations,
+        next_cursor=next_cursor,
+        total_bookings=total_bookings,
+        total_spent=total_spent,
+        total_hours=total_hours
+    )
+
+# User Profile
+@main.route('/profile', methods=['GET', 'POST'])
+def user_profile():
+    if not session.get('user_id'):
+        return redirect(url_for('main.user_login'))
+
+    user = current_user()
+    if not user:
+        print('User not found!')
+        return redirect(url_for('main.user_login'))
+
+    if request.method == 'POST':
         try:
-            res.out_time = datetime.utcnow()
-            duration_hours = max(1, (res.out_time - res.in_time).total_seconds() / 3600)
-            res.total_cost = duration_hours * res.spot.lot.Price
-            res.status = 'completed'
-            res.spot.status = 'A'
+            user.Name = request.form['name']
+            user.Email = request.form['email']
+            user.Address = request.form.get('address', '')
+            user.Phone = request.form.get('phone', '')
+            user.Vehicle_Number = request.form.get('vehicle_number', '')
+            if request.form['pincode']:
+                user.Pincode = request.form['pincode']
+
             db.session.commit()
+            forget_user(user.id)
+            print(f'Profile updated for {user.Name}')
         except Exception as e:
             db.session.rollback()
-            print(f'Error releasing spot: {e}')
-        return redirect(url_for('user_dashboard'))
-
-    # User Summary
-    @app.route('/summary')
-    def user_summary():
-        if not session.get('user_id'):
-            return redirect(url_for('user_login'))
-        
-        reservations = Reservation.query.filter_by(
-            user_id=session['user_id']
-        ).order_by(
-            Reservation.in_time.desc()
-        ).all()
-        for res in reservations:
-            if res.out_time:
-                if res.out_time.tzinfo is None:
-                    res.out_time = res.out_time.replace(tzinfo=timezone.utc)
-                res.out_time_display = res.out_time.astimezone(ZoneInfo("Asia/Kolkata"))
-            else:
-                res.out_time_display = None
-
-            if res.in_time:
-                if res.in_time.tzinfo is None:
-                    res.in_time = res.in_time.replace(tzinfo=timezone.utc)
-                res.in_time_display = res.in_time.astimezone(ZoneInfo("Asia/Kolkata"))
-            else:
-                res.in_time_display = None
-
-        total_bookings = len(reservations)
-        total_spent = sum(r.total_cost or 0 for r in reservations if r.status == 'completed')
-        total_hours = sum(r.duration_hours for r in reservations if r.status == 'completed')
-
-        return render_template(
-            'user/summary.html',
-            reservations=reservations,
-            total_bookings=total_bookings,
-            total_spent=total_spent,
-            total_hours=total_hours
-        )
-
-    # User Profile
-    @app.route('/profile', methods=['GET', 'POST'])
-    def user_profile():
-        if not session.get('user_id'):
-            return redirect(url_for('user_login'))
-
-        user = User.query.get(session['user_id'])
-        session['user_name'] = user.Name
-        session['user_email'] = user.Email
-        session['user_phone'] = user.Phone
-        session['user_address'] = user.Address
-        session['user_pincode'] = user.Pincode
-        session['user_vehicle_number'] = user.Vehicle_Number
-        session['user_created_at'] = user.created_at.strftime('%Y-%m-%d')
-        print('session:', session)
-        print('user:', user)
-        if not user:
-            print('User not found!')
-            return redirect(url_for('user_login'))
+            print(f'Error updating profile: {str(e)}')
 
-        if request.method == 'POST':
-            try:
-                user.Name = request.form['name']
-                user.Email = request.form['email']
-                user.Address = request.form.get('address', '')
-                user.Phone = request.form.get('phone', '')
-                user.Vehicle_Number = request.form.get('vehicle_number', '')
-                session['user_created_at'] = user.created_at.strftime('%Y-%m-%d')
-                print(user.created_at, user.vehicle_number, user.Phone, user.Address, user.Pincode)
-                if request.form['pincode']:
-                    user.Pincode = request.form['pincode']
+    return render_template('user/profile.html', user=user)
 
-                db.session.commit()
-                session['user_name'] = user.Name
-                print(f'Profile updated for {user.Name}')
-            except Exception as e:
-                db.session.rollback()
-                print(f'Error updating profile: {str(e)}')
 
-        return render_template('user/profile.html', user=user)
 
+########################################### Admin Routes ##########################################
 
 
-########################################### Admin Routes ##########################################
+# Admin Login
+@main.route('/admin/login', methods=['GET', 'POST'])
+@rate_limited('admin_login', account=form_email, respond=throttled_form('admin/login.html'))
+def admin_login():
+    if request.method == 'POST':
+        email = request.form['email']
+        username = request.form['email']
+        password = request.form['password']
+        print('data:', email, username, password)
+        user = User.query.filter((User.Email == email) | (User.Name == username)).first()
+        print('user:', user)
+        if user and (user.Email == 'admin@admin.com' or user.Name == 'admin') and check_password_hash(user.Password, password):
+            session['admin_logged_in'] = True
 
+            return redirect(url_for('main.admin_dashboard'))
 
-    # Admin Login
-    @app.route('/admin/login', methods=['GET', 'POST'])
-    def admin_login():
-        if request.method == 'POST':
-            email = request.form['email']
-            username = request.form['email']
-            password = request.form['password']
-            print('data:', email, username, password)
-            user = User.query.filter((User.Email == email) | (User.Name == username)).first()
-            print('user:', user)
-            if user and (user.Email == 'admin@admin.com' or user.Name == 'admin') and check_password_hash(user.Password, password):
-                session['admin_logged_in'] = True
-
-                return redirect(url_for('admin_dashboard'))
-
-            else:
-                return render_template('admin/login.html', error='Invalid credentials')
-        return render_template('admin/login.html')  
-
-    # Admin Logout
-    @app.route('/admin/logout')
-    def admin_logout():
-        if not session.get('admin_logged_in'):
-            return redirect(url_for('admin_login'))
-        session.pop('admin_logged_in', None)
-        return redirect(url_for('index'))
-
-    # to prevent unauthorized access to admin dashbaord
-    def admin_required(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            if not session.get('admin_logged_in'):
-                return redirect(url_for('admin_login'))
-            return f(*args, **kwargs)
-        return decorated_function
-
-    # Admin Dashboard
-    @app.route('/admin/dashboard')
-    @admin_required
-    def admin_dashboard():
-        lots = ParkingLot.query.all()
-        total_spots = sum(len([spot for spot in lot.spots if spot.status == 'A']) for lot in lots)
-        print('total_spots:', total_spots)
-        occupied_spots = sum(lot.occupied_spots for lot in lots)
-        print('occupied_spots:', occupied_spots)
-        available_spots = total_spots - occupied_spots
-        search = request.args.get('search', '')
-        
-        if search:
-            lots = ParkingLot.query.filter(
-                (ParkingLot.Location.contains(search)) | 
-                (ParkingLot.Pincode.contains(search))
-            ).all()
         else:
-            lots = ParkingLot.query.all()
-        
-        return render_template('admin/dashboard.html', 
-                            lots=lots, 
-                            total_spots=total_spots,
-                            occupied_spots=occupied_spots,
-                            available_spots=available_spots,
-                            search=search)
-
-    # Admin Add Lot
-    @app.route('/admin/add-lot', methods=['GET', 'POST'])
-    @admin_required
-    def add_lot():
-     if request.method == 'POST':
-        print('form data:', request.form)
+            return render_template('admin/login.html', error='Invalid credentials')
+    return render_template('admin/login.html')  
+
+# Admin Logout
+@main.route('/admin/logout')
+def admin_logout():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('main.admin_login'))
+    session.pop('admin_logged_in', None)
+    return redirect(url_for('main.index'))
+
+# to prevent unauthorized access to admin dashbaord
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('admin_logged_in'):
+            return redirect(url_for('main.admin_login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# Admin Dashboard
+@main.route('/admin/dashboard')
+@admin_required
+def admin_dashboard():
+    available_spots, occupied_spots = db.session.query(
+        db.func.coalesce(db.func.sum(ParkingLot.Available_Count), 0),
+        db.func.coalesce(db.func.sum(ParkingLot.Occupied_Count), 0)
+    ).one()
+    total_spots = available_spots + occupied_spots
+    print('total_spots:', total_spots)
+    print('occupied_spots:', occupied_spots)
+    search = request.args.get('search', '').strip()
+
+    query = ParkingLot.query
+    if search:
+        # prefix match only, so the NOCASE indexes on Location/Pincode are used
+        pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(
+            (ParkingLot.Location.like(pattern, escape='\\')) |
+            (ParkingLot.Pincode.like(pattern, escape='\\'))
+        )
+    lots = query.order_by(ParkingLot.id).all()
+
+    # cards are cached per lot version, so only changed lots need their spot strip drawn, from the bitmaps
+    lot_cards = {}
+    for lot in lots:
+        lot_cards[lot.id] = get_cache().get(f'admin-lot-card:{lot.id}:{lot.Version}')
+    stale = [lot for lot in lots if lot_cards[lot.id] is None]
+    for lot in stale:
+        lot_cards[lot.id] = render_template('admin/lot_card.html', lot=lot, spots=spot_map.spots(lot.id, limit=20))
+        get_cache().set(f'admin-lot-card:{lot.id}:{lot.Version}', lot_cards[lot.id])
+
+    return render_template('admin/dashboard.html', 
+                        lots=lots, 
+                        lot_cards=lot_cards,
+                        total_spots=total_spots,
+                        occupied_spots=occupied_spots,
+                        available_spots=available_spots,
+                        search=search)
+
+# Admin Add Lot
+@main.route('/admin/add-lot', methods=['GET', 'POST'])
+@admin_required
+def add_lot():
+ if request.method == 'POST':
+    print('form data:', request.form)
+    try:
+        lot = ParkingLot(
+            Location=request.form['Location'],
+            Address=request.form['Address'],
+            Pincode=request.form['Pincode'],
+            Price=float(request.form['Price']),
+            Max_Spots=int(request.form['Max_Spots']),
+            Created_by=session.get('user_id'),
+            Max_Time=int(request.form.get('Max_Time', 60)),  #defaulting to 60 mins if not provided
+            Available_Count=int(request.form['Max_Spots']),
+            Occupied_Count=0,
+            Version=time.time_ns() // 1000000  #sqlite can reuse a deleted lot's id, this keeps its cached cards from matching
+        )
+        db.session.add(lot)
+        db.session.flush()
+        create_spots(lot.id, lot.Max_Spots)
+        db.session.commit()
+        lot_index.upsert(lot.id, lot.Pincode, lot.Available_Count)
+        slot_index.reload_lot(lot.id)
+        spot_map.reload_lot(lot.id)
+        publish(lot.id)
+        return redirect(url_for('main.admin_dashboard'))
+    except Exception as e:
+        db.session.rollback()
+
+ return render_template('admin/add_lot.html')
+
+# Admin Edit Lot
+@main.route('/admin/parking_edit/<int:lot_id>', methods=['GET', 'POST'])
+@admin_required
+def admin_parking_edit(lot_id):
+    lot = ParkingLot.query.get(lot_id)
+    print('lot:', lot)
+    error = None
+    if request.method == 'POST':
+        previous_max_spots = lot.Max_Spots
         try:
-            lot = ParkingLot(
-                Location=request.form['Location'],
-                Address=request.form['Address'],
-                Pincode=request.form['Pincode'],
-                Price=float(request.form['Price']),
-                Max_Spots=int(request.form['Max_Spots']),
-                Created_by=session.get('user_id'),
-                Max_Time=int(request.form.get('Max_Time', 60))  #defaulting to 60 mins if not provided
-            )
-            db.session.add(lot)
-            db.session.commit()
-
-            for _ in range(lot.Max_Spots):
-                spot = ParkingSpot(lot_id=lot.id, status='A')
-                db.session.add(spot)
-            
-            db.session.commit()
-            return redirect(url_for('admin_dashboard'))
-        except Exception as e:
-            db.session.rollback()
-    
-     return render_template('admin/add_lot.html')
-
-    # Admin Edit Lot
-    @app.route('/admin/parking_edit/<int:lot_id>', methods=['GET', 'POST'])
-    @admin_required
-    def admin_parking_edit(lot_id):
-        lot = ParkingLot.query.get(lot_id)
-        print('lot:', lot)
-        if request.method == 'POST':
-            previous_max_spots = lot.Max_Spots
             new_max_spots = int(request.form['Max_Spots'])
-            try:
-                lot.Location = request.form['Location']
-                lot.Address = request.form['Address']
-                lot.Pincode = request.form['Pincode']
-                lot.Price = float(request.form['Price'])
-                lot.Max_Spots = new_max_spots
-                print('form data:', request.form)
-
-                spot_diff = lot.Max_Spots - previous_max_spots
+            lot.Location = request.form['Location']
+            lot.Address = request.form['Address']
+            lot.Pincode = request.form['Pincode']
+            lot.Price = float(request.form['Price'])
+            lot.bump_version()
+            print('form data:', request.form)
 
-                if new_max_spots != previous_max_spots:
-                    ParkingSpot.query.filter_by(lot_id=lot.id, status='A').delete(synchronize_session=False)
+            if new_max_spots != previous_max_spots:
+                resize_lot(lot, new_max_spots)
 
-                    for _ in range(new_max_spots):
-                        new_spot = ParkingSpot(lot_id=lot.id, status='A')
-                        db.session.add(new_spot)
-
-                # lot.Max_Time = int(request.form.get('Max_Time', 60))  #default here too
-                db.session.commit()
-                return redirect(url_for('admin_dashboard'))
-            except Exception as e:
-                db.session.rollback()
-    
-        return render_template('admin/parking_edit.html', lot=lot)
-
-    # Admin Delete Lot
-    @app.route('/admin/delete-lot/<int:lot_id>')
-    @admin_required
-    def admin_delete_lot(lot_id):
-        lot = ParkingLot.query.get_or_404(lot_id)
-        
-        try:
-            db.session.delete(lot)
+            # lot.Max_Time = int(request.form.get('Max_Time', 60))  #default here too
             db.session.commit()
-        except Exception as e:
+            lot_index.upsert(lot.id, lot.Pincode, lot.Available_Count)
+            if new_max_spots != previous_max_spots:
+                slot_index.reload_lot(lot.id)
+            spot_map.reload_lot(lot.id)
+            publish(lot.id)
+            return redirect(url_for('main.admin_dashboard'))
+        except ValueError as e:
+            # a bad number in the form, or resize_lot refusing to drop occupied/booked spots
             db.session.rollback()
-        
-        return redirect(url_for('admin_dashboard'))
-
-    # Admin User Management
-    @app.route('/admin/users')
-    @admin_required
-    def admin_users():
-        users = User.query.filter(User.Name != 'admin').all()
-        return render_template('admin/users.html', users=users)
-
-    # Admin Delete User
-    @app.route('/admin/delete_user/<int:user_id>', methods=['POST', 'GET'])
-    @admin_required
-    def admin_delete_user(user_id):
-        user = User.query.get_or_404(user_id)
-        if user.reservations and len(user.reservations) > 0:
-            return redirect(url_for('admin_users'))
-
-        try:
-            db.session.delete(user)
-            db.session.commit()
-            print(f"User {user.Name} has been deleted.")
+            print(f'Error editing lot: {e}')
+            error = str(e)
         except Exception as e:
             db.session.rollback()
-        return redirect(url_for('admin_users'))
-
-    # Admin Summary
-    @app.route('/admin/summary')
-    @admin_required
-    def admin_summary():
-        reservations = Reservation.query.order_by(Reservation.in_time.desc()).all()
-        status_counts = Counter([res.status for res in reservations])
-        monthly_counts = Counter()
-        for res in reservations:
-            if res.in_time:
-                month_str = res.in_time.strftime('%b %Y')
-                monthly_counts[month_str] += 1
-
-        sorted_months = sorted(monthly_counts.keys(), key=lambda m: datetime.strptime(m, '%b %Y'))
-        monthly_data = {
-            'labels': sorted_months,
-            'data': [monthly_counts[month] for month in sorted_months]
-        }
-        print('monthly_data:', monthly_data)
-        for res in reservations:
-            if res.out_time:
-                if res.out_time.tzinfo is None:
-                    res.out_time = res.out_time.replace(tzinfo=timezone.utc)
-                res.out_time_display = res.out_time.astimezone(ZoneInfo("Asia/Kolkata"))
-            else:
-                res.out_time_display = None
-
-            if res.in_time:
-                if res.in_time.tzinfo is None:
-                    res.in_time = res.in_time.replace(tzinfo=timezone.utc)
-                res.in_time_display = res.in_time.astimezone(ZoneInfo("Asia/Kolkata"))
-            else:
-                res.in_time_display = None
-
-        return render_template(
-            'admin/summary.html',
-            reservations=reservations,
-            status_counts=status_counts,
-            monthly_data=monthly_data
+            print(f'Error editing lot: {e}')
+            error = 'The lot could not be saved, try again'
+        return render_template('admin/parking_edit.html', lot=lot, spots=spot_map.spots(lot_id), error=error), 400
+
+    return render_template('admin/parking_edit.html', lot=lot, spots=spot_map.spots(lot_id))
+
+# Admin Delete Lot
+@main.route('/admin/delete-lot/<int:lot_id>')
+@admin_required
+def admin_delete_lot(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+    
+    try:
+        # the lot's reservations go with it, so its rollup rows have to as well
+        ReservationDailyStats.query.filter_by(lot_id=lot.id).delete(synchronize_session=False)
+        ReservationArchive.query.filter_by(lot_id=lot.id).delete(synchronize_session=False)
+        LotSpotMap.query.filter_by(lot_id=lot.id).delete(synchronize_session=False)
+        db.session.delete(lot)
+        db.session.commit()
+        lot_index.remove(lot_id)
+        slot_index.remove_lot(lot_id)
+        spot_map.remove_lot(lot_id)
+        publish(lot_id)
+    except Exception as e:
+        db.session.rollback()
+    
+    return redirect(url_for('main.admin_dashboard'))
+
+# Admin User Management
+@main.route('/admin/users')
+@admin_required
+def admin_users():
+    search = request.args.get('search', '').strip()
+    cursor = request.args.get('cursor', 0, type=int)  # last user id of the previous page, keyset from 0 so the pk is used
+
+    page = db.select(User.id, User.Name, User.Email, User.Phone, User.Pincode, User.Vehicle_Number).where(
+        User.Name != 'admin', User.id > cursor
+    )
+    order = User.id
+    if search:
+        # prefix match only, so the NOCASE indexes on Name/Email/Phone are used
+        pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        page = page.where(
+            (User.Name.like(pattern, escape='\\')) |
+            (User.Email.like(pattern, escape='\\')) |
+            (User.Phone.like(pattern, escape='\\'))
+        )
+        order = User.id + 0  # otherwise sqlite walks the whole pk in order instead of using those indexes
+    page = page.order_by(order).limit(PER_PAGE + 1).cte('page')
+
+    # reservation counts and last status for just this page's users, in the same query
+    counts = (
+        db.select(
+            Reservation.user_id,
+            db.func.count(Reservation.id).label('reservation_count'),
+            db.func.sum(db.case((Reservation.status == 'active', 1), else_=0)).label('active_count'),
+            db.func.max(Reservation.id).label('last_id')
         )
+        .where(Reservation.user_id.in_(db.select(page.c.id)))
+        .group_by(Reservation.user_id)
+        .subquery()
+    )
+    last = db.aliased(Reservation)
+    users = db.session.execute(
+        db.select(
+            page,
+            (db.func.coalesce(counts.c.reservation_count, 0) + db.func.coalesce(UserArchiveTotals.reservations, 0)).label('reservation_count'),
+            db.func.coalesce(counts.c.active_count, 0).label('active_count'),
+            last.status.label('last_status')
+        )
+        .outerjoin(counts, counts.c.user_id == page.c.id)
+        .outerjoin(last, last.id == counts.c.last_id)
+        .outerjoin(UserArchiveTotals, UserArchiveTotals.user_id == page.c.id)  # archived reservations still count
+        .order_by(page.c.id)
+    ).all()
+
+    next_cursor = None
+    if len(users) > PER_PAGE:
+        users = users[:PER_PAGE]
+        next_cursor = users[-1].id
+    return render_template('admin/users.html', users=users, search=search, next_cursor=next_cursor)
+
+# Admin Delete User
+@main.route('/admin/delete_user/<int:user_id>', methods=['POST', 'GET'])
+@admin_required
+def admin_delete_user(user_id):
+    user = User.query.get_or_404(user_id)
+    if (db.session.query(db.select(Reservation.id).where(Reservation.user_id == user_id).exists()).scalar()
+            or db.session.query(db.select(SlotBooking.id).where(SlotBooking.user_id == user_id).exists()).scalar()
+            or has_archived(user_id)):
+        return redirect(url_for('main.admin_users'))
+
+    try:
+        db.session.delete(user)
+        db.session.commit()
+        forget_user(user_id)
+        print(f"User {user.Name} has been deleted.")
+    except Exception as e:
+        db.session.rollback()
+    return redirect(url_for('main.admin_users'))
+
+# Admin Summary
+@main.route('/admin/summary')
+@admin_required
+def admin_summary():
+    reservations, next_cursor = page_reservations()
+
+    totals = db.session.query(
+        db.func.coalesce(db.func.sum(ReservationDailyStats.reservations), 0),
+        db.func.coalesce(db.func.sum(ReservationDailyStats.completed), 0),
+        db.func.coalesce(db.func.sum(ReservationDailyStats.cancelled), 0)
+    ).one()
+    status_counts = Counter({
+        'active': totals[0] - totals[1] - totals[2],
+        'completed': totals[1],
+        'cancelled': totals[2]
+    })
+    status_counts = +status_counts  # drop zero entries so the chart only shows real statuses
+    month = db.func.strftime('%Y-%m', ReservationDailyStats.day)
+    monthly_rows = (
+        db.session.query(
+            month,
+            db.func.sum(ReservationDailyStats.reservations),
+            db.func.sum(ReservationDailyStats.revenue)
+        )
+        .group_by(month)
+        .order_by(month)
+        .all()
+    )
+    monthly_data = {
+        'labels': [datetime.strptime(key, '%Y-%m').strftime('%b %Y') for key, _, _ in monthly_rows],
+        'data': [count for _, count, _ in monthly_rows],
+        'revenue': [round(revenue, 2) for _, _, revenue in monthly_rows]
+    }
+    print('monthly_data:', monthly_data)
+
+    return render_template(
+        'admin/summary.html',
+        reservations=reservations,
+        next_cursor=next_cursor,
+        status_counts=status_counts,
+        monthly_data=monthly_data
+    )
+
+
+# Admin Stats (json)
+@main.route('/admin/stats')
+@admin_required
+def admin_stats():
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        return jsonify(error='dates must be YYYY-MM-DD'), 400
+
+    days = [
+        {
+            'day': row.day.isoformat(),
+            'lot_id': row.lot_id,
+            'reservations': row.reservations,
+            'completed': row.completed,
+            'cancelled': row.cancelled,
+            'revenue': round(row.revenue, 2),
+            'parked_hours': round(row.parked_hours, 2)
+        }
+        for row in daily_rows(start, end, request.args.get('lot_id', type=int))
+    ]
+    totals = {
+        key: round(sum(day[key] for day in days), 2)
+        for key in ('reservations', 'completed', 'cancelled', 'revenue', 'parked_hours')
+    }
+    return jsonify(days=days, totals=totals)
+
+
+# Admin Export
+def export_response(name, columns, chunks):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify(error=f'format must be one of {", ".join(export.FORMATS)}'), 400
+    if fmt == 'csv':
+        body, mimetype = export.to_csv(columns, chunks), 'text/csv'
+    elif export.load_pyarrow() is None:
+        return jsonify(error=f'{fmt} export needs pyarrow installed'), 400
+    else:
+        body = export.to_columnar(columns, chunks, fmt)
+        mimetype = 'application/vnd.apache.parquet' if fmt == 'parquet' else 'application/vnd.apache.arrow.stream'
+    filename = f'{name}.{"arrows" if fmt == "arrow" else fmt}'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@main.route('/admin/export/reservations')
+@admin_required
+def admin_export_reservations():
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        return jsonify(error='dates must be YYYY-MM-DD'), 400
+    chunks = export.reservation_rows(start, end, request.args.get('lot_id', type=int))
+    return export_response('reservations', export.RESERVATION_COLUMNS, chunks)
+
+@main.route('/admin/export/lots')
+@admin_required
+def admin_export_lots():
+    chunks = export.lot_rows(request.args.get('lot_id', type=int))
+    return export_response('lots', export.LOT_COLUMNS, chunks)
+
+# Admin bulk import: the upload is saved to UPLOAD_FOLDER and imported on a background thread
+@main.route('/admin/import', methods=['GET', 'POST'])
+@admin_required
+def admin_import():
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in importer.KINDS or not upload or not upload.filename:
+            return render_template('admin/import.html', imports=importer.recent_imports(),
+                                   error='Choose what to import and a csv file'), 400
+        filename = secure_filename(upload.filename) or 'upload.csv'
+        folder = current_app.config['UPLOAD_FOLDER']
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'import-{time.time_ns()}-{filename}')
+        upload.save(path)
+        importer.start_import(current_app._get_current_object(), kind, path, filename,
+                              created_by=session.get('user_id'))
+        return redirect(url_for('main.admin_import'))
+    return render_template('admin/import.html', imports=importer.recent_imports())
 
 
 ########################################### THE END ##########################################
@@ -0,0 +1,335 @@
+"""Advance bookings of time slots.
+
+A SlotBooking holds one spot for a future [start_time, end_time). Walk-ins
+(Reservation) keep working as before, but a walk-in will not take a spot that
+has a slot starting before the lot's Max_Time is up, and a slot will not go to
+a spot a walk-in is still entitled to.
+
+slot_index keeps every spot's busy intervals in memory so "first free spot in
+this lot for [start, end)" never has to ask the database. The database stays
+the authority: the insert itself re-checks for clashes, and a spot the index
+got wrong is reloaded and the next one tried.
+"""
+import time
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from models import db, ParkingLot, ParkingSpot, Reservation, SlotBooking
+from billing import utcnow, tariff, duration_hours, EPOCH
+
+REFRESH_SECONDS = 5  # other workers' bookings and cancellations show up within this long
+PRUNE_SECONDS = 3600  # how often intervals that are over get dropped
+MAX_DAYS_AHEAD = 30
+MAX_HOURS = 24
+MAX_SLOT_RETRIES = 5
+OPEN_ENDED = 2 ** 62  # walk-ins in lots without a Max_Time hold their spot until released
+
+
+def epoch(value):
+    return round((value - EPOCH).total_seconds())
+
+
+def _epoch_column(column):
+    # let sqlite turn the stored text into epoch seconds, building a million datetimes is the slow part otherwise.
+    # julianday is a double, so round to the second the same way epoch() does; slot times are whole seconds
+    return db.cast(db.func.round((db.func.julianday(column) - 2440587.5) * 86400), db.Integer)
+
+
+class SpotSchedule:
+    """Busy intervals of one spot, as two sorted arrays of epoch seconds.
+
+    Intervals never overlap, so the ends are sorted too, and the only interval
+    that can clash with [start, end) is the last one starting before `end`.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+
+    def is_free(self, start, end):
+        i = bisect_left(self.starts, end)
+        return i == 0 or self.ends[i - 1] <= start
+
+    def add(self, start, end):
+        i = bisect_left(self.starts, start)
+        if i < len(self.starts) and self.starts[i] == start:
+            self.ends[i] = end
+            return
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+    def remove(self, start):
+        i = bisect_left(self.starts, start)
+        if i < len(self.starts) and self.starts[i] == start:
+            del self.starts[i]
+            del self.ends[i]
+
+    def prune(self, before):
+        i = bisect_right(self.ends, before)
+        if i:
+            del self.starts[:i]
+            del self.ends[:i]
+
+
+class SlotIndex:
+    """Busy intervals of every spot (upcoming slots and current walk-ins), grouped by lot.
+
+    Loaded on first use rather than at startup, since it reads every upcoming
+    booking. This process keeps it current through the update hooks below; new
+    bookings and cancellations from other workers are polled for every
+    REFRESH_SECONDS. A walk-in released early by another worker keeps its spot
+    looking busy here until its Max_Time would have run out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spots = {}  # spot_id -> SpotSchedule
+        self._lots = {}  # lot_id -> array of spot ids, ascending
+        self._synced_at = None
+        self._pruned_at = None
+        self._last_id = 0  # highest SlotBooking id seen
+        self._polled_at = None  # utc, cancellations after this are still to be applied
+
+    def reload(self):
+        now = utcnow()
+        # read before the bookings, so anything inserted meanwhile comes round again in the next poll
+        last_id = db.session.query(db.func.max(SlotBooking.id)).scalar() or 0
+        spots = db.session.execute(
+            db.select(ParkingSpot.id, ParkingSpot.lot_id).order_by(ParkingSpot.lot_id, ParkingSpot.id)
+        ).all()
+        lots, schedules = {}, {}
+        for spot_id, lot_id in spots:
+            lots.setdefault(lot_id, array('q')).append(spot_id)
+            schedules[spot_id] = SpotSchedule()
+        # straight off the covering (status, end_time, ...) index, through core rather than the orm, no sort:
+        # a spot's intervals don't overlap, so in end_time order they are in start order too and appends keep it
+        slots = db.session.connection().execution_options(yield_per=10000).execute(
+            db.select(SlotBooking.spot_id, _epoch_column(SlotBooking.start_time), _epoch_column(SlotBooking.end_time))
+            .where(SlotBooking.status == 'booked', SlotBooking.end_time > now)
+        )
+        for spot_id, start, end in slots:
+            schedule = schedules.get(spot_id)
+            if schedule is not None:
+                schedule.starts.append(start)
+                schedule.ends.append(end)
+        for spot_id, start, end in _walk_ins():
+            if spot_id in schedules:
+                schedules[spot_id].add(start, end)
+        with self._lock:
+            self._spots, self._lots = schedules, lots
+            self._last_id, self._polled_at = last_id, now
+            self._synced_at = self._pruned_at = time.monotonic()
+
+    def invalidate(self):
+        self._synced_at = None
+
+    def _sync(self):
+        if self._synced_at is None:
+            self.reload()
+        elif time.monotonic() - self._synced_at > REFRESH_SECONDS:
+            self._poll()
+
+    def _poll(self):
+        now = utcnow()
+        added = db.session.execute(
+            db.select(SlotBooking.id, SlotBooking.spot_id,
+                      _epoch_column(SlotBooking.start_time), _epoch_column(SlotBooking.end_time))
+            .where(SlotBooking.id > self._last_id, SlotBooking.status == 'booked')
+        ).all()
+        cancelled = db.session.execute(
+            db.select(SlotBooking.spot_id, _epoch_column(SlotBooking.start_time))
+            .where(SlotBooking.cancelled_at >= self._polled_at - timedelta(seconds=1))
+        ).all()
+        with self._lock:
+            # cancellations first: a new booking may start where a cancelled one did
+            for spot_id, start in cancelled:
+                if spot_id in self._spots:
+                    self._spots[spot_id].remove(start)
+            for booking_id, spot_id, start, end in added:
+                if spot_id in self._spots:
+                    self._spots[spot_id].add(start, end)
+                self._last_id = max(self._last_id, booking_id)
+            self._polled_at = now
+            self._synced_at = time.monotonic()
+            if self._synced_at - self._pruned_at > PRUNE_SECONDS:
+                for schedule in self._spots.values():
+                    schedule.prune(epoch(now))
+                self._pruned_at = self._synced_at
+
+    def first_free(self, lot_id, start, end, skip=()):
+        """Lowest spot id in the lot with nothing booked in [start, end) (naive utc), or None."""
+        self._sync()
+        start, end = epoch(start), epoch(end)
+        with self._lock:
+            spots = self._spots
+            for spot_id in self._lots.get(lot_id, ()):
+                if spot_id not in skip and spots[spot_id].is_free(start, end):
+                    return spot_id
+        return None
+
+    # update hooks, called after the commit; nothing to do until the index is loaded
+
+    def add(self, spot_id, start, end=None):
+        if self._synced_at is None:
+            return
+        with self._lock:
+            if spot_id in self._spots:
+                self._spots[spot_id].add(epoch(start), OPEN_ENDED if end is None else epoch(end))
+
+    def remove(self, spot_id, start):
+        if self._synced_at is None:
+            return
+        with self._lock:
+            if spot_id in self._spots:
+                self._spots[spot_id].remove(epoch(start))
+
+    def reload_spot(self, spot_id):
+        if self._synced_at is None:
+            return
+        schedule = SpotSchedule()
+        rows = db.session.execute(
+            db.select(_epoch_column(SlotBooking.start_time), _epoch_column(SlotBooking.end_time))
+            .where(SlotBooking.spot_id == spot_id, SlotBooking.status == 'booked', SlotBooking.end_time > utcnow())
+        ).all()
+        for start, end in rows:
+            schedule.add(start, end)
+        for _, start, end in _walk_ins(spot_id):
+            schedule.add(start, end)
+        with self._lock:
+            if spot_id in self._spots:
+                self._spots[spot_id] = schedule
+
+    def reload_lot(self, lot_id):
+        """Pick up spots added to or removed from the lot."""
+        self.reload_lots([lot_id])
+
+    def reload_lots(self, lot_ids):
+        if self._synced_at is None:
+            return
+        found = {lot_id: array('q') for lot_id in lot_ids}
+        rows = db.session.execute(
+            db.select(ParkingSpot.lot_id, ParkingSpot.id).where(ParkingSpot.lot_id.in_(lot_ids))
+            .order_by(ParkingSpot.lot_id, ParkingSpot.id)
+        )
+        for lot_id, spot_id in rows:
+            found[lot_id].append(spot_id)
+        with self._lock:
+            for lot_id, spot_ids in found.items():
+                for spot_id in set(self._lots.get(lot_id, ())) - set(spot_ids):
+                    self._spots.pop(spot_id, None)
+                for spot_id in spot_ids:
+                    self._spots.setdefault(spot_id, SpotSchedule())
+                self._lots[lot_id] = spot_ids
+
+    def remove_lot(self, lot_id):
+        with self._lock:
+            for spot_id in self._lots.pop(lot_id, ()):
+                self._spots.pop(spot_id, None)
+
+
+def _walk_ins(spot_id=None):
+    """(spot_id, start, end) in epoch seconds for active walk-ins; they run until in_time + the lot's Max_Time."""
+    query = (
+        db.select(Reservation.spot_id, _epoch_column(Reservation.in_time), ParkingLot.Max_Time)
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+        .where(Reservation.status == 'active')
+    )
+    if spot_id is not None:
+        query = query.where(Reservation.spot_id == spot_id)
+    return [(spot, start, start + max_time * 60 if max_time else OPEN_ENDED)
+            for spot, start, max_time in db.session.execute(query)]
+
+
+slot_index = SlotIndex()
+
+
+def check_window(start, end, lot=None):
+    """Why [start, end) can't be booked (in `lot`, if given), or None if it can."""
+    now = utcnow()
+    if end <= start:
+        return 'end must be after start'
+    if start < now:
+        return 'start is in the past'
+    if start > now + timedelta(days=MAX_DAYS_AHEAD):
+        return f'slots can be booked at most {MAX_DAYS_AHEAD} days ahead'
+    if end - start > timedelta(hours=MAX_HOURS):
+        return f'slots can be at most {MAX_HOURS} hours long'
+    if lot is not None and lot.Max_Time and end - start > timedelta(minutes=lot.Max_Time):
+        return f'this lot allows stays of at most {lot.Max_Time} minutes'
+    return None
+
+
+def book_slot(user_id, lot, start, end):
+    """Hold the first free spot in the lot for [start, end). Returns the SlotBooking, or None if none is free."""
+    start, end = start.replace(microsecond=0), end.replace(microsecond=0)
+    tried = set()
+    for _ in range(MAX_SLOT_RETRIES):
+        spot_id = slot_index.first_free(lot.id, start, end, skip=tried)
+        if spot_id is None:
+            return None
+        booking_id = _insert_if_free(spot_id, lot, user_id, start, end)
+        if booking_id is not None:
+            db.session.commit()
+            slot_index.add(spot_id, start, end)
+            return db.session.get(SlotBooking, booking_id)
+        db.session.rollback()
+        tried.add(spot_id)
+        slot_index.reload_spot(spot_id)  # someone else got there first, or a walk-in this process didn't know about
+    return None
+
+
+def _insert_if_free(spot_id, lot, user_id, start, end):
+    # one INSERT ... SELECT ... WHERE NOT EXISTS, so the check and the write can't be split by another writer
+    clash = db.select(SlotBooking.id).where(
+        SlotBooking.spot_id == spot_id, SlotBooking.status == 'booked',
+        SlotBooking.end_time > start, SlotBooking.start_time < end
+    )
+    walk_in = db.select(Reservation.id).where(Reservation.spot_id == spot_id, Reservation.status == 'active')
+    if lot.Max_Time:
+        walk_in = walk_in.where(Reservation.in_time > start - timedelta(minutes=lot.Max_Time))
+    row = db.select(
+        db.literal(spot_id), db.literal(lot.id), db.literal(user_id),
+        db.literal(start, db.DateTime), db.literal(end, db.DateTime), db.literal('booked'),
+        db.literal(tariff(duration_hours(start, end), lot.Price)), db.literal(utcnow(), db.DateTime)
+    ).where(~clash.exists(), ~walk_in.exists())
+    table = SlotBooking.__table__
+    return db.session.execute(
+        table.insert().from_select(
+            ['spot_id', 'lot_id', 'user_id', 'start_time', 'end_time', 'status', 'total_cost', 'created_at'], row
+        ).returning(table.c.id)
+    ).scalar()
+
+
+def cancel_slot(booking):
+    booking.status = 'cancelled'
+    booking.cancelled_at = utcnow()
+    db.session.commit()
+    slot_index.remove(booking.spot_id, booking.start_time)
+
+
+def search_slots(pincode_prefix, start, end, limit=20):
+    """Lots under the pincode prefix with a spot free for [start, end), with a quote, in pincode then id order.
+
+    Only a prefix comes in, so there is no one pincode to rank by distance from the way nearby.py does.
+    """
+    pattern = pincode_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    lots = db.session.execute(
+        db.select(ParkingLot.id, ParkingLot.Location, ParkingLot.Pincode, ParkingLot.Price, ParkingLot.Max_Time)
+        .where(ParkingLot.Pincode.like(pattern, escape='\\'))
+        .order_by(ParkingLot.Pincode, ParkingLot.id)
+    ).all()
+    hours = duration_hours(start, end)
+    found = []
+    for lot in lots:
+        if lot.Max_Time and hours * 60 > lot.Max_Time:
+            continue
+        spot_id = slot_index.first_free(lot.id, start, end)
+        if spot_id is not None:
+            found.append({'lot_id': lot.id, 'location': lot.Location, 'pincode': lot.Pincode,
+                          'spot_id': spot_id, 'total_cost': tariff(hours, lot.Price)})
+            if len(found) >= limit:
+                break
+    return found
@@ -0,0 +1,121 @@
+import json
+import secrets
+from datetime import timedelta
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from sqlalchemy.dialects.sqlite import insert
+from models import db, WebSession
+from billing import utcnow
+from cache import LRUCache
+
+
+AUTH_KEYS = ('user_id', 'admin_logged_in')
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.logged_in_as = self.auth()
+        self.auth_set = False
+
+    def auth(self):
+        return tuple(self.get(key) for key in AUTH_KEYS)
+
+    def __setitem__(self, key, value):
+        if key in AUTH_KEYS:
+            self.auth_set = True
+        super().__setitem__(key, value)
+
+    @property
+    def auth_changed(self):
+        # a login or logout: the id goes with it, so one planted on the browser beforehand is worth nothing
+        return self.auth_set or self.auth() != self.logged_in_as
+
+
+class DatabaseSessionInterface(SessionInterface):
+    """Flask sessions kept in the web_session table.
+
+    The cookie holds a random id and nothing else, and a new one is issued
+    whenever the session logs in or out. Rows read in the last few
+    seconds (SESSION_CACHE_TTL) are served from memory, so most requests don't
+    touch the table; a logout in another process is seen once that runs out.
+    Sessions are only written back when they changed or are past half their
+    lifetime, so ordinary page views don't write at all.
+    """
+
+    def __init__(self, cache_ttl=5):
+        self.cache = LRUCache(max_entries=10000, ttl=cache_ttl)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = self.cache.get(sid)
+            if row is None:
+                row = db.session.execute(
+                    db.select(WebSession.data, WebSession.expires_at).where(WebSession.id == sid)
+                ).first()
+                if row is not None:
+                    row = (row.data, row.expires_at)
+                    self.cache.set(sid, row)
+            if row is not None and row[1] > utcnow():
+                return ServerSession(json.loads(row[0]), sid=sid, expires_at=row[1])
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        table = WebSession.__table__
+        response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and session.sid:
+                with db.engine.begin() as conn:
+                    conn.execute(table.delete().where(table.c.id == session.sid))
+                self.cache.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime
+        stale = session.expires_at is None or session.expires_at - utcnow() < lifetime / 2
+        if not session.modified and not stale:
+            return
+        if session.sid is not None and session.auth_changed:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.id == session.sid))
+            self.cache.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        expires_at = utcnow() + lifetime
+        values = dict(id=session.sid, data=json.dumps(dict(session), separators=(',', ':')), expires_at=expires_at)
+        stmt = insert(table).values(**values)
+        with db.engine.begin() as conn:
+            conn.execute(stmt.on_conflict_do_update(index_elements=[table.c.id], set_=values))
+        self.cache.set(session.sid, (values['data'], expires_at))
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def prune_sessions():
+    """Delete expired sessions, returns how many went."""
+    table = WebSession.__table__
+    result = db.session.execute(table.delete().where(table.c.expires_at <= utcnow()))
+    db.session.commit()
+    return result.rowcount
+
+
+def init_sessions(app):
+    app.session_interface = DatabaseSessionInterface(cache_ttl=app.config.get('SESSION_CACHE_TTL', 5))
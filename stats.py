@@ -0,0 +1,88 @@
+from sqlalchemy.dialects.sqlite import insert
+from models import db, Reservation, ReservationArchive, ParkingSpot, ReservationDailyStats
+from billing import local_date
+
+
+def record_booking(reservation, lot_id):
+    _bump(reservation.in_time, lot_id, reservations=1)
+
+
+def record_completion(reservation, lot_id):
+    _bump(reservation.in_time, lot_id, completed=1,
+          revenue=reservation.total_cost or 0,
+          parked_hours=max(reservation.duration_hours or 0, 0))
+
+
+def _bump(in_time, lot_id, **amounts):
+    _bump_day(local_date(in_time), lot_id, **amounts)
+
+
+def _bump_day(day, lot_id, **amounts):
+    # upsert so the first event of the day creates the row, later ones add to it
+    values = dict(day=day, lot_id=lot_id, reservations=0, completed=0,
+                  cancelled=0, revenue=0, parked_hours=0)
+    values.update(amounts)
+    table = ReservationDailyStats.__table__
+    stmt = insert(table).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.lot_id],
+        set_={name: table.c[name] + stmt.excluded[name] for name in amounts}
+    )
+    db.session.execute(stmt)
+
+
+def rebuild_daily_stats():
+    """Recompute the whole rollup from Reservation and the archive in one INSERT ... SELECT."""
+    history = db.union_all(
+        db.select(Reservation.in_time, Reservation.out_time, Reservation.status, Reservation.total_cost, ParkingSpot.lot_id)
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id),
+        db.select(ReservationArchive.in_time, ReservationArchive.out_time, ReservationArchive.status,
+                  ReservationArchive.total_cost, ReservationArchive.lot_id)
+    ).subquery()
+    completed = history.c.status == 'completed'
+    hours = (db.func.julianday(history.c.out_time) - db.func.julianday(history.c.in_time)) * 24
+    day = db.func.date(history.c.in_time, '+5 hours', '+30 minutes')  # local (ist) day, same as local_date()
+    rows = (
+        db.select(
+            day,
+            history.c.lot_id,
+            db.func.count(),
+            db.func.sum(db.case((completed, 1), else_=0)),
+            db.func.sum(db.case((history.c.status == 'cancelled', 1), else_=0)),
+            db.func.coalesce(db.func.sum(db.case((completed, history.c.total_cost), else_=0)), 0),
+            db.func.coalesce(db.func.sum(db.case((completed, db.func.max(hours, 0)), else_=0)), 0)
+        )
+        .where(history.c.in_time.isnot(None))
+        .group_by(day, history.c.lot_id)
+    )
+    table = ReservationDailyStats.__table__
+    db.session.execute(table.delete())
+    db.session.execute(table.insert().from_select(
+        ['day', 'lot_id', 'reservations', 'completed', 'cancelled', 'revenue', 'parked_hours'], rows
+    ))
+    db.session.commit()
+    return db.session.query(db.func.count()).select_from(table).scalar()
+
+
+def record_completions(items):
+    """Bulk version of record_completion for (in_time, lot_id, revenue, parked_hours) tuples."""
+    totals = {}
+    for in_time, lot_id, revenue, hours in items:
+        key = (local_date(in_time), lot_id)
+        count, rev, hrs = totals.get(key, (0, 0, 0))
+        totals[key] = (count + 1, rev + (revenue or 0), hrs + max(hours or 0, 0))
+    for (day, lot_id), (count, revenue, hours) in totals.items():
+        _bump_day(day, lot_id, completed=count, revenue=revenue, parked_hours=hours)
+
+
+def daily_rows(start=None, end=None, lot_id=None):
+    """Rollup rows (day, lot_id, reservations, completed, cancelled, revenue, parked_hours), oldest first."""
+    table = ReservationDailyStats.__table__
+    query = db.select(table).order_by(table.c.day, table.c.lot_id)
+    if start:
+        query = query.where(table.c.day >= start)
+    if end:
+        query = query.where(table.c.day <= end)
+    if lot_id:
+        query = query.where(table.c.lot_id == lot_id)
+    return db.session.execute(query).all()
@@ -0,0 +1,137 @@
+import time
+import threading
+from datetime import timedelta
+from models import db, Reservation, ParkingSpot, ParkingLot
+from stats import record_completions
+from nearby import lot_index
+from occupancy import spot_map
+from jobs import enqueue_many
+from events import publish
+from billing import utcnow, bill_batch
+
+BATCH_SIZE = 1000
+
+
+def sweep_expired(batch_size=BATCH_SIZE, max_seconds=30, now=None):
+    """Complete active reservations that have run past their lot's Max_Time.
+
+    Works in batches of `batch_size`, each one a single transaction: the overdue
+    reservations are claimed with one UPDATE ... RETURNING, charged for Max_Time,
+    and their spots freed with one bulk UPDATE. Stops after `max_seconds` so a
+    large backlog is spread over several runs. Returns the number completed.
+    """
+    if now is None:
+        now = utcnow()
+    shortest = db.session.query(db.func.min(ParkingLot.Max_Time)).filter(ParkingLot.Max_Time > 0).scalar()
+    if shortest is None:
+        return 0
+
+    started = time.monotonic()
+    completed = 0
+    while time.monotonic() - started < max_seconds:
+        rows = (
+            db.session.query(
+                Reservation.id, Reservation.user_id, Reservation.spot_id, Reservation.in_time,
+                ParkingSpot.lot_id, ParkingLot.Price, ParkingLot.Max_Time
+            )
+            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+            .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+            # the first bound is a plain range on (status, in_time) and narrows the scan,
+            # the second applies each lot's own limit
+            .filter(Reservation.status == 'active', Reservation.in_time < now - timedelta(minutes=shortest))
+            .filter(ParkingLot.Max_Time > 0)
+            .filter(db.func.julianday(Reservation.in_time) + ParkingLot.Max_Time / 1440.0 < db.func.julianday(now))
+            .order_by(Reservation.in_time, Reservation.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        completed += _complete_batch(rows)
+    return completed
+
+
+def _complete_batch(rows):
+    table = Reservation.__table__
+    # claim first, a user may have released some of these since the select
+    claimed = set(db.session.execute(
+        table.update()
+        .where(table.c.id.in_([row.id for row in rows]), table.c.status == 'active')
+        .values(status='completed')
+        .returning(table.c.id)
+    ).scalars())
+    rows = [row for row in rows if row.id in claimed]
+    if not rows:
+        db.session.commit()
+        return 0
+
+    # they are billed up to the moment they expired
+    out_times = [row.in_time + timedelta(minutes=row.Max_Time) for row in rows]
+    hours, costs = bill_batch([row.in_time for row in rows], out_times, [row.Price for row in rows])
+    charges = [
+        {'res_id': row.id, 'out_time': out_time, 'total_cost': float(cost), 'hours': float(h)}
+        for row, out_time, cost, h in zip(rows, out_times, costs, hours)
+    ]
+    db.session.execute(
+        table.update()
+        .where(table.c.id == db.bindparam('res_id'))
+        .values(out_time=db.bindparam('out_time'), total_cost=db.bindparam('total_cost')),
+        charges
+    )
+    # the counters move by the spots actually flipped, one already back at 'A' mustn't be freed twice
+    spot_table = ParkingSpot.__table__
+    flipped = db.session.execute(
+        spot_table.update()
+        .where(spot_table.c.id.in_([row.spot_id for row in rows]), spot_table.c.status == 'O')
+        .values(status='A')
+        .returning(spot_table.c.id, spot_table.c.lot_id)
+    ).all()
+
+    per_lot, spots = {}, {}
+    for spot_id, lot_id in flipped:
+        per_lot[lot_id] = per_lot.get(lot_id, 0) + 1
+        spots.setdefault(lot_id, []).append(spot_id)
+    if per_lot:
+        db.session.execute(
+            ParkingLot.__table__.update()
+            .where(ParkingLot.__table__.c.id == db.bindparam('lot'))
+            .values(
+                Available_Count=ParkingLot.__table__.c.Available_Count + db.bindparam('freed'),
+                Occupied_Count=ParkingLot.__table__.c.Occupied_Count - db.bindparam('freed'),
+                Version=ParkingLot.__table__.c.Version + 1
+            ),
+            [{'lot': lot_id, 'freed': freed} for lot_id, freed in per_lot.items()]
+        )
+    record_completions(
+        (row.in_time, row.lot_id, charge['total_cost'], charge['hours'])
+        for row, charge in zip(rows, charges)
+    )
+    db.session.commit()
+
+    for lot_id, freed in per_lot.items():
+        lot_index.adjust(lot_id, freed)
+        spot_map.set(lot_id, spots[lot_id], occupied=False)
+        publish(lot_id)
+    enqueue_many('release_receipt', (
+        {'reservation_id': row.id, 'user_id': row.user_id, 'lot_id': row.lot_id, 'total_cost': charge['total_cost']}
+        for row, charge in zip(rows, charges)
+    ))
+    print(f'Expired {len(rows)} overstayed reservation(s)')
+    return len(rows)
+
+
+def start_sweeper(app, interval):
+    """Run sweep_expired every `interval` seconds on a daemon thread."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    sweep_expired(max_seconds=max(1, interval // 2))
+                except Exception as e:
+                    db.session.rollback()
+                    print(f'Error sweeping expired reservations: {e}')
+
+    thread = threading.Thread(target=loop, name='sweeper', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,38 @@
+from sqlalchemy import event
+
+from models import db
+from cache import get_cache
+from bench.seed import seed
+
+
+def dashboard_selects(app, client):
+    """SELECTs run by one cold render of the admin dashboard, every lot card drawn afresh."""
+    with app.app_context():
+        get_cache().clear()
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            response = client.get('/admin/dashboard')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+    assert response.status_code == 200
+    return statements
+
+
+def test_dashboard_query_count_does_not_grow_with_lots(app, admin_client):
+    with app.app_context():
+        seed(1, 10, 1, 0)
+    admin_client.get('/admin/dashboard')  # loads the session and the spot bitmaps
+    one_lot = dashboard_selects(app, admin_client)
+
+    with app.app_context():
+        seed(40, 10, 0, 0, seed=7)
+    admin_client.get('/admin/dashboard')
+    many_lots = dashboard_selects(app, admin_client)
+
+    assert len(many_lots) == len(one_lot), many_lots
@@ -0,0 +1,47 @@
+from models import db, ParkingLot, ParkingSpot, ReservationDailyStats
+from booking import book, release
+from nearby import lot_index
+from bench.seed import seed
+
+
+def completions():
+    return db.session.query(db.func.coalesce(db.func.sum(ReservationDailyStats.completed), 0)).scalar()
+
+
+def test_releasing_twice_frees_the_spot_once(app):
+    with app.app_context():
+        seed(1, 2, 1, 0)
+        lot_id = db.session.query(ParkingLot.id).scalar()
+        lot_index.reload()
+
+        reservation = book(1, lot_id)
+        assert lot_index._available[lot_id] == 1
+        assert release(reservation) is reservation
+        out_time, total_cost = reservation.out_time, reservation.total_cost
+        assert release(reservation) is None
+
+        lot = db.session.get(ParkingLot, lot_id)
+        assert (lot.Available_Count, lot.Occupied_Count) == (2, 0)
+        assert lot_index._available[lot_id] == 2
+        assert (reservation.status, reservation.out_time, reservation.total_cost) == ('completed', out_time, total_cost)
+        assert completions() == 1
+
+
+def test_a_second_release_leaves_a_rebooked_spot_alone(app):
+    with app.app_context():
+        seed(1, 1, 2, 0)
+        lot_id = db.session.query(ParkingLot.id).scalar()
+        lot_index.reload()
+
+        first = book(1, lot_id)
+        release(first)
+        second = book(2, lot_id)
+        assert second.spot_id == first.spot_id
+        assert release(first) is None
+
+        assert db.session.get(ParkingSpot, second.spot_id).status == 'O'
+        assert second.status == 'active'
+        lot = db.session.get(ParkingLot, lot_id)
+        assert (lot.Available_Count, lot.Occupied_Count) == (0, 1)
+        assert lot_index._available[lot_id] == 0
+        assert completions() == 1
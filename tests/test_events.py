@@ -0,0 +1,47 @@
+import json
+import tracemalloc
+
+from models import db, ParkingLot
+from events import AvailabilityHub
+from booking import book
+from bench.seed import seed
+
+SUBSCRIBERS = 3000
+MAX_BYTES_PER_SUBSCRIBER = 1024
+
+
+def test_idle_subscribers_get_one_update_per_burst(app):
+    with app.app_context():
+        seed(10, 5, 10, 0, seed=3)
+        lots = db.session.query(ParkingLot.id, ParkingLot.Pincode).all()
+    prefixes = sorted({pincode[:2] for _, pincode in lots})
+    hub = AvailabilityHub(app, interval=3600)  # flushed by hand below
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    subscribers = [hub.subscribe(prefixes[i % len(prefixes)]) for i in range(SUBSCRIBERS)]
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert held / SUBSCRIBERS < MAX_BYTES_PER_SUBSCRIBER
+    assert hub.subscriber_count() == SUBSCRIBERS
+
+    # a burst of bookings, several on each lot, before the flusher runs
+    with app.app_context():
+        for _ in range(3):
+            for lot_id, _ in lots:
+                book(1, lot_id)
+                hub.publish(lot_id)
+    assert hub.flush() == SUBSCRIBERS
+
+    for subscriber in subscribers:
+        message = hub.next_message(subscriber, timeout=0)
+        assert message is not None
+        assert hub.next_message(subscriber, timeout=0) is None
+        deltas = json.loads(message.split('data: ', 1)[1])
+        expected = {lot_id for lot_id, pincode in lots if pincode.startswith(subscriber.prefix)}
+        assert {delta['lot_id'] for delta in deltas} == expected
+        assert all(delta['occupied'] == 3 for delta in deltas)
+
+    for subscriber in subscribers:
+        hub.unsubscribe(subscriber)
+    assert hub.subscriber_count() == 0
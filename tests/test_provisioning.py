@@ -0,0 +1,78 @@
+import time
+
+from models import db, ParkingLot, ParkingSpot
+
+LOT_FORM = {'Location': 'Big Lot', 'Address': '1 Big Road', 'Pincode': '560001', 'Price': '20'}
+
+
+def spot_ids(app, lot_id):
+    with app.app_context():
+        return [spot_id for (spot_id,) in db.session.query(ParkingSpot.id)
+                .filter(ParkingSpot.lot_id == lot_id).order_by(ParkingSpot.id)]
+
+
+def test_creating_a_5000_spot_lot_takes_milliseconds(app, admin_client):
+    admin_client.get('/admin/dashboard')  # session, first-request setup
+    started = time.perf_counter()
+    response = admin_client.post('/admin/add-lot', data=dict(LOT_FORM, Max_Spots='5000'))
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 302
+    with app.app_context():
+        lot = ParkingLot.query.one()
+        assert (lot.Max_Spots, lot.Available_Count, lot.Occupied_Count) == (5000, 5000, 0)
+        assert db.session.query(ParkingSpot.id).filter(ParkingSpot.lot_id == lot.id).count() == 5000
+    # one spot at a time through the session took seconds; the batched insert is well under this
+    assert elapsed < 0.5, f'creating the lot took {elapsed:.3f}s'
+
+
+def test_resize_keeps_existing_spot_ids(app, admin_client):
+    admin_client.post('/admin/add-lot', data=dict(LOT_FORM, Max_Spots='10'))
+    with app.app_context():
+        lot_id = ParkingLot.query.one().id
+    before = spot_ids(app, lot_id)
+
+    admin_client.post(f'/admin/parking_edit/{lot_id}', data=dict(LOT_FORM, Max_Spots='15'))
+    grown = spot_ids(app, lot_id)
+    assert grown[:10] == before and len(grown) == 15
+
+    admin_client.post(f'/admin/parking_edit/{lot_id}', data=dict(LOT_FORM, Max_Spots='8'))
+    assert spot_ids(app, lot_id) == before[:8]
+
+
+def test_blocked_shrink_is_shown_to_the_admin(app, admin_client):
+    admin_client.post('/admin/add-lot', data=dict(LOT_FORM, Max_Spots='3'))
+    with app.app_context():
+        lot_id = ParkingLot.query.one().id
+        ParkingSpot.query.filter_by(lot_id=lot_id).update({'status': 'O'})
+        db.session.commit()
+
+    response = admin_client.post(f'/admin/parking_edit/{lot_id}', data=dict(LOT_FORM, Max_Spots='1'))
+    assert response.status_code == 400
+    assert b'has only 0 free spots, cannot remove 2' in response.data
+    with app.app_context():
+        assert db.session.get(ParkingLot, lot_id).Max_Spots == 3
+
+
+def test_shrink_keeps_a_spot_claimed_after_it_was_picked(app, admin_client):
+    admin_client.post('/admin/add-lot', data=dict(LOT_FORM, Max_Spots='4'))
+    with app.app_context():
+        lot_id = ParkingLot.query.one().id
+    last = spot_ids(app, lot_id)[-1]
+    with app.app_context():
+        # a booking takes the highest spot between resize_lot's select and its delete
+        def claim_after_pick(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT parking_spot.id') and 'ORDER BY parking_spot.id DESC' in statement:
+                conn.connection.cursor().execute('UPDATE parking_spot SET status = ? WHERE id = ?', ('O', last))
+
+        db.event.listen(db.engine, 'after_cursor_execute', claim_after_pick)
+        try:
+            response = admin_client.post(f'/admin/parking_edit/{lot_id}', data=dict(LOT_FORM, Max_Spots='2'))
+        finally:
+            db.event.remove(db.engine, 'after_cursor_execute', claim_after_pick)
+
+    assert response.status_code == 400
+    assert b'has only 1 free spots, cannot remove 2' in response.data
+    with app.app_context():
+        assert db.session.get(ParkingLot, lot_id).Max_Spots == 4
+        assert len(spot_ids(app, lot_id)) == 4
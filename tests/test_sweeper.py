@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from models import db, ParkingLot, ParkingSpot, Reservation
+from sweeper import sweep_expired
+from billing import utcnow
+from bench.seed import seed
+
+
+def test_sweep_frees_only_spots_still_occupied(app):
+    with app.app_context():
+        seed(1, 3, 1, 0)
+        lot = ParkingLot.query.one()
+        spots = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).order_by(ParkingSpot.id)]
+        long_ago = utcnow() - timedelta(minutes=lot.Max_Time + 10)
+        db.session.execute(Reservation.__table__.insert(), [
+            {'spot_id': spot_id, 'user_id': 1, 'in_time': long_ago, 'status': 'active'} for spot_id in spots[:2]
+        ])
+        # the first spot is occupied as it should be, the second was already freed some other way
+        ParkingSpot.query.filter_by(id=spots[0]).update({'status': 'O'})
+        lot.Available_Count, lot.Occupied_Count = 2, 1
+        db.session.commit()
+
+        assert sweep_expired() == 2
+
+        lot = db.session.get(ParkingLot, lot.id)
+        assert (lot.Available_Count, lot.Occupied_Count) == (3, 0)
+        assert ParkingSpot.query.filter_by(status='A').count() == 3
+        assert Reservation.query.filter_by(status='completed').count() == 2
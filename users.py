@@ -0,0 +1,46 @@
+from flask import current_app, g, session
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, User
+from cache import LRUCache
+
+
+def get_user(user_id):
+    """User by id without a query when it was looked up in the last USER_CACHE_TTL seconds.
+
+    The cache holds detached copies; each request gets its own instance through
+    merge(load=False), so the result can be edited and committed like any other.
+    """
+    users = current_app.extensions['users']
+    cached = users.get(user_id)
+    if cached is not None:
+        return db.session.merge(cached, load=False)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        users.set(user_id, _detached_copy(user))
+    return user
+
+
+def current_user():
+    """The logged in user, looked up once per request."""
+    if 'current_user' not in g:
+        g.current_user = get_user(session['user_id']) if session.get('user_id') else None
+    return g.current_user
+
+
+def forget_user(user_id):
+    # other processes keep their copy until it expires
+    current_app.extensions['users'].delete(user_id)
+    g.pop('current_user', None)
+
+
+def _detached_copy(user):
+    copy = User(**{attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def init_users(app):
+    app.extensions['users'] = LRUCache(
+        max_entries=app.config.get('USER_CACHE_SIZE', 10000),
+        ttl=app.config.get('USER_CACHE_TTL', 30)
+    )